@@ -0,0 +1,331 @@
+"""
+Campaigns shared by several run.py clients.
+
+A campaign is a fixed list of job specs (e.g. a covering plan from planner.py)
+stored in SQLite on a volume every client can reach. The jobs are grouped in
+chunks. A client leases one chunk at a time and claims its jobs one by one,
+while a heartbeat thread keeps its leases alive:
+
+- Open chunks are handed out first.
+- A chunk whose lease expired (its client stopped or lost the volume) is taken
+  over; jobs the dead client had claimed but not completed are run again.
+- When nothing is left to lease, a client splits off the second half of the
+  unclaimed jobs of the busiest live chunk, so fast clients help slow ones.
+
+Jobs are claimed with a conditional UPDATE inside a write transaction, so a job
+is handed to exactly one live client. Completions and failures are recorded
+per job, which also makes a campaign resumable.
+
+SQLite locking must work on the shared volume (local disk, SMB, NFSv4 with
+locking); WAL mode is not used because it needs shared memory on one host.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from config import get_path
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    name TEXT PRIMARY KEY,
+    created_at TEXT,
+    total_jobs INTEGER,
+    chunk_size INTEGER
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    campaign TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    PRIMARY KEY (campaign, chunk)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    campaign TEXT NOT NULL,
+    job_index INTEGER NOT NULL,
+    chunk INTEGER NOT NULL,
+    spec TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    client TEXT,
+    prompt_id TEXT,
+    detail TEXT,
+    claimed_at REAL,
+    finished_at REAL,
+    PRIMARY KEY (campaign, job_index)
+);
+CREATE INDEX IF NOT EXISTS jobs_chunk ON jobs(campaign, chunk, status);
+CREATE TABLE IF NOT EXISTS clients (
+    client_id TEXT PRIMARY KEY,
+    host TEXT,
+    campaign TEXT,
+    started_at TEXT,
+    last_seen REAL,
+    jobs_done INTEGER DEFAULT 0
+);
+"""
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+def store_path(path=None):
+    return path or get_path('data', 'campaign.sqlite')
+
+def connect(path=None):
+    path = store_path(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+class transaction:
+    """BEGIN IMMEDIATE ... COMMIT: takes the write lock up front, so claims never interleave."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+def create_campaign(name, specs, chunk_size=20, path=None):
+    """
+    Stores a campaign's job specs, unless a campaign of that name exists already.
+
+    Every client can call this with the same (seeded) plan at start-up; the first
+    one creates the campaign and the others join it.
+
+    Parameters:
+    - name (str): Campaign name.
+    - specs (iterable of dict): JSON-serializable job specs, in order.
+    - chunk_size (int): Jobs per lease.
+    - path (str, optional): Store file, default data/campaign.sqlite.
+
+    Returns:
+    - bool: True if the campaign was created, False if it already existed.
+    """
+    db = connect(path)
+    try:
+        if db.execute("SELECT 1 FROM campaigns WHERE name = ?", (name,)).fetchone():
+            return False
+        # Built before taking the write lock: planning can take a while
+        rows = [(name, index, index // chunk_size, json.dumps(spec)) for index, spec in enumerate(specs)]
+        with transaction(db):
+            if db.execute("SELECT 1 FROM campaigns WHERE name = ?", (name,)).fetchone():
+                return False
+            db.executemany("INSERT INTO jobs (campaign, job_index, chunk, spec) VALUES (?, ?, ?, ?)", rows)
+            chunk_count = (len(rows) + chunk_size - 1) // chunk_size
+            db.executemany("INSERT INTO chunks (campaign, chunk) VALUES (?, ?)", [(name, c) for c in range(chunk_count)])
+            db.execute("INSERT INTO campaigns (name, created_at, total_jobs, chunk_size) VALUES (?, ?, ?, ?)",
+                       (name, datetime.now().isoformat(), len(rows), chunk_size))
+        logger.info(f"campaign.create_campaign: Created '{name}' with {len(rows)} jobs in {chunk_count} chunks")
+        return True
+    finally:
+        db.close()
+
+class CampaignClient:
+    """
+    One client's view of a shared campaign.
+
+    Parameters:
+    - campaign (str): Campaign name (create it with create_campaign first).
+    - path (str, optional): Store file.
+    - client_id (str, optional): Defaults to <hostname>-<random>.
+    - lease_seconds (float): How long a lease lasts without a heartbeat.
+    - poll_interval (float): Seconds between looks for work while peers finish theirs.
+    """
+
+    def __init__(self, campaign, path=None, client_id=None, lease_seconds=300, poll_interval=10):
+        self.campaign = campaign
+        self.db = connect(path)
+        self.client_id = client_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.chunk = None
+        self._lock = threading.Lock()  # one connection, shared with the heartbeat thread
+        self._stop = threading.Event()
+        if not self.db.execute("SELECT 1 FROM campaigns WHERE name = ?", (campaign,)).fetchone():
+            raise ValueError(f"Unknown campaign '{campaign}'")
+        with self._lock, transaction(self.db):
+            self.db.execute("INSERT OR REPLACE INTO clients (client_id, host, campaign, started_at, last_seen) VALUES (?, ?, ?, ?, ?)",
+                            (self.client_id, socket.gethostname(), campaign, datetime.now().isoformat(), time.time()))
+        self._heartbeat = threading.Thread(target=self._beat, name='campaign-heartbeat', daemon=True)
+        self._heartbeat.start()
+        logger.info(f"campaign.CampaignClient: {self.client_id} joined campaign '{campaign}'")
+
+    def close(self):
+        """Stops the heartbeat and releases the current chunk for others."""
+        self._stop.set()
+        with self._lock, transaction(self.db):
+            self.db.execute("UPDATE jobs SET status = ?, client = NULL WHERE campaign = ? AND client = ? AND status = ?",
+                            (PENDING, self.campaign, self.client_id, RUNNING))
+            self.db.execute("UPDATE chunks SET owner = NULL, lease_until = NULL WHERE campaign = ? AND owner = ?",
+                            (self.campaign, self.client_id))
+        self.db.close()
+
+    def _beat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                with self._lock, transaction(self.db):
+                    now = time.time()
+                    self.db.execute("UPDATE clients SET last_seen = ? WHERE client_id = ?", (now, self.client_id))
+                    self.db.execute("UPDATE chunks SET lease_until = ? WHERE campaign = ? AND owner = ?",
+                                    (now + self.lease_seconds, self.campaign, self.client_id))
+            except sqlite3.Error as e:
+                logger.warning(f"campaign.CampaignClient: Heartbeat failed: {e}")
+
+    # --- leasing ----------------------------------------------------------------------------------
+
+    def _lease(self, db, now):
+        """Leases an open or expired chunk. Returns the chunk number or None."""
+        row = db.execute(
+            "SELECT c.chunk, c.owner FROM chunks c WHERE c.campaign = ? AND (c.owner IS NULL OR c.lease_until < ?) "
+            "AND EXISTS (SELECT 1 FROM jobs j WHERE j.campaign = c.campaign AND j.chunk = c.chunk AND j.status IN (?, ?)) "
+            "ORDER BY c.owner IS NOT NULL, c.chunk LIMIT 1",
+            (self.campaign, now, PENDING, RUNNING)).fetchone()
+        if row is None:
+            return None
+        if row['owner']:
+            # The previous owner stopped heartbeating: jobs it claimed but never finished are run again
+            reclaimed = db.execute("UPDATE jobs SET status = ?, client = NULL WHERE campaign = ? AND chunk = ? AND status = ?",
+                                   (PENDING, self.campaign, row['chunk'], RUNNING)).rowcount
+            logger.info(f"campaign: {self.client_id} took over chunk {row['chunk']} from stalled {row['owner']} "
+                        f"({reclaimed} unfinished jobs reset)")
+        db.execute("UPDATE chunks SET owner = ?, lease_until = ? WHERE campaign = ? AND chunk = ?",
+                   (self.client_id, now + self.lease_seconds, self.campaign, row['chunk']))
+        return row['chunk']
+
+    def _steal(self, db, now):
+        """Splits off the upper half of the unclaimed jobs of the busiest live chunk. Returns the new chunk or None."""
+        row = db.execute(
+            "SELECT j.chunk, COUNT(*) AS pending FROM jobs j JOIN chunks c ON c.campaign = j.campaign AND c.chunk = j.chunk "
+            "WHERE j.campaign = ? AND j.status = ? AND c.owner IS NOT NULL AND c.owner != ? AND c.lease_until >= ? "
+            "GROUP BY j.chunk ORDER BY pending DESC LIMIT 1",
+            (self.campaign, PENDING, self.client_id, now)).fetchone()
+        if row is None or row['pending'] < 2:
+            return None
+        victim, count = row['chunk'], row['pending']
+        new_chunk = db.execute("SELECT MAX(chunk) + 1 FROM chunks WHERE campaign = ?", (self.campaign,)).fetchone()[0]
+        stolen = db.execute(
+            "UPDATE jobs SET chunk = ? WHERE campaign = ? AND status = ? AND job_index IN ("
+            "SELECT job_index FROM jobs WHERE campaign = ? AND chunk = ? AND status = ? ORDER BY job_index DESC LIMIT ?)",
+            (new_chunk, self.campaign, PENDING, self.campaign, victim, PENDING, count // 2)).rowcount
+        db.execute("INSERT INTO chunks (campaign, chunk, owner, lease_until) VALUES (?, ?, ?, ?)",
+                   (self.campaign, new_chunk, self.client_id, now + self.lease_seconds))
+        logger.info(f"campaign: {self.client_id} stole {stolen} jobs from chunk {victim} as chunk {new_chunk}")
+        return new_chunk
+
+    def _claim(self):
+        """Claims the next job of this client's chunk, leasing or stealing a chunk when needed."""
+        with self._lock, transaction(self.db) as db:
+            now = time.time()
+            # at most: release a finished chunk, lease (or steal) another, claim from it
+            for _ in range(3):
+                if self.chunk is not None:
+                    row = db.execute("SELECT job_index, spec FROM jobs WHERE campaign = ? AND chunk = ? AND status = ? "
+                                     "ORDER BY job_index LIMIT 1", (self.campaign, self.chunk, PENDING)).fetchone()
+                    if row is not None:
+                        db.execute("UPDATE jobs SET status = ?, client = ?, claimed_at = ? WHERE campaign = ? AND job_index = ?",
+                                   (RUNNING, self.client_id, now, self.campaign, row['job_index']))
+                        return row['job_index'], json.loads(row['spec'])
+                    db.execute("UPDATE chunks SET owner = NULL, lease_until = NULL WHERE campaign = ? AND chunk = ? AND owner = ?",
+                               (self.campaign, self.chunk, self.client_id))
+                    self.chunk = None
+                self.chunk = self._lease(db, now)
+                if self.chunk is None:
+                    self.chunk = self._steal(db, now)
+                if self.chunk is None:
+                    return None
+            return None
+
+    def remaining(self):
+        """Jobs not yet done or failed, in the whole campaign."""
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM jobs WHERE campaign = ? AND status IN (?, ?)",
+                                   (self.campaign, PENDING, RUNNING)).fetchone()[0]
+
+    def jobs(self):
+        """
+        Yields (job_index, spec) until the campaign is finished. While peers still hold
+        work that cannot be taken yet, it waits and looks again.
+        """
+        while True:
+            job = self._claim()
+            if job is not None:
+                yield job
+                continue
+            remaining = self.remaining()
+            if remaining == 0:
+                logger.info(f"campaign: Campaign '{self.campaign}' is complete")
+                return
+            logger.info(f"campaign: No work to claim, {remaining} jobs still held by other clients")
+            time.sleep(self.poll_interval)
+
+    # --- reporting --------------------------------------------------------------------------------
+
+    def complete(self, job_index, prompt_id=None):
+        """Marks a job as done (queued on the backend)."""
+        self._finish(job_index, DONE, prompt_id=prompt_id)
+
+    def fail(self, job_index, detail=None):
+        """Marks a job as failed; it is not retried by other clients."""
+        self._finish(job_index, FAILED, detail=detail)
+
+    def _finish(self, job_index, status, prompt_id=None, detail=None):
+        with self._lock, transaction(self.db):
+            self.db.execute("UPDATE jobs SET status = ?, prompt_id = ?, detail = ?, finished_at = ?, client = ? "
+                            "WHERE campaign = ? AND job_index = ?",
+                            (status, prompt_id, detail, time.time(), self.client_id, self.campaign, job_index))
+            if status == DONE:
+                self.db.execute("UPDATE clients SET jobs_done = jobs_done + 1, last_seen = ? WHERE client_id = ?",
+                                (time.time(), self.client_id))
+
+def campaign_status(name, path=None):
+    """
+    Returns:
+    - dict: Job counts by status, and per client: jobs done and seconds since the last heartbeat.
+    """
+    db = connect(path)
+    try:
+        counts = {row['status']: row['n'] for row in db.execute(
+            "SELECT status, COUNT(*) AS n FROM jobs WHERE campaign = ? GROUP BY status", (name,))}
+        now = time.time()
+        clients = {row['client_id']: {'jobs_done': row['jobs_done'], 'last_seen_s': round(now - row['last_seen'])}
+                   for row in db.execute("SELECT * FROM clients WHERE campaign = ? ORDER BY jobs_done DESC", (name,))}
+        return {'jobs': counts, 'clients': clients}
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or inspect a shared campaign")
+    parser.add_argument('command', choices=['create', 'status'])
+    parser.add_argument('config', nargs='?', default='randomizer_controlnet', help="Workflow config name")
+    args = parser.parse_args()
+
+    from utils.config_loader import ConfigLoader
+    cfg = ConfigLoader().get_run_config(args.config)
+    name = cfg.campaign.name or cfg.name
+    store = cfg.campaign.store or None
+    if args.command == 'status':
+        print(json.dumps(campaign_status(name, store), indent=4))
+        return
+
+    from load_models import load_checkpoint_pool
+    from planner import plan_specs
+    created = create_campaign(name, plan_specs(cfg, load_checkpoint_pool(cfg.checkpoint_pool)),
+                              chunk_size=cfg.campaign.chunk_size, path=store)
+    print(f"Campaign '{name}' {'created' if created else 'already exists'} in {store_path(store)}")
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
@@ -0,0 +1,309 @@
+"""
+Captions a folder of reference images with the img2txt workflow and adds them to objects.csv.
+
+Each image is uploaded (once per backend, see InputManager), queued as a
+LoadImage -> Florence2Run -> "Show Any" graph, and its caption is read back from
+/history: the show node reports the text in its ui output. Up to batch_size jobs
+are in flight at a time, and Florence2 stays loaded between them.
+
+Captions are cached in cache/captions.jsonl by image content hash and task, so
+a rerun only queues new or changed images. New captions are appended to
+objects.csv as rows of the given type, with the image as their input_file; the
+image is copied into input/ when it lives elsewhere.
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from comfy_api import get_json, get_server, post_json
+from config import PATHS, get_path
+from input_manager import InputManager
+from load_models import queue_workflow
+from node_manipulation import get_node_ID, set_node_value
+from workflow_compiler import load_workflow
+from utils.catalog import read_csv_rows
+from utils.file_hash import hash_file
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+CAPTION_WORKFLOW = 'img2txt.json'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+DEFAULT_TASK = 'more_detailed_caption'
+DEFAULT_NEGATIVE = 'watermark, low quality'
+
+class CaptionCache:
+    """
+    Append-only record of finished captions, keyed by (image sha256, Florence2 task).
+
+    Parameters:
+    - path (str): JSONL file, cache/captions.jsonl by default.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_path('cache', 'captions.jsonl')
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by an interrupted run
+                    self.entries[(entry['sha256'], entry['task'])] = entry
+        except FileNotFoundError:
+            pass
+
+    def get(self, sha, task):
+        return self.entries.get((sha, task))
+
+    def add(self, entry):
+        self.entries[(entry['sha256'], entry['task'])] = entry
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+def find_images(directory, recursive=False):
+    """Image files in a directory, sorted by path."""
+    if recursive:
+        paths = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+    else:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+    return sorted(path for path in paths if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+
+def clean_caption(text):
+    """Joins the text outputs of a node and collapses whitespace; CSV rows stay on one line."""
+    if isinstance(text, (list, tuple)):
+        text = ' '.join(clean_caption(part) for part in text)
+    return ' '.join(str(text).split())
+
+def caption_from_history(entry, show_node):
+    """
+    Extracts the caption from a /history entry.
+
+    Returns:
+    - str or None: The text of the show node (or the first node that reports text), None if there is none.
+    """
+    outputs = entry.get('outputs', {})
+    node_ids = [show_node] + [node_id for node_id in outputs if node_id != show_node]
+    for node_id in node_ids:
+        text = outputs.get(node_id, {}).get('text')
+        if text:
+            return clean_caption(text)
+    return None
+
+def wait_for_prompt(prompt_id, server=None, poll_interval=2, timeout=600):
+    """
+    Polls /history/<prompt_id> until the job is finished.
+
+    Returns:
+    - dict or None: The history entry, None if it did not finish within timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            history = get_json(f'/history/{prompt_id}', server=server)
+        except Exception as e:
+            logger.warning(f"captioner.wait_for_prompt: Could not read history for {prompt_id}: {e}")
+            history = {}
+        entry = history.get(prompt_id)
+        if entry and (entry.get('status', {}).get('completed') or entry.get('status', {}).get('status_str') == 'error'
+                      or entry.get('outputs')):
+            return entry
+        time.sleep(poll_interval)
+    return None
+
+def build_caption_workflow(workflow_file=CAPTION_WORKFLOW, server=None, task=DEFAULT_TASK, keep_model_loaded=True):
+    """
+    Loads the captioning graph and checks it has the nodes the pipeline sets and reads.
+
+    Returns:
+    - tuple: (workflow, show node id)
+    """
+    workflow = load_workflow(workflow_file, server=server)
+    for title in ("Load Image", "Florence2Run", "Show Any"):
+        if get_node_ID(workflow, title) is None:
+            raise ValueError(f"{workflow_file} has no node titled '{title}'")
+    set_node_value(workflow, "Florence2Run", "task", task)
+    # reloading Florence2 for every image would dominate a batch
+    set_node_value(workflow, "Florence2Run", "keep_model_loaded", keep_model_loaded)
+    return workflow, get_node_ID(workflow, "Show Any")
+
+def caption_images(paths, server=None, task=DEFAULT_TASK, batch_size=8, workflow_file=CAPTION_WORKFLOW,
+                   cache=None, poll_interval=2, timeout=600):
+    """
+    Captions images on the backend, skipping those already in the cache.
+
+    Parameters:
+    - paths (list of str): Local image paths.
+    - server (str, optional): host:port of the backend.
+    - task (str): Florence2 task, e.g. caption, detailed_caption, more_detailed_caption.
+    - batch_size (int): Jobs kept in flight on the backend.
+    - workflow_file (str): Captioning workflow in workflow/.
+    - cache (CaptionCache, optional): Defaults to cache/captions.jsonl.
+    - poll_interval (float): Seconds between /history polls.
+    - timeout (float): Seconds to wait for one job before giving up on it.
+
+    Returns:
+    - list of dict: One cache entry (sha256, task, image, caption, ...) per captioned image, in input order.
+    """
+    server = get_server(server)
+    cache = cache or CaptionCache()
+    input_manager = InputManager()
+    workflow, show_node = build_caption_workflow(workflow_file, server, task)
+
+    results = {}
+    todo = []
+    for path in paths:
+        sha = input_manager.get_hash(path)
+        cached = cache.get(sha, task)
+        if cached:
+            results[path] = dict(cached, image=os.path.abspath(path))
+        else:
+            todo.append((path, sha))
+    logger.info(f"captioner.caption_images: {len(paths)} images, {len(results)} cached, {len(todo)} to caption")
+
+    in_flight = []
+    collected = []
+    failed = 0
+    position = 0
+    while position < len(todo) or in_flight:
+        # keep the backend fed with up to batch_size jobs
+        while position < len(todo) and len(in_flight) < batch_size:
+            path, sha = todo[position]
+            position += 1
+            set_node_value(workflow, "Load Image", "image", input_manager.ensure_uploaded(path, server=server))
+            response = queue_workflow(workflow, server=server)
+            if not response or not response.get('prompt_id'):
+                logger.warning(f"captioner.caption_images: {os.path.basename(path)} was not queued or cannot be tracked")
+                failed += 1
+                continue
+            in_flight.append((path, sha, response['prompt_id'], time.monotonic()))
+
+        if not in_flight:
+            continue
+        # jobs finish in queue order, so wait for the oldest one
+        path, sha, prompt_id, queued_at = in_flight.pop(0)
+        entry = wait_for_prompt(prompt_id, server, poll_interval, max(timeout - (time.monotonic() - queued_at), poll_interval))
+        caption = caption_from_history(entry, show_node) if entry else None
+        if entry:
+            collected.append(prompt_id)
+        if not caption:
+            status = entry.get('status', {}).get('status_str') if entry else 'timed out'
+            logger.warning(f"captioner.caption_images: No caption for {os.path.basename(path)} ({status})")
+            failed += 1
+            continue
+
+        result = {'sha256': sha, 'task': task, 'image': os.path.abspath(path), 'caption': caption,
+                  'prompt_id': prompt_id, 'time': datetime.now().isoformat(timespec='seconds')}
+        cache.add(result)
+        results[path] = result
+        logger.info(f"captioner.caption_images: {os.path.basename(path)}: {caption[:80]}")
+
+    if collected:
+        # the captions are in the cache now, so the backend does not need to keep the entries
+        try:
+            post_json('/history', {'delete': collected}, server=server)
+        except OSError as e:
+            logger.warning(f"captioner.caption_images: Could not prune history: {e}")
+    logger.info(f"captioner.caption_images: {len(results)} captioned, {failed} failed")
+    return [results[path] for path in paths if path in results]
+
+def attach_input_file(path, sha, input_dir=None):
+    """
+    Returns the input_file name of an image, copying it into input/ when it lives elsewhere.
+
+    A different file that already has the name in input/ is left alone; the copy gets the
+    hash in its name instead.
+    """
+    input_dir = input_dir or PATHS['input']
+    path = os.path.abspath(path)
+    relative = os.path.relpath(path, input_dir)
+    if not relative.startswith('..'):
+        return relative.replace(os.sep, '/')
+
+    name = os.path.basename(path)
+    target = os.path.join(input_dir, name)
+    if os.path.exists(target):
+        if hash_file(target) == sha:
+            return name
+        name = InputManager.remote_name(path, sha)
+        target = os.path.join(input_dir, name)
+    os.makedirs(input_dir, exist_ok=True)
+    shutil.copy2(path, target)
+    logger.info(f"captioner.attach_input_file: Copied {path} to {target}")
+    return name
+
+def append_objects(captions, object_type, negative_prompt=DEFAULT_NEGATIVE, objects_path=None):
+    """
+    Appends captions to objects.csv, one row per image with the image as its input_file.
+
+    Images that already have a row (same input_file) are skipped, so reruns do not add duplicates.
+
+    Returns:
+    - int: The number of rows added.
+    """
+    objects_path = objects_path or get_path('res', 'objects.csv')
+    fieldnames, rows = read_csv_rows(objects_path)
+    existing = {name.strip() for row in rows for name in (row.get('input_file') or '').split(',') if name.strip()}
+    serial_numbers = [int(row['serial_no']) for row in rows if (row.get('serial_no') or '').isdigit()]
+    next_serial = max(serial_numbers, default=0) + 1
+
+    new_rows = []
+    for entry in captions:
+        input_file = attach_input_file(entry['image'], entry['sha256'])
+        if input_file in existing:
+            continue
+        existing.add(input_file)
+        row = {name: '' for name in fieldnames}
+        row.update({'type': object_type, 'positive_prompt': entry['caption'], 'serial_no': str(next_serial),
+                    'negative_prompt': negative_prompt, 'input_file': input_file})
+        new_rows.append(row)
+        next_serial += 1
+    if not new_rows:
+        return 0
+
+    with open(objects_path, 'rb') as f:
+        content = f.read()
+    with open(objects_path, 'a', newline='', encoding='utf-8') as f:
+        if content and not content.endswith((b'\n', b'\r')):
+            f.write('\r\n')
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writerows(new_rows)
+    logger.info(f"captioner.append_objects: Added {len(new_rows)} rows of type '{object_type}' to {objects_path}")
+    return len(new_rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Caption a folder of images and add them to objects.csv")
+    parser.add_argument('directory', help="Folder of reference images")
+    parser.add_argument('--type', default='captioned', help="objects.csv type of the new rows (default: captioned)")
+    parser.add_argument('--task', default=DEFAULT_TASK, help=f"Florence2 task (default: {DEFAULT_TASK})")
+    parser.add_argument('--negative', default=DEFAULT_NEGATIVE, help="negative_prompt of the new rows")
+    parser.add_argument('--batch', type=int, default=8, help="Jobs kept in flight on the backend")
+    parser.add_argument('--server', default=None, help="host:port of the backend")
+    parser.add_argument('--workflow', default=CAPTION_WORKFLOW, help="Captioning workflow in workflow/")
+    parser.add_argument('--recursive', action='store_true', help="Include subfolders")
+    parser.add_argument('--no-csv', action='store_true', help="Only caption and print, do not touch objects.csv")
+    args = parser.parse_args()
+
+    paths = find_images(args.directory, args.recursive)
+    if not paths:
+        logger.info(f"captioner.main: No images in {args.directory}")
+        return 0
+    captions = caption_images(paths, server=args.server, task=args.task, batch_size=max(args.batch, 1),
+                              workflow_file=args.workflow)
+    if args.no_csv:
+        for entry in captions:
+            print(f"{entry['image']}\t{entry['caption']}")
+    else:
+        append_objects(captions, args.type, args.negative)
+    return 0 if len(captions) == len(paths) else 1
+
+if __name__ == "__main__":
+    configure_logging()
+    sys.exit(main())
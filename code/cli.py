@@ -0,0 +1,129 @@
+"""
+Single entry point: `comfyui-automation <command>`.
+
+Only argparse is imported up front. Each command imports the modules it needs
+when it runs, so `--help`, shell completion and short cron jobs do not pay for
+PIL, NumPy or the workflow machinery.
+
+Commands that already have their own argument parser (caption, verify, plan) get the
+remaining arguments passed through unchanged.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+
+def delegate(module_name, prog, argv):
+    """Runs module_name.main() as if it had been started as `prog argv...`."""
+    module = importlib.import_module(module_name)
+    saved_argv = sys.argv
+    sys.argv = [prog] + list(argv)
+    try:
+        return module.main()
+    finally:
+        sys.argv = saved_argv
+
+def cmd_run(args):
+    import run
+    run.main(args.config)
+
+def cmd_upscale(args):
+    from dedup_index import DEFAULT_MAX_DISTANCE
+    from upscale import upscale_images
+    max_distance = DEFAULT_MAX_DISTANCE if args.max_distance is None else args.max_distance
+    upscale_images(new_width=args.width, new_height=args.height, adaptive_sleep=args.adaptive_sleep,
+                   quality_gate=not args.no_quality_gate, dedup=not args.no_dedup, max_distance=max_distance,
+                   hygiene=not args.no_hygiene, weight=args.weight)
+
+def cmd_tweak(args):
+    from dedup_index import DEFAULT_MAX_DISTANCE
+    from tweak import process_directory
+    max_distance = DEFAULT_MAX_DISTANCE if args.max_distance is None else args.max_distance
+    process_directory(dedup=not args.no_dedup, max_distance=max_distance)
+
+def cmd_caption(args):
+    delegate('captioner', 'comfyui-automation caption', args.rest)
+
+def cmd_verify(args):
+    delegate('utils.verify_models', 'comfyui-automation verify', args.rest)
+
+def cmd_plan(args):
+    delegate('planner', 'comfyui-automation plan', args.rest)
+
+def cmd_bench(args):
+    from sim_server import SimSettings, bench
+    settings = SimSettings(exec_time=args.exec_time, jitter=0.0, reject_rate=args.reject_rate, error_rate=args.error_rate)
+    print(json.dumps(bench(args.jobs, args.threads, workflow_file=args.workflow, settings=settings, validate=args.validate), indent=4))
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='comfyui-automation', description="ComfyUI automation tools")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help="Generate images with the randomizer loop")
+    run_parser.add_argument('--config', default='randomizer_controlnet', help="Config in config/workflows/")
+    run_parser.set_defaults(func=cmd_run)
+
+    upscale_parser = subparsers.add_parser('upscale', help="Upscale the images in to_upscale/")
+    upscale_parser.add_argument('--width', type=int, default=None, help="Target width (default: 4K for 16:9 images)")
+    upscale_parser.add_argument('--height', type=int, default=None, help="Target height")
+    upscale_parser.add_argument('--adaptive-sleep', action='store_true', help="Pause by the cost model's estimate")
+    upscale_parser.add_argument('--no-quality-gate', action='store_true', help="Upscale images that fail the quality gate too")
+    upscale_parser.add_argument('--no-dedup', action='store_true', help="Do not skip near-duplicates")
+    upscale_parser.add_argument('--max-distance', type=int, default=None,
+                                help="Near-duplicate hash distance (default: dedup_index.DEFAULT_MAX_DISTANCE)")
+    upscale_parser.add_argument('--no-hygiene', action='store_true', help="No /free, history pruning or VRAM throttling")
+    upscale_parser.add_argument('--weight', type=float, default=1.0, help="Backend share against other normal-priority campaigns")
+    upscale_parser.set_defaults(func=cmd_upscale)
+
+    tweak_parser = subparsers.add_parser('tweak', help="Queue LoRA-weight variations of the images in to_tweak/")
+    tweak_parser.add_argument('--no-dedup', action='store_true', help="Do not skip near-duplicates")
+    tweak_parser.add_argument('--max-distance', type=int, default=None,
+                              help="Near-duplicate hash distance (default: dedup_index.DEFAULT_MAX_DISTANCE)")
+    tweak_parser.set_defaults(func=cmd_tweak)
+
+    caption_parser = subparsers.add_parser('caption', help="Caption a folder of reference images into objects.csv (see caption --help)",
+                                           add_help=False)
+    caption_parser.set_defaults(func=cmd_caption, passthrough=True)
+
+    verify_parser = subparsers.add_parser('verify', help="Verify models.csv against the model folders (see verify --help)",
+                                          add_help=False)
+    verify_parser.set_defaults(func=cmd_verify, passthrough=True)
+
+    plan_parser = subparsers.add_parser('plan', help="Show a covering plan of checkpoint/style/LoRA jobs (see plan --help)",
+                                        add_help=False)
+    plan_parser.set_defaults(func=cmd_plan, passthrough=True)
+
+    bench_parser = subparsers.add_parser('bench', help="Measure client throughput against the simulated backend")
+    bench_parser.add_argument('--jobs', type=int, default=1000)
+    bench_parser.add_argument('--threads', type=int, default=8)
+    bench_parser.add_argument('--workflow', default='Randomizer.json', help="Workflow file in workflow/")
+    bench_parser.add_argument('--exec-time', type=float, default=0.0, help="Simulated seconds per image")
+    bench_parser.add_argument('--reject-rate', type=float, default=0.0)
+    bench_parser.add_argument('--error-rate', type=float, default=0.0)
+    bench_parser.add_argument('--validate', action='store_true', help="Validate graphs before queuing")
+    bench_parser.set_defaults(func=cmd_bench)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if rest and not getattr(args, 'passthrough', False):
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    args.rest = rest
+    from config import PATHS
+    if not os.path.isdir(PATHS['workflow']):
+        parser.error(f"no workflow/ folder in {os.path.dirname(PATHS['workflow'])}: run from a checkout "
+                     f"installed with 'pip install -e .'")
+    from utils.logger_config import configure_logging
+    configure_logging()
+    try:
+        args.func(args)
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
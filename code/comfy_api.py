@@ -0,0 +1,146 @@
+import json
+import mimetypes
+import os
+import uuid
+from urllib import request, parse
+from config import SERVER_ADDRESS, get_path
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+def get_server(server=None):
+    """Return the backend address to talk to, falling back to the configured default."""
+    return server or SERVER_ADDRESS
+
+def api_url(path, server=None, query=None):
+    """Build a full http URL for a ComfyUI endpoint."""
+    url = f"http://{get_server(server)}{path}"
+    if query:
+        url = f"{url}?{parse.urlencode(query)}"
+    return url
+
+def get_json(path, server=None, query=None, timeout=30):
+    """
+    Sends a GET request to a ComfyUI endpoint and decodes the JSON response.
+
+    Parameters:
+    - path (str): The endpoint path, e.g. "/queue".
+    - server (str, optional): host:port of the backend. Defaults to config.SERVER_ADDRESS.
+    - query (dict, optional): Query string parameters.
+    - timeout (int): Socket timeout in seconds.
+
+    Returns:
+    - dict: The decoded JSON response.
+    """
+    with request.urlopen(api_url(path, server, query), timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def post_json(path, payload, server=None, timeout=30):
+    """
+    Sends a JSON body to a ComfyUI endpoint.
+
+    Returns:
+    - dict or None: The decoded JSON response, or None if the server returned an empty body.
+    """
+    data = json.dumps(payload).encode('utf-8')
+    req = request.Request(api_url(path, server), data=data, headers={'Content-Type': 'application/json'})
+    with request.urlopen(req, timeout=timeout) as response:
+        body = response.read().decode('utf-8')
+        return json.loads(body) if body.strip() else None
+
+def encode_multipart(fields, files):
+    """
+    Encodes form fields and files as multipart/form-data.
+
+    Parameters:
+    - fields (dict): Plain form fields.
+    - files (dict): Mapping of field name to (filename, bytes).
+
+    Returns:
+    - tuple: (body bytes, content type header value)
+    """
+    boundary = uuid.uuid4().hex
+    lines = []
+    for name, value in fields.items():
+        lines.append(f'--{boundary}\r\n'.encode())
+        lines.append(f'Content-Disposition: form-data; name="{name}"\r\n\r\n'.encode())
+        lines.append(f'{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        lines.append(f'--{boundary}\r\n'.encode())
+        lines.append(f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode())
+        lines.append(f'Content-Type: {content_type}\r\n\r\n'.encode())
+        lines.append(content)
+        lines.append(b'\r\n')
+    lines.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(lines), f'multipart/form-data; boundary={boundary}'
+
+def upload_image(image_path, server=None, remote_name=None, subfolder='', overwrite=True, timeout=120):
+    """
+    Uploads a local image into the backend's input folder through /upload/image.
+
+    Parameters:
+    - image_path (str): Path of the local file.
+    - server (str, optional): host:port of the backend.
+    - remote_name (str, optional): File name to store it under. Defaults to the local file name.
+    - subfolder (str): Subfolder of the input directory.
+    - overwrite (bool): Replace an existing file with the same name.
+
+    Returns:
+    - str: The name to use as the "image" input of a LoadImage node.
+    """
+    remote_name = remote_name or os.path.basename(image_path)
+    with open(image_path, 'rb') as f:
+        content = f.read()
+
+    fields = {'type': 'input', 'overwrite': 'true' if overwrite else 'false'}
+    if subfolder:
+        fields['subfolder'] = subfolder
+    body, content_type = encode_multipart(fields, {'image': (remote_name, content)})
+
+    req = request.Request(api_url('/upload/image', server), data=body, headers={'Content-Type': content_type})
+    with request.urlopen(req, timeout=timeout) as response:
+        result = json.loads(response.read().decode('utf-8'))
+
+    name = result.get('name', remote_name)
+    if result.get('subfolder'):
+        name = f"{result['subfolder']}/{name}"
+    logger.info(f"comfy_api.upload_image: Uploaded {image_path} to {get_server(server)} as {name}")
+    return name
+
+_object_info = {}
+
+def object_info_path(server=None):
+    """Local cache file for a backend's /object_info."""
+    safe_name = get_server(server).replace(':', '_').replace('/', '_')
+    return get_path('cache', f'object_info_{safe_name}.json')
+
+def get_object_info(server=None, refresh=False):
+    """
+    Returns the node definitions of a backend (the /object_info payload).
+
+    The payload is fetched once and cached on disk, since it only changes when
+    custom nodes or models are installed. Pass refresh=True to fetch it again.
+
+    Returns:
+    - dict: Node class name -> definition (input, input_order, output, output_node, ...).
+    """
+    server = get_server(server)
+    if not refresh and server in _object_info:
+        return _object_info[server]
+
+    path = object_info_path(server)
+    if not refresh and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            _object_info[server] = json.load(f)
+        return _object_info[server]
+
+    info = get_json('/object_info', server=server, timeout=120)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    os.replace(tmp_path, path)
+    logger.info(f"comfy_api.get_object_info: Cached {len(info)} node definitions from {server}")
+    _object_info[server] = info
+    return info
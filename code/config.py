@@ -7,8 +7,15 @@ BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # Go up one level from co
 PATHS = {
     'workflow': os.path.join(BASE_DIR, 'workflow'),
     'res': os.path.join(BASE_DIR, 'res'),
+    'input': os.path.join(BASE_DIR, 'input'),
+    'cache': os.path.join(BASE_DIR, 'cache'),
+    'config': os.path.join(BASE_DIR, 'config'),
+    'data': os.path.join(BASE_DIR, 'data'),
 }
 
+# Default ComfyUI backend (host:port), can be overridden with COMFYUI_SERVER
+SERVER_ADDRESS = os.environ.get('COMFYUI_SERVER', '127.0.0.1:8188')
+
 def get_path(category, filename):
     """Get full path for a file in a category directory"""
-    return os.path.join(PATHS[category], filename) 
\ No newline at end of file
+    return os.path.join(PATHS[category], filename)
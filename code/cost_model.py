@@ -0,0 +1,285 @@
+"""
+Predicts how long a job takes to execute on the backend.
+
+Execution times are taken from ComfyUI's /history (execution_start ->
+execution_success timestamps), together with the graph that was run, so any
+job queued by run.py, upscale.py or tweak.py becomes a sample. A linear model
+is fitted on features that drive the cost of a diffusion job:
+
+- sampling work: steps x megapixels x batch size, with an extra term for SDXL
+- upscale pass work: upscale steps x upscaled megapixels x batch size (+ SDXL term)
+- number of active LoRAs
+- ControlNet work: sampling work x number of active ControlNets
+
+Until MIN_SAMPLES samples exist, DEFAULT_COEFFICIENTS are used. They reproduce
+the old hand-tuned sleeps (about 30 s for a 512x512 SD 1.5 job, 80 s with upscale).
+
+    python code/cost_model.py --collect --fit
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime
+from comfy_api import get_json
+from config import get_path
+from graph_optimizer import is_link
+from utils.catalog import load_table
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+FEATURES = ['intercept', 'sampling', 'sampling_sdxl', 'upscale', 'upscale_sdxl', 'loras', 'controlnet']
+DEFAULT_COEFFICIENTS = [3.0, 3.4, 3.4, 4.5, 4.5, 0.5, 1.0]
+MIN_SAMPLES = 20
+RIDGE = 1e-3
+
+def samples_path():
+    return get_path('data', 'job_times.jsonl')
+
+def model_path():
+    return get_path('cache', 'cost_model.json')
+
+def _title_index(workflow):
+    return {node.get('_meta', {}).get('title'): node_id for node_id, node in workflow.items()}
+
+def checkpoint_base(ckpt_name):
+    """Base architecture of a checkpoint from models.csv, '' if unknown."""
+    row = load_table('models').find_row('Name', ckpt_name, Type='Checkpoint')
+    return row['Base'] if row else ''
+
+def spec_from_workflow(workflow):
+    """
+    Extracts a job spec from an API-format graph built from the Randomizer templates.
+
+    Returns:
+    - dict: steps, width, height, batch_size, upscale, upscale_ratio, upscale_steps,
+            loras, controlnets, base.
+    """
+    titles = _title_index(workflow)
+
+    def inputs(title):
+        node_id = titles.get(title)
+        return workflow[node_id]['inputs'] if node_id in workflow else {}
+
+    latent = inputs('Empty Latent Image')
+    width, height = latent.get('width', 512), latent.get('height', 512)
+    up_res = inputs('Up_res')
+    save_source = inputs('Save Image').get('images')
+    upscale = is_link(save_source) and save_source[0] == titles.get('VAE Decode_scaled')
+
+    consumed = {value[0] for node in workflow.values() for value in node['inputs'].values() if is_link(value)}
+    loras = sum(1 for node_id, node in workflow.items()
+                if node.get('class_type') == 'LoraLoader' and node_id in consumed
+                and (node['inputs'].get('strength_model') or node['inputs'].get('strength_clip')))
+
+    controlnets = 0
+    for node_id, node in workflow.items():
+        if node.get('class_type') == 'CR Multi-ControlNet Stack' and node_id in consumed:
+            controlnets += sum(1 for slot in (1, 2, 3) if node['inputs'].get(f'switch_{slot}') == 'On')
+
+    ckpt_name = next((node['inputs'].get('ckpt_name') for node in workflow.values()
+                      if node.get('class_type') == 'CheckpointLoaderSimple'), '')
+    return {
+        'steps': inputs('KSampler').get('steps', 30),
+        'width': width,
+        'height': height,
+        'batch_size': latent.get('batch_size', 1),
+        'upscale': bool(upscale),
+        'upscale_ratio': (up_res.get('width', width) / width) if upscale and width else 1,
+        'upscale_steps': inputs('KS_up').get('steps', 0) if upscale else 0,
+        'loras': loras,
+        'controlnets': controlnets,
+        'base': checkpoint_base(ckpt_name) if isinstance(ckpt_name, str) else ''
+    }
+
+def features(spec):
+    """Feature vector (see FEATURES) of a job spec."""
+    megapixels = spec.get('width', 512) * spec.get('height', 512) / 1e6
+    batch = spec.get('batch_size', 1)
+    sdxl = 1.0 if 'XL' in (spec.get('base') or '').upper() or 'PONY' in (spec.get('base') or '').upper() else 0.0
+    sampling = spec.get('steps', 30) * megapixels * batch
+    upscale = 0.0
+    if spec.get('upscale'):
+        upscale = spec.get('upscale_steps', 10) * megapixels * spec.get('upscale_ratio', 2) ** 2 * batch
+    return [1.0, sampling, sampling * sdxl, upscale, upscale * sdxl,
+            float(spec.get('loras', 0)), sampling * spec.get('controlnets', 0)]
+
+def solve(matrix, vector):
+    """Solves a small dense linear system with Gaussian elimination and partial pivoting."""
+    n = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            raise ValueError("singular system")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(col + 1, n):
+            factor = rows[r][col] / rows[col][col]
+            for c in range(col, n + 1):
+                rows[r][c] -= factor * rows[col][c]
+    result = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        result[r] = (rows[r][n] - sum(rows[r][c] * result[c] for c in range(r + 1, n))) / rows[r][r]
+    return result
+
+def fit(samples, ridge=RIDGE):
+    """
+    Least-squares fit of execution time on the job features.
+
+    A small ridge term keeps features that never vary in the history (e.g. no
+    SDXL jobs yet) from making the system singular; their coefficients then stay
+    near the defaults.
+
+    Returns:
+    - list of float: One coefficient per feature.
+    """
+    n = len(FEATURES)
+    xtx = [[0.0] * n for _ in range(n)]
+    xty = [0.0] * n
+    for sample in samples:
+        x = features(sample['spec'])
+        y = sample['duration']
+        for i in range(n):
+            xty[i] += x[i] * y
+            for j in range(n):
+                xtx[i][j] += x[i] * x[j]
+    # Shrink towards the defaults rather than towards zero
+    scale = max(len(samples), 1) * ridge
+    for i in range(1, n):
+        xtx[i][i] += scale
+        xty[i] += scale * DEFAULT_COEFFICIENTS[i]
+    return solve(xtx, xty)
+
+class CostModel:
+    """Execution time estimates in seconds."""
+
+    def __init__(self, coefficients=None, sample_count=0):
+        self.coefficients = coefficients or list(DEFAULT_COEFFICIENTS)
+        self.sample_count = sample_count
+
+    def estimate(self, job_spec):
+        """Predicted execution time of one job in seconds (at least one second)."""
+        prediction = sum(c * x for c, x in zip(self.coefficients, features(job_spec)))
+        return max(prediction, 1.0)
+
+    def estimate_many(self, job_specs):
+        """Predicted total time of a list of jobs, e.g. for a campaign ETA."""
+        return sum(self.estimate(spec) for spec in job_specs)
+
+def load_model(path=None):
+    """Returns the fitted model, or the default one if no fit with enough samples exists."""
+    path = path or model_path()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return CostModel()
+    if data.get('features') != FEATURES or data.get('samples', 0) < MIN_SAMPLES:
+        return CostModel()
+    return CostModel(data['coefficients'], data['samples'])
+
+_model = {'mtime': None, 'model': None}
+
+def estimate(job_spec):
+    """Estimate with the current fitted model (reloaded when cache/cost_model.json changes)."""
+    try:
+        mtime = os.path.getmtime(model_path())
+    except OSError:
+        mtime = None
+    if _model['model'] is None or _model['mtime'] != mtime:
+        _model['model'], _model['mtime'] = load_model(), mtime
+    return _model['model'].estimate(job_spec)
+
+def read_samples(path=None):
+    path = path or samples_path()
+    if not os.path.exists(path):
+        return []
+    samples = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                samples.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return samples
+
+def execution_time(entry):
+    """Seconds between execution_start and execution_success in a /history entry, or None."""
+    status = entry.get('status') or {}
+    if status.get('status_str') != 'success':
+        return None
+    timestamps = {event: data.get('timestamp') for event, data in status.get('messages', []) if isinstance(data, dict)}
+    start, end = timestamps.get('execution_start'), timestamps.get('execution_success')
+    if start is None or end is None or end <= start:
+        return None
+    return (end - start) / 1000
+
+def collect_samples(server=None, path=None, max_items=None, history=None):
+    """
+    Appends execution times of finished jobs from /history to data/job_times.jsonl.
+
+    Parameters:
+    - history (dict, optional): /history entries already fetched by the caller; fetched if omitted.
+
+    Returns:
+    - int: Number of new samples.
+    """
+    path = path or samples_path()
+    known = {sample['prompt_id'] for sample in read_samples(path)}
+    if history is None:
+        history = get_json('/history', server=server, query={'max_items': max_items} if max_items else None, timeout=60)
+
+    new_samples = []
+    for prompt_id, entry in history.items():
+        if prompt_id in known:
+            continue
+        duration = execution_time(entry)
+        prompt = entry.get('prompt') or []
+        if duration is None or len(prompt) < 3:
+            continue
+        new_samples.append({'prompt_id': prompt_id, 'duration': duration, 'spec': spec_from_workflow(prompt[2])})
+
+    if new_samples:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            for sample in new_samples:
+                f.write(json.dumps(sample) + '\n')
+    logger.info(f"cost_model.collect_samples: {len(new_samples)} new samples ({len(known) + len(new_samples)} total)")
+    return len(new_samples)
+
+def fit_and_save(samples_file=None, output_path=None):
+    """Fits the model on all collected samples and writes cache/cost_model.json."""
+    samples = read_samples(samples_file)
+    output_path = output_path or model_path()
+    if len(samples) < MIN_SAMPLES:
+        logger.info(f"cost_model.fit_and_save: {len(samples)} samples, need {MIN_SAMPLES}; keeping defaults")
+        return CostModel()
+
+    coefficients = fit(samples)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({'features': FEATURES, 'coefficients': coefficients, 'samples': len(samples),
+                   'fitted_at': datetime.now().isoformat()}, f, indent=2)
+    model = CostModel(coefficients, len(samples))
+    errors = [abs(model.estimate(s['spec']) - s['duration']) for s in samples]
+    logger.info(f"cost_model.fit_and_save: Fitted on {len(samples)} samples, mean absolute error {sum(errors) / len(errors):.1f}s")
+    for name, value in zip(FEATURES, coefficients):
+        logger.info(f"cost_model.fit_and_save:   {name}: {value:.3f}")
+    return model
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the job duration model on ComfyUI's history")
+    parser.add_argument('--collect', action='store_true', help="Append finished jobs from /history to data/job_times.jsonl")
+    parser.add_argument('--fit', action='store_true', help="Fit on the collected samples and save cache/cost_model.json")
+    parser.add_argument('--server', default=None)
+    args = parser.parse_args()
+
+    if args.collect:
+        collect_samples(server=args.server)
+    if args.fit:
+        fit_and_save()
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
@@ -0,0 +1,255 @@
+"""
+Near-duplicate index over 64-bit perceptual hashes.
+
+Random runs often produce outputs that are nearly identical (same checkpoint,
+close seeds, weak LoRAs), and each one would otherwise be upscaled and tweaked.
+Images are hashed with pHash (low-frequency DCT signs) or dHash (horizontal
+gradient signs), computed in NumPy on a small grayscale copy.
+
+DedupIndex answers "is anything within Hamming distance k" with multi-index
+hashing: the 64 bits are split into `blocks` sub-hashes with one lookup table
+each. Any hash within distance k of the query differs in at most k // blocks
+bits in at least one block (pigeonhole), so probing each table with every value
+within that radius finds all matches exactly while touching only a few buckets.
+
+Indexes are persisted as append-only JSONL under cache/, one per purpose
+(e.g. 'upscale', 'tweak'), so they grow incrementally across runs.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+from PIL import Image
+from config import get_path
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+HASH_BITS = 64
+HASH_SIZE = 8
+PHASH_SIZE = 32
+DEFAULT_MAX_DISTANCE = 6
+
+def load_gray(path, size):
+    """Loads an image as a float32 grayscale array resized to size (w, h)."""
+    with Image.open(path) as image:
+        image.draft('L', (size[0] * 4, size[1] * 4))
+        return np.asarray(image.convert('L').resize(size, Image.LANCZOS), dtype=np.float32)
+
+def bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), 'big')
+
+def dhash(gray):
+    """64-bit difference hash of a 9x8 grayscale array: is each pixel darker than its right neighbour."""
+    return bits_to_int(gray[:, 1:] > gray[:, :-1])
+
+@lru_cache(maxsize=None)
+def dct_matrix(n):
+    """Orthonormal DCT-II matrix, so dct(x) = D @ x @ D.T for an n x n block."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+def phash(gray):
+    """64-bit perceptual hash of a 32x32 grayscale array: low 8x8 DCT coefficients above their median."""
+    d = dct_matrix(gray.shape[0])
+    low = (d @ gray @ d.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only carries overall brightness, leave it out of the median
+    return bits_to_int(low > np.median(low.ravel()[1:]))
+
+HASHERS = {
+    'phash': (phash, (PHASH_SIZE, PHASH_SIZE)),
+    'dhash': (dhash, (HASH_SIZE + 1, HASH_SIZE)),
+}
+
+def image_hash(path, method='phash'):
+    """Perceptual hash of an image file as a 64-bit int."""
+    hasher, size = HASHERS[method]
+    return hasher(load_gray(path, size))
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+@lru_cache(maxsize=None)
+def flip_masks(bits, radius):
+    """All masks of `bits` bits with at most `radius` bits set."""
+    masks = []
+    for r in range(radius + 1):
+        for positions in itertools.combinations(range(bits), r):
+            masks.append(sum(1 << p for p in positions))
+    return tuple(masks)
+
+def index_path(name):
+    return get_path('cache', f"dedup_{name}.jsonl")
+
+class DedupIndex:
+    """
+    Multi-index Hamming search over 64-bit hashes.
+
+    Parameters:
+    - name (str, optional): Persist to cache/dedup_<name>.jsonl; in-memory only if omitted.
+    - method (str): 'phash' or 'dhash'. Entries hashed with another method are ignored.
+    - blocks (int): Number of sub-hash tables (1, 2, 4 or 8).
+    """
+
+    def __init__(self, name=None, method='phash', blocks=4):
+        if method not in HASHERS:
+            raise ValueError(f"Unknown hash method '{method}', choose from {sorted(HASHERS)}")
+        if HASH_BITS % blocks:
+            raise ValueError(f"blocks must divide {HASH_BITS}, got {blocks}")
+        self.path = index_path(name) if name else None
+        self.method = method
+        self.blocks = blocks
+        self.block_bits = HASH_BITS // blocks
+        self.block_mask = (1 << self.block_bits) - 1
+        self.keys = []
+        self.hashes = []
+        self.tables = [{} for _ in range(blocks)]
+        self.unsaved = []
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get('method') == self.method:
+                    self._insert(entry['key'], int(entry['hash'], 16))
+        logger.info(f"dedup_index.DedupIndex: Loaded {len(self)} {self.method} hashes from {self.path}")
+
+    def _insert(self, key, value):
+        entry_id = len(self.hashes)
+        self.keys.append(key)
+        self.hashes.append(value)
+        for block, table in enumerate(self.tables):
+            table.setdefault((value >> (block * self.block_bits)) & self.block_mask, []).append(entry_id)
+
+    def add(self, key, value):
+        """Adds a hash; call save() to persist it."""
+        self._insert(key, value)
+        self.unsaved.append({'key': key, 'hash': f"{value:016x}", 'method': self.method,
+                             'added_at': datetime.now().isoformat()})
+
+    def save(self):
+        if not self.path or not self.unsaved:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in self.unsaved:
+                f.write(json.dumps(entry) + '\n')
+        self.unsaved = []
+
+    def query(self, value, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        Finds every indexed hash within max_distance of value.
+
+        Returns:
+        - list: (key, distance) pairs, closest first.
+        """
+        masks = flip_masks(self.block_bits, max_distance // self.blocks)
+        seen = set()
+        matches = []
+        for block, table in enumerate(self.tables):
+            sub_hash = (value >> (block * self.block_bits)) & self.block_mask
+            for mask in masks:
+                for entry_id in table.get(sub_hash ^ mask, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    distance = hamming(value, self.hashes[entry_id])
+                    if distance <= max_distance:
+                        matches.append((self.keys[entry_id], distance))
+        return sorted(matches, key=lambda match: match[1])
+
+    def nearest(self, value, max_distance=DEFAULT_MAX_DISTANCE):
+        """The closest (key, distance) within max_distance, or None."""
+        matches = self.query(value, max_distance)
+        return matches[0] if matches else None
+
+def filter_duplicates(paths, index, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Splits images into new ones and near-duplicates of indexed images or of each other.
+
+    New images are not added to the index; do that with index.add(key, hash) once
+    they have actually been processed, so a failed job is not treated as done.
+
+    Parameters:
+    - paths (list of str): Image files, in processing order.
+    - index (DedupIndex): Images processed before.
+    - max_distance (int): Largest Hamming distance counted as a duplicate.
+
+    Returns:
+    - tuple: (list of (path, hash) for new images, list of (path, matched key, distance))
+    """
+    batch = DedupIndex(method=index.method, blocks=index.blocks)
+    unique, duplicates = [], []
+    for path in paths:
+        try:
+            value = image_hash(path, index.method)
+        except (OSError, ValueError) as e:
+            logger.warning(f"dedup_index.filter_duplicates: Could not hash {path}: {e}")
+            unique.append((path, None))
+            continue
+        match = index.nearest(value, max_distance) or batch.nearest(value, max_distance)
+        if match:
+            duplicates.append((path, match[0], match[1]))
+            logger.info(f"dedup_index: {os.path.basename(path)} is a near-duplicate of {match[0]} (distance {match[1]})")
+        else:
+            batch.add(os.path.basename(path), value)
+            unique.append((path, value))
+    logger.info(f"dedup_index.filter_duplicates: {len(unique)} new, {len(duplicates)} near-duplicates")
+    return unique, duplicates
+
+def move_duplicates(directory, duplicates):
+    """Moves near-duplicates to directory/duplicates so they can be reviewed or deleted by hand."""
+    duplicates_dir = os.path.join(directory, 'duplicates')
+    os.makedirs(duplicates_dir, exist_ok=True)
+    for path, _, _ in duplicates:
+        os.rename(path, os.path.join(duplicates_dir, os.path.basename(path)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain and query perceptual-hash near-duplicate indexes")
+    parser.add_argument('command', choices=['add', 'query'], help="add: index images, query: look them up")
+    parser.add_argument('paths', nargs='+', help="Image files or folders")
+    parser.add_argument('--index', default='upscale', help="Index name (cache/dedup_<name>.jsonl)")
+    parser.add_argument('--method', choices=sorted(HASHERS), default='phash')
+    parser.add_argument('--distance', type=int, default=DEFAULT_MAX_DISTANCE, help="Max Hamming distance")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')))
+        else:
+            files.append(path)
+
+    index = DedupIndex(args.index, method=args.method)
+    for path in files:
+        value = image_hash(path, args.method)
+        if args.command == 'add':
+            index.add(os.path.basename(path), value)
+            continue
+        start = time.perf_counter()
+        matches = index.query(value, args.distance)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{os.path.basename(path)} ({value:016x}): {matches[:5] or 'no match'} [{elapsed:.3f} ms]")
+    index.save()
+    if args.command == 'add':
+        print(f"Index '{args.index}' now holds {len(index)} hashes")
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
@@ -0,0 +1,167 @@
+"""
+Preview-and-abort: interrupts jobs whose intermediate previews look hopeless.
+
+PreviewMonitor listens on ComfyUI's websocket with the client_id the jobs were
+queued with. ComfyUI sends that client progress events and, when the server runs
+with a preview method (--preview-method auto / latent2rgb / taesd), a preview
+image of the latent every few steps. From min_step on, each preview is scored
+with a cheap NumPy heuristic from utils.image_metrics. If `patience` previews in
+a row score below the threshold, the running prompt is interrupted through
+/interrupt and recorded in data/aborted.jsonl.
+"""
+
+import io
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+import websocket
+from PIL import Image
+from comfy_api import get_server, post_json
+from config import get_path
+from utils.image_metrics import SCORERS
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+# Binary websocket frames: 4-byte event type, 4-byte image format, image bytes
+PREVIEW_IMAGE = 1
+PREVIEW_SIZE = 128
+
+def aborted_path():
+    return get_path('data', 'aborted.jsonl')
+
+def decode_preview(frame):
+    """Decodes a binary preview frame into a small RGB array, or None for other frames."""
+    if len(frame) < 8:
+        return None
+    event_type, _ = struct.unpack('>II', frame[:8])
+    if event_type != PREVIEW_IMAGE:
+        return None
+    with Image.open(io.BytesIO(frame[8:])) as image:
+        image = image.convert('RGB')
+        image.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+        return np.asarray(image)
+
+class PreviewMonitor:
+    """
+    Scores live previews and interrupts jobs that stay below a threshold.
+
+    Parameters:
+    - server (str, optional): host:port of the backend.
+    - client_id (str, optional): Pass the same id to queue_workflow; generated if omitted.
+    - scorer (str): Name in utils.image_metrics.SCORERS.
+    - threshold (float): Previews scoring below this count as bad.
+    - min_step (int): Previews before this sampler step are not judged.
+    - patience (int): Consecutive bad previews before the job is interrupted.
+    """
+
+    def __init__(self, server=None, client_id=None, scorer='not_blank', threshold=8.0, min_step=8, patience=2):
+        if scorer not in SCORERS:
+            raise ValueError(f"Unknown scorer '{scorer}', choose from {sorted(SCORERS)}")
+        self.server = get_server(server)
+        self.client_id = client_id or uuid.uuid4().hex
+        self.scorer_name = scorer
+        self.scorer = SCORERS[scorer]
+        self.threshold = threshold
+        self.min_step = min_step
+        self.patience = patience
+        self.prompt_id = None
+        self.step = 0
+        self.max_step = 0
+        self.bad_previews = 0
+        self.aborted = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='preview-monitor', daemon=True)
+        self._thread.start()
+        logger.info(f"early_abort.PreviewMonitor: Watching previews on {self.server} (client {self.client_id}, "
+                    f"{self.scorer_name} < {self.threshold} from step {self.min_step})")
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        """Receives websocket frames, reconnecting with backoff when the connection drops."""
+        delay = 1
+        while not self._stop.is_set():
+            ws = websocket.WebSocket()
+            try:
+                ws.connect(f"ws://{self.server}/ws?clientId={self.client_id}", timeout=30)
+                ws.settimeout(None)
+                delay = 1
+                while not self._stop.is_set():
+                    frame = ws.recv()
+                    if isinstance(frame, bytes):
+                        self.handle_preview(frame)
+                    elif frame:
+                        self.handle_message(json.loads(frame))
+            except (OSError, websocket.WebSocketException, json.JSONDecodeError) as e:
+                logger.warning(f"early_abort.PreviewMonitor: Connection lost ({e}), reconnecting in {delay}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+            finally:
+                ws.close()
+
+    def handle_message(self, message):
+        data = message.get('data') or {}
+        if message.get('type') == 'execution_start':
+            self.prompt_id, self.step, self.bad_previews = data.get('prompt_id'), 0, 0
+        elif message.get('type') == 'executing':
+            # a new node (e.g. the upscale sampler) starts its own step count
+            if data.get('prompt_id'):
+                self.prompt_id = data['prompt_id']
+            self.step, self.bad_previews = 0, 0
+        elif message.get('type') == 'progress':
+            if data.get('prompt_id'):
+                self.prompt_id = data['prompt_id']
+            self.step, self.max_step = data.get('value', 0), data.get('max', 0)
+
+    def handle_preview(self, frame):
+        if self.prompt_id is None or self.prompt_id in self.aborted or self.step < self.min_step:
+            return
+        try:
+            preview = decode_preview(frame)
+        except OSError as e:
+            logger.warning(f"early_abort.PreviewMonitor: Could not decode preview: {e}")
+            return
+        if preview is None:
+            return
+
+        score = self.scorer(preview)
+        self.bad_previews = self.bad_previews + 1 if score < self.threshold else 0
+        if self.bad_previews >= self.patience:
+            self.abort(score)
+
+    def abort(self, score):
+        """Interrupts the running prompt and records it."""
+        prompt_id = self.prompt_id
+        self.aborted.add(prompt_id)
+        try:
+            # Newer backends only interrupt if this prompt is still the one running
+            post_json('/interrupt', {'prompt_id': prompt_id}, server=self.server)
+        except OSError as e:
+            logger.error(f"early_abort.PreviewMonitor: Interrupt failed for {prompt_id}: {e}")
+            return
+        record = {
+            'prompt_id': prompt_id,
+            'aborted_at': datetime.now().isoformat(),
+            'step': self.step,
+            'max_step': self.max_step,
+            'scorer': self.scorer_name,
+            'score': score,
+            'threshold': self.threshold
+        }
+        path = aborted_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+        logger.info(f"early_abort.PreviewMonitor: Aborted {prompt_id} at step {self.step}/{self.max_step} "
+                    f"({self.scorer_name} {score:.2f} < {self.threshold})")
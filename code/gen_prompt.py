@@ -1,13 +1,14 @@
-import csv
 import random
 import json
 from datetime import datetime
 from urllib import request
 import urllib.error
 import time
-from config import get_path
-from typing import List, Dict, Optional, Union
-from utils.logger_config import setup_logger
+from utils.catalog import load_table
+from prompt_compactor import compact_prompt
+from prompt_template import render
+from typing import List, Dict, Union
+from utils.logger_config import configure_logging, setup_logger
 
 logger = setup_logger(__name__)
 
@@ -33,34 +34,33 @@ def get_trigger_words(ckpt_name: str, lora_names: Union[str, List[str]], embeddi
         if not name:  # Skip if name is empty
             return []
             
-        with open(get_path('res', 'models.csv'), newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['Name'] == name and row['Type'] == type_:
-                    trigger_select = row[select_col]
-                    if not trigger_select:
-                        logger.warning(f"No {select_col} found for {name}")
-                        return []
-                    
-                    trigger_keywords = row[trigger_col].split(',') if row[trigger_col] else []
-                    logger.debug(f"Found {trigger_col} for {name}: {trigger_keywords}")
-                    
-                    if trigger_select.isdigit():
-                        num_choices = int(trigger_select)
-                        selected = random.sample(trigger_keywords, num_choices) if trigger_keywords else []
-                        return selected
-                    elif trigger_select == "random":
-                        count = random.randint(2, len(trigger_keywords)) if trigger_keywords else 0
-                        return random.sample(trigger_keywords, count) if count > 0 else []
-                    elif trigger_select == "all":
-                        return trigger_keywords
-                    else:
-                        error_msg = f"Invalid trigger selection type: {trigger_select}"
-                        logger.error(error_msg)
-                        raise ValueError(error_msg)
+        row = load_table('models').find_row('Name', name, Type=type_)
+        if row is None:
             logger.warning(f"No matching model found for {name}")
             return []
 
+        trigger_select = row[select_col]
+        if not trigger_select:
+            logger.warning(f"No {select_col} found for {name}")
+            return []
+
+        trigger_keywords = row[trigger_col].split(',') if row[trigger_col] else []
+        logger.debug(f"Found {trigger_col} for {name}: {trigger_keywords}")
+
+        if trigger_select.isdigit():
+            num_choices = int(trigger_select)
+            selected = random.sample(trigger_keywords, num_choices) if trigger_keywords else []
+            return selected
+        elif trigger_select == "random":
+            count = random.randint(2, len(trigger_keywords)) if trigger_keywords else 0
+            return random.sample(trigger_keywords, count) if count > 0 else []
+        elif trigger_select == "all":
+            return trigger_keywords
+        else:
+            error_msg = f"Invalid trigger selection type: {trigger_select}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+
     # Get positive triggers
     pos_checkpoint_keywords = get_keywords(ckpt_name, "Checkpoint", "Pos_trigger", "Pos_trigger_select")
     pos_lora_keywords = []
@@ -100,50 +100,49 @@ def get_style_prompt(style_name=None):
     - ValueError: If the specified style_name is not found in the CSV.
     """
     
-    with open(get_path('res', 'art_styles.csv'), 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        rows = list(reader)
-        
-        # Log the number of rows and included styles for debugging
+    styles = load_table('art_styles')
+    included_mask = styles.flag('included')
+
+    # Log the number of rows and included styles for debugging
+    logger.info(f"gen_prompt.select_random_style: Total styles: {styles.size}, Included styles: {bin(included_mask).count('1')}")
+
+    if not included_mask:
+        logger.info("No styles available in art_styles.csv that are marked as included.")
+        return {"name": "", "positive": "", "negative": ""}
+
+    if style_name:
+        for row_id in styles.find_casefold('name', style_name):
+            if included_mask >> row_id & 1:
+                row = styles.row(row_id)
+                result = {
+                    'name': row['name'],
+                    'positive': row['positive_prompt'] or "No positive prompt available.",
+                    'negative': row['negative_prompt'] or "No negative prompt available."
+                }
+                logger.info(f"Found style. Result: {result}")
+                return result
+        error_msg = f"Style '{style_name}' not found in art_styles.csv or not included."
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    else:
+        """
+        # Filter rows to only include those marked with 'y' in the "included" column
         included_rows = [row for row in rows if row.get('included', '').lower() == 'y']
-        logger.info(f"gen_prompt.select_random_style: Total styles: {len(rows)}, Included styles: {len(included_rows)}")
-        
-        if included_rows == []:
-            logger.info("No styles available in art_styles.csv that are marked as included.")
-            return {"positive": "", "negative": ""}
-
-        if style_name:
-            for row in rows:
-                if row['name'].lower() == style_name.lower() and row.get('included', '').lower() == 'y':
-                    result = {
-                        'name': row['name'],
-                        'positive': row['positive_prompt'] or "No positive prompt available.",
-                        'negative': row['negative_prompt'] or "No negative prompt available."
-                    }
-                    logger.info(f"Found style. Result: {result}")
-                    return result
-            error_msg = f"Style '{style_name}' not found in art_styles.csv or not included."
-            logger.error(error_msg)
-            raise ValueError(error_msg)
-        else:
-            """
-            # Filter rows to only include those marked with 'y' in the "included" column
-            included_rows = [row for row in rows if row.get('included', '').lower() == 'y']
-            if not included_rows:
-                logger.error("No styles available in art_styles.csv that are marked as included.")
-                # Log all unique values in the 'included' column for debugging
-                included_values = set(row.get('included', '') for row in rows)
-                logger.error(f"Values found in 'included' column: {included_values}")
-                raise ValueError("No styles available.")
-            random_row = random.choice(included_rows)
-            result = {
-                'name': random_row['name'],
-                'positive': random_row['positive_prompt'] if random_row['positive_prompt'] else "No positive prompt available.",
-                'negative': random_row['negative_prompt'] if random_row['negative_prompt'] else "No negative prompt available."
-            }
-            """
-            logger.info("No style selected")
-            return {"name":"", "positive": "", "negative": ""}
+        if not included_rows:
+            logger.error("No styles available in art_styles.csv that are marked as included.")
+            # Log all unique values in the 'included' column for debugging
+            included_values = set(row.get('included', '') for row in rows)
+            logger.error(f"Values found in 'included' column: {included_values}")
+            raise ValueError("No styles available.")
+        random_row = random.choice(included_rows)
+        result = {
+            'name': random_row['name'],
+            'positive': random_row['positive_prompt'] if random_row['positive_prompt'] else "No positive prompt available.",
+            'negative': random_row['negative_prompt'] if random_row['negative_prompt'] else "No negative prompt available."
+        }
+        """
+        logger.info("No style selected")
+        return {"name":"", "positive": "", "negative": ""}
 
 def get_object(identifier):
     """
@@ -159,40 +158,38 @@ def get_object(identifier):
     logger.info(f"gen_prompt.get_object: Getting object with identifier: {identifier}")
     
     try:
-        with open(get_path('res', 'objects.csv'), newline='', encoding='latin-1') as csvfile:
-            reader = csv.DictReader(csvfile)
-            rows = list(reader)
-            
-            # Check if identifier is a serial number
-            if str(identifier).isdigit():
-                matching_rows = [row for row in rows if row['serial_no'] == str(identifier)]
-                if not matching_rows:
-                    logger.warning(f"gen_prompt.get_object: No object found for serial_no: {identifier}")
-                    return {"name": "", "positive": "", "negative": "", "input_files": []}
-                selected_row = matching_rows[0]  # Take the exact match
-            else:
-                # Treat identifier as type
-                matching_rows = [row for row in rows if row['type'].lower() == str(identifier).lower()]
-                if not matching_rows:
-                    logger.warning(f"gen_prompt.get_object: No objects found for type: {identifier}")
-                    return {"name": "", "positive": "", "negative": "", "input_files": []}
-                selected_row = random.choice(matching_rows)  # Random selection from type
-            
-            # Process input files - split by comma and strip whitespace
-            input_files = []
-            if selected_row['input_file']:
-                input_files = [f.strip() for f in selected_row['input_file'].split(',')]
-            
-            result = {
-                "name": f"object_{selected_row['serial_no']}",
-                "positive": selected_row['positive_prompt'],
-                "negative": selected_row['negative_prompt'],
-                "input_files": input_files
-            }
-            
-            logger.info(f"gen_prompt.get_object: Selected object: {result['name']}")
-            return result
-            
+        objects = load_table('objects')
+
+        # Check if identifier is a serial number
+        if str(identifier).isdigit():
+            matching_ids = objects.find('serial_no', str(identifier))
+            if not matching_ids:
+                logger.warning(f"gen_prompt.get_object: No object found for serial_no: {identifier}")
+                return {"name": "", "positive": "", "negative": "", "input_files": []}
+            selected_row = objects.row(matching_ids[0])  # Take the exact match
+        else:
+            # Treat identifier as type
+            type_mask = objects.matching('type', lambda object_type: object_type.lower() == str(identifier).lower())
+            if not type_mask:
+                logger.warning(f"gen_prompt.get_object: No objects found for type: {identifier}")
+                return {"name": "", "positive": "", "negative": "", "input_files": []}
+            selected_row = random.choice(objects.rows(type_mask))  # Random selection from type
+        
+        # Process input files - split by comma and strip whitespace
+        input_files = []
+        if selected_row['input_file']:
+            input_files = [f.strip() for f in selected_row['input_file'].split(',')]
+        
+        result = {
+            "name": f"object_{selected_row['serial_no']}",
+            "positive": selected_row['positive_prompt'],
+            "negative": selected_row['negative_prompt'],
+            "input_files": input_files
+        }
+        
+        logger.info(f"gen_prompt.get_object: Selected object: {result['name']}")
+        return result
+        
     except FileNotFoundError:
         logger.error("gen_prompt.get_object: objects.csv not found in res directory")
         return {"name": "", "positive": "", "negative": "", "input_files": []}
@@ -200,7 +197,65 @@ def get_object(identifier):
         logger.error(f"gen_prompt.get_object: CSV file missing required column: {e}")
         return {"name": "", "positive": "", "negative": "", "input_files": []}
 
-def gen_positive_prompt(ckpt_name, lora_names, object_type, embeddings, style_name=None):
+# The shape of prompt_context(), so template references can be checked before a run
+MODEL_FIELDS = {'names': None, 'triggers': None, 'negative_triggers': None}
+CONTEXT_FIELDS = {
+    'object': {'name': None, 'positive': None, 'negative': None, 'input_files': None},
+    'object_type': None,
+    'style': {'name': None, 'positive': None, 'negative': None},
+    'triggers': {'positive': None, 'negative': None},
+    'checkpoint': MODEL_FIELDS,
+    'lora': MODEL_FIELDS,
+    'embedding': MODEL_FIELDS,
+}
+
+def prompt_context(ckpt_name, lora_names, object_type, embeddings, style_name=None):
+    """
+    Fields that prompt templates can reference as ${...}.
+
+    Trigger words are drawn per model, so a template can place ${lora.triggers} apart
+    from ${checkpoint.triggers}; ${triggers.positive} is all of them, as in the fixed prompt.
+
+    Returns:
+    - dict: object (name, positive, negative), style (name, positive, negative),
+      triggers (positive, negative), checkpoint / lora / embedding (names, triggers,
+      negative_triggers) and object_type.
+    """
+    if isinstance(lora_names, str):
+        lora_names = [lora_names] if lora_names else []
+    if isinstance(embeddings, str):
+        embeddings = [name.strip() for name in embeddings.split(',') if name.strip()]
+
+    models = {
+        'checkpoint': ([ckpt_name] if ckpt_name else [], get_trigger_words(ckpt_name, [], [])),
+        'lora': (list(lora_names), get_trigger_words('', lora_names, [])),
+        'embedding': (list(embeddings), get_trigger_words('', [], embeddings)),
+    }
+    context = {
+        'object': get_object(object_type),
+        'object_type': object_type,
+        'style': get_style_prompt(style_name),
+        'triggers': {
+            'positive': ', '.join(filter(None, (words['positive'] for names, words in models.values()))),
+            'negative': ', '.join(filter(None, (words['negative'] for names, words in models.values())))
+        }
+    }
+    for kind, (names, words) in models.items():
+        context[kind] = {'names': names, 'triggers': words['positive'], 'negative_triggers': words['negative']}
+    return context
+
+def render_prompt_template(kind, template, ckpt_name, lora_names, object_type, embeddings, style_name=None,
+                           compact=False, max_chunks=0):
+    """Samples a positive or negative prompt template with the prompt_context() of a job."""
+    context = prompt_context(ckpt_name, lora_names, object_type, embeddings, style_name)
+    full_prompt = render(template, context)
+    if compact:
+        # a template has no object/trigger/style parts, so trimming drops terms from its end
+        full_prompt = compact_prompt([('template', full_prompt)], max_chunks)
+    logger.info(f"gen_prompt.gen_{kind}_prompt: Full {kind} prompt from template: \n {full_prompt}")
+    return full_prompt
+
+def gen_positive_prompt(ckpt_name, lora_names, object_type, embeddings, style_name=None, compact=False, max_chunks=0, template=''):
     """
     Generates a positive prompt for a given checkpoint and a list of LoRAs.
 
@@ -210,11 +265,18 @@ def gen_positive_prompt(ckpt_name, lora_names, object_type, embeddings, style_na
     - object_type (str): The type of object to retrieve.
     - embeddings (list of str): A list of embedding names.
     - style_name (str, optional): The name of the style to retrieve. If None, returns a random style.
+    - compact (bool): Deduplicate terms with prompt_compactor.
+    - max_chunks (int): With compact, trim low-priority terms to fit this many CLIP chunks (0 = no limit).
+    - template (str): prompt_template text to build the prompt from instead of the fixed
+      object, trigger, style, quality order (see prompt_context() for the ${...} fields).
 
     Returns:
     - str: A comma-separated string of the positive prompt.
     """
-    
+    if template:
+        return render_prompt_template('positive', template, ckpt_name, lora_names, object_type, embeddings,
+                                      style_name, compact, max_chunks)
+
     object_string = get_object(object_type)['positive']
 
     trigger_words = get_trigger_words(ckpt_name, lora_names, embeddings)
@@ -222,11 +284,15 @@ def gen_positive_prompt(ckpt_name, lora_names, object_type, embeddings, style_na
     style_positive = style_prompt['positive']
     quality_modifiers = "masterpiece, best quality, ultra-detailed"
     
-    full_prompt = ', '.join([object_string, trigger_words['positive'], style_positive, quality_modifiers])
+    if compact:
+        full_prompt = compact_prompt([('object', object_string), ('trigger', trigger_words['positive']),
+                                      ('style', style_positive), ('quality', quality_modifiers)], max_chunks)
+    else:
+        full_prompt = ', '.join([object_string, trigger_words['positive'], style_positive, quality_modifiers])
     logger.info(f"gen_prompt.gen_positive_prompt: Full positive prompt: \n {full_prompt}")
     return full_prompt
 
-def gen_negative_prompt(ckpt_name, lora_names, object_type, embeddings, style_name=None):
+def gen_negative_prompt(ckpt_name, lora_names, object_type, embeddings, style_name=None, compact=False, max_chunks=0, template=''):
     """
     Generates a negative prompt for a given checkpoint and a list of LoRAs.
 
@@ -234,10 +300,17 @@ def gen_negative_prompt(ckpt_name, lora_names, object_type, embeddings, style_na
     - ckpt_name (str): The name of the checkpoint.
     - lora_names (list of str): A list of LoRA names.
     - style_name (str, optional): The name of the style to retrieve. If None, returns a random style.
+    - compact (bool): Deduplicate terms with prompt_compactor.
+    - max_chunks (int): With compact, trim low-priority terms to fit this many CLIP chunks (0 = no limit).
+    - template (str): prompt_template text to build the prompt from instead of the fixed order.
 
     Returns:
     - str: A comma-separated string of the negative prompt.
     """
+    if template:
+        return render_prompt_template('negative', template, ckpt_name, lora_names, object_type, embeddings,
+                                      style_name, compact, max_chunks)
+
     object_string = get_object(object_type)['negative']
 
     trigger_words = get_trigger_words(ckpt_name, lora_names, embeddings)
@@ -245,8 +318,12 @@ def gen_negative_prompt(ckpt_name, lora_names, object_type, embeddings, style_na
     style_negative = style_prompt['negative']
     quality_modifiers = "watermark, bad quality, low quality, low resolution"
     
-    components = [trigger_words['negative'], style_negative, quality_modifiers, object_string]
-    full_prompt = ', '.join(component for component in components if component)
+    if compact:
+        full_prompt = compact_prompt([('trigger', trigger_words['negative']), ('style', style_negative),
+                                      ('quality', quality_modifiers), ('object', object_string)], max_chunks)
+    else:
+        components = [trigger_words['negative'], style_negative, quality_modifiers, object_string]
+        full_prompt = ', '.join(component for component in components if component)
     logger.info(f"gen_prompt.gen_negative_prompt: Full negative prompt: \n {full_prompt}")
     return full_prompt
 
@@ -263,4 +340,5 @@ def main():
         logger.error(f"Error during prompt generation: {str(e)}")
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -0,0 +1,399 @@
+"""
+Searchable index of generated images, built from their embedded PNG metadata.
+
+ComfyUI's SaveImage stores the API graph in a 'prompt' text chunk, and every
+extra_pnginfo entry in its own chunk; queue_workflow adds the job parameters as
+'automation' (style and object type cannot be recovered from the graph). The
+crawler reads only those text chunks, which come before the image data, and
+stores checkpoint, base, LoRAs with weights, sampler settings, seed, style and
+prompt text in SQLite with an FTS5 table over the prompts.
+
+Crawls are incremental: files whose size and mtime match the index are skipped,
+and files that disappeared are removed.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import struct
+import time
+import zlib
+from datetime import datetime
+from config import get_path
+from utils.catalog import load_table
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+LORA_LOADERS = ('LoraLoader', 'LoraLoaderModelOnly')
+SAMPLERS = ('KSampler', 'KSamplerAdvanced')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    indexed_at TEXT,
+    width INTEGER,
+    height INTEGER,
+    checkpoint TEXT,
+    base TEXT,
+    seed INTEGER,
+    steps INTEGER,
+    cfg REAL,
+    sampler TEXT,
+    scheduler TEXT,
+    denoise REAL,
+    style TEXT,
+    object_type TEXT,
+    job_id TEXT,
+    positive TEXT,
+    negative TEXT
+);
+CREATE TABLE IF NOT EXISTS loras (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    strength_model REAL,
+    strength_clip REAL
+);
+CREATE INDEX IF NOT EXISTS loras_name ON loras(name, strength_model);
+CREATE INDEX IF NOT EXISTS loras_image ON loras(image_id);
+CREATE INDEX IF NOT EXISTS images_checkpoint ON images(checkpoint);
+CREATE INDEX IF NOT EXISTS images_base ON images(base);
+CREATE INDEX IF NOT EXISTS images_style ON images(style);
+CREATE VIRTUAL TABLE IF NOT EXISTS prompts USING fts5(positive, negative);
+"""
+
+def index_path():
+    return get_path('cache', 'generation_index.sqlite')
+
+def default_output_dir():
+    """ComfyUI's output folder under COMFYUI_PATH, falling back to ~/ComfyUI."""
+    comfyui_path = os.environ.get('COMFYUI_PATH', os.path.join(os.path.expanduser('~'), 'ComfyUI'))
+    return os.path.join(comfyui_path, 'output')
+
+def read_png_text(path):
+    """
+    Reads the text chunks (tEXt, zTXt, iTXt) of a PNG without decoding the image.
+
+    Returns:
+    - dict: Chunk keyword -> text, plus 'width' and 'height' from the header. Empty for non-PNG files.
+    """
+    text = {}
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return text
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type in (b'IDAT', b'IEND'):
+                break
+            data = f.read(length)
+            f.seek(4, os.SEEK_CUR)  # CRC
+            if chunk_type == b'IHDR':
+                text['width'], text['height'] = struct.unpack('>II', data[:8])
+            elif chunk_type == b'tEXt':
+                key, _, value = data.partition(b'\0')
+                text[key.decode('latin-1')] = value.decode('latin-1')
+            elif chunk_type == b'zTXt':
+                key, _, value = data.partition(b'\0')
+                text[key.decode('latin-1')] = zlib.decompress(value[1:]).decode('latin-1')
+            elif chunk_type == b'iTXt':
+                key, _, rest = data.partition(b'\0')
+                compressed, rest = rest[0], rest[2:]
+                _, _, rest = rest.partition(b'\0')  # language tag
+                _, _, value = rest.partition(b'\0')  # translated keyword
+                text[key.decode('latin-1')] = (zlib.decompress(value) if compressed else value).decode('utf-8')
+    return text
+
+def linked_node(workflow, value):
+    """The node id a link input points to, or None for literal values."""
+    if isinstance(value, list) and len(value) == 2 and str(value[0]) in workflow:
+        return str(value[0])
+    return None
+
+def find_sampler(workflow):
+    """The main sampler: the one titled 'KSampler' if present, else the first sampler node."""
+    samplers = [(node_id, node) for node_id, node in workflow.items() if node.get('class_type') in SAMPLERS]
+    for node_id, node in samplers:
+        if node.get('_meta', {}).get('title') == 'KSampler':
+            return node_id, node
+    return samplers[0] if samplers else (None, None)
+
+def trace_text(workflow, node_id, preferred):
+    """Follows conditioning links back from node_id to the first node with a text input."""
+    seen = set()
+    while node_id and node_id not in seen:
+        seen.add(node_id)
+        inputs = workflow[node_id].get('inputs', {})
+        for name in ('text', 'text_g', 'prompt'):
+            if isinstance(inputs.get(name), str):
+                return inputs[name]
+        # through ControlNet apply and similar nodes: prefer the matching input, then any conditioning
+        next_id = linked_node(workflow, inputs.get(preferred)) or linked_node(workflow, inputs.get('conditioning'))
+        node_id = next_id
+    return None
+
+def trace_models(workflow, node_id):
+    """Follows the model chain back from node_id, returning (checkpoint, active LoRAs)."""
+    loras = []
+    seen = set()
+    while node_id and node_id not in seen:
+        seen.add(node_id)
+        node = workflow[node_id]
+        inputs = node.get('inputs', {})
+        if node.get('class_type') in LORA_LOADERS:
+            strength_model = inputs.get('strength_model', 1.0)
+            strength_clip = inputs.get('strength_clip', strength_model)
+            if inputs.get('lora_name') and (strength_model or strength_clip):
+                loras.append({'name': inputs['lora_name'], 'strength_model': strength_model, 'strength_clip': strength_clip})
+        for name in ('ckpt_name', 'unet_name'):
+            if isinstance(inputs.get(name), str):
+                return inputs[name], loras[::-1]
+        node_id = linked_node(workflow, inputs.get('model'))
+    return None, loras[::-1]
+
+def parse_generation(text):
+    """
+    Extracts the indexed fields from a PNG's text chunks.
+
+    Returns:
+    - dict or None: Field values plus a 'loras' list, or None without a 'prompt' graph.
+    """
+    try:
+        workflow = json.loads(text['prompt'])
+    except (KeyError, json.JSONDecodeError):
+        return None
+    try:
+        automation = json.loads(text.get('automation') or '{}')
+    except json.JSONDecodeError:
+        automation = {}
+
+    record = {'width': text.get('width'), 'height': text.get('height'),
+              'style': automation.get('style'), 'object_type': automation.get('object_type'),
+              'job_id': automation.get('job_id')}
+    sampler_id, sampler = find_sampler(workflow)
+    checkpoint, loras = None, []
+    if sampler:
+        inputs = sampler['inputs']
+        seed = inputs.get('seed', inputs.get('noise_seed'))
+        record.update({
+            'seed': seed if isinstance(seed, int) else None,
+            'steps': inputs.get('steps'),
+            'cfg': inputs.get('cfg'),
+            'sampler': inputs.get('sampler_name'),
+            'scheduler': inputs.get('scheduler'),
+            'denoise': inputs.get('denoise'),
+            'positive': trace_text(workflow, linked_node(workflow, inputs.get('positive')), 'positive'),
+            'negative': trace_text(workflow, linked_node(workflow, inputs.get('negative')), 'negative'),
+        })
+        checkpoint, loras = trace_models(workflow, linked_node(workflow, inputs.get('model')))
+    record['checkpoint'] = automation.get('checkpoint') or checkpoint
+    record['loras'] = loras
+    return record
+
+class GenerationIndex:
+    """
+    SQLite index of generated images.
+
+    Parameters:
+    - path (str, optional): Database file, default cache/generation_index.sqlite.
+    """
+
+    COLUMNS = ('width', 'height', 'checkpoint', 'base', 'seed', 'steps', 'cfg', 'sampler', 'scheduler',
+               'denoise', 'style', 'object_type', 'job_id', 'positive', 'negative')
+
+    def __init__(self, path=None):
+        self.path = path or index_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+        self._bases = None
+
+    def close(self):
+        self.db.close()
+
+    def base_of(self, checkpoint):
+        """Base model of a checkpoint from models.csv."""
+        if self._bases is None:
+            models_table = load_table('models')
+            self._bases = {row['Name']: row['Base'] for row in models_table.rows(models_table.equals('Type', 'Checkpoint'))}
+        return self._bases.get(checkpoint)
+
+    def remove(self, image_id):
+        self.db.execute("DELETE FROM prompts WHERE rowid = ?", (image_id,))
+        self.db.execute("DELETE FROM loras WHERE image_id = ?", (image_id,))
+        self.db.execute("DELETE FROM images WHERE id = ?", (image_id,))
+
+    def add(self, path, size, mtime, record):
+        """Inserts or replaces one image."""
+        existing = self.db.execute("SELECT id FROM images WHERE path = ?", (path,)).fetchone()
+        if existing:
+            self.remove(existing['id'])
+        record = dict(record, base=self.base_of(record.get('checkpoint')))
+        values = [record.get(column) for column in self.COLUMNS]
+        cursor = self.db.execute(
+            f"INSERT INTO images (path, size, mtime, indexed_at, {', '.join(self.COLUMNS)}) "
+            f"VALUES (?, ?, ?, ?, {', '.join('?' * len(self.COLUMNS))})",
+            [path, size, mtime, datetime.now().isoformat()] + values)
+        image_id = cursor.lastrowid
+        self.db.executemany("INSERT INTO loras (image_id, name, strength_model, strength_clip) VALUES (?, ?, ?, ?)",
+                            [(image_id, lora['name'], lora['strength_model'], lora['strength_clip']) for lora in record['loras']])
+        self.db.execute("INSERT INTO prompts (rowid, positive, negative) VALUES (?, ?, ?)",
+                        (image_id, record.get('positive') or '', record.get('negative') or ''))
+
+    def crawl(self, root, prune=True):
+        """
+        Indexes new and changed PNGs under root.
+
+        Parameters:
+        - root (str): Output folder, searched recursively.
+        - prune (bool): Remove indexed files under root that no longer exist.
+
+        Returns:
+        - dict: Counts of 'added', 'unchanged', 'skipped' (no metadata) and 'removed' files.
+        """
+        root = os.path.abspath(root)
+        # a plain prefix compare: LIKE would treat _ and % in folder names as wildcards and ignore case
+        prefix = root.rstrip(os.sep) + os.sep
+        known = {row['path']: (row['id'], row['size'], row['mtime'])
+                 for row in self.db.execute("SELECT id, path, size, mtime FROM images WHERE substr(path, 1, ?) = ?",
+                                            (len(prefix), prefix))}
+        counts = {'added': 0, 'unchanged': 0, 'skipped': 0, 'removed': 0}
+        seen = set()
+        start = time.time()
+
+        stack = [root]
+        with self.db:
+            while stack:
+                try:
+                    entries = list(os.scandir(stack.pop()))
+                except OSError as e:
+                    logger.warning(f"generation_index.crawl: Cannot read folder: {e}")
+                    continue
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.name.lower().endswith('.png'):
+                        continue
+                    stat = entry.stat()
+                    seen.add(entry.path)
+                    if entry.path in known and known[entry.path][1:] == (stat.st_size, stat.st_mtime):
+                        counts['unchanged'] += 1
+                        continue
+                    try:
+                        record = parse_generation(read_png_text(entry.path))
+                    except (OSError, ValueError, zlib.error) as e:
+                        logger.warning(f"generation_index.crawl: Cannot read {entry.path}: {e}")
+                        record = None
+                    if record is None:
+                        counts['skipped'] += 1
+                        continue
+                    self.add(entry.path, stat.st_size, stat.st_mtime, record)
+                    counts['added'] += 1
+
+            if prune:
+                for path, (image_id, _, _) in known.items():
+                    if path not in seen:
+                        self.remove(image_id)
+                        counts['removed'] += 1
+
+        logger.info(f"generation_index.crawl: {counts} in {time.time() - start:.1f}s")
+        return counts
+
+    def search(self, lora=None, min_weight=None, max_weight=None, base=None, checkpoint=None, style=None,
+               text=None, seed=None, limit=100):
+        """
+        Finds images by generation parameters.
+
+        Parameters:
+        - lora (str, optional): LoRA name; min_weight / max_weight filter its model strength.
+        - base (str, optional): Checkpoint base as in models.csv, matched by case-insensitive prefix,
+          so 'SDXL' finds 'SDXL 1.0' and 'sd 1' finds 'SD 1.5'.
+        - checkpoint (str, optional): Checkpoint file name.
+        - style (str, optional): Art style name.
+        - text (str, optional): FTS5 query over positive and negative prompts, e.g. 'castle AND night'.
+        - seed (int, optional): Seed.
+        - limit (int): Maximum number of results.
+
+        Returns:
+        - list of dict: Matching images, newest first, with their LoRAs.
+        """
+        joins, conditions, params = [], [], []
+        if lora:
+            joins.append("JOIN loras l ON l.image_id = i.id")
+            conditions.append("l.name = ?")
+            params.append(lora)
+            if min_weight is not None:
+                conditions.append("l.strength_model >= ?")
+                params.append(min_weight)
+            if max_weight is not None:
+                conditions.append("l.strength_model <= ?")
+                params.append(max_weight)
+        if text:
+            joins.append("JOIN prompts p ON p.rowid = i.id")
+            conditions.append("prompts MATCH ?")
+            params.append(text)
+        if base:
+            conditions.append("lower(substr(i.base, 1, ?)) = ?")
+            params.extend([len(base), base.lower()])
+        for column, value in (('checkpoint', checkpoint), ('style', style), ('seed', seed)):
+            if value is not None:
+                conditions.append(f"i.{column} = ?")
+                params.append(value)
+
+        sql = f"SELECT DISTINCT i.* FROM images i {' '.join(joins)}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY i.mtime DESC LIMIT ?"
+        results = [dict(row) for row in self.db.execute(sql, params + [limit])]
+        for result in results:
+            result['loras'] = [dict(row) for row in self.db.execute(
+                "SELECT name, strength_model, strength_clip FROM loras WHERE image_id = ?", (result['id'],))]
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Index generated images and search them by generation parameters")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    crawl_parser = subparsers.add_parser('crawl', help="Index new and changed images")
+    crawl_parser.add_argument('root', nargs='?', default=None, help="Output folder (default: $COMFYUI_PATH/output)")
+    search_parser = subparsers.add_parser('search', help="Search the index")
+    search_parser.add_argument('--lora')
+    search_parser.add_argument('--min-weight', type=float)
+    search_parser.add_argument('--max-weight', type=float)
+    search_parser.add_argument('--base', help="Checkpoint base prefix, case-insensitive (SDXL matches 'SDXL 1.0')")
+    search_parser.add_argument('--checkpoint')
+    search_parser.add_argument('--style')
+    search_parser.add_argument('--text', help="FTS5 query over the prompts")
+    search_parser.add_argument('--seed', type=int)
+    search_parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    index = GenerationIndex()
+    try:
+        if args.command == 'crawl':
+            print(index.crawl(args.root or default_output_dir()))
+            return
+        start = time.perf_counter()
+        results = index.search(lora=args.lora, min_weight=args.min_weight, max_weight=args.max_weight, base=args.base,
+                               checkpoint=args.checkpoint, style=args.style, text=args.text, seed=args.seed, limit=args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for result in results:
+            loras = ', '.join(f"{lora['name']}:{lora['strength_model']}" for lora in result['loras'])
+            print(f"{result['path']}  {result['checkpoint']}  seed={result['seed']}  style={result['style']}  [{loras}]")
+        print(f"{len(results)} images in {elapsed:.1f} ms")
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
@@ -0,0 +1,176 @@
+"""
+Shrinks an API-format graph before it is queued.
+
+run.py keeps one template graph and switches branches on and off by rewiring
+inputs (e.g. "Save Image" <- "VAE Decode_scaled"), so every payload carries the
+whole template: the unused upscale branch, ControlNet preprocessors whose switch
+is Off, unused LoRA loaders and a _meta block per node. optimize_workflow()
+returns a copy with
+
+- switch nodes whose state is fixed in the graph folded away (fold_switches),
+- nodes that no output node depends on removed (prune),
+- _meta blocks removed (strip_meta).
+
+The template itself is never modified. Note that ComfyUI embeds the submitted
+graph in the saved PNG, and upscale.py / tweak.py find nodes in it by title:
+images queued with prune or strip_meta cannot be upscaled or tweaked later.
+"""
+
+import copy
+import json
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+# Output node classes used when no /object_info is at hand
+OUTPUT_CLASSES = {
+    'SaveImage',
+    'PreviewImage',
+    'SaveAnimatedWEBP',
+    'SaveAnimatedPNG',
+    'easy showAnything',
+}
+
+def is_link(value):
+    """Links in API graphs are [source node id, output slot]."""
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and isinstance(value[1], int)
+
+def find_outputs(workflow, object_info=None):
+    """
+    Returns the ids of the output nodes, the roots everything else is kept for.
+
+    Parameters:
+    - workflow (dict): API-format graph.
+    - object_info (dict, optional): Node definitions; their output_node flag is used when given.
+    """
+    outputs = []
+    for node_id, node in workflow.items():
+        class_type = node.get('class_type')
+        definition = (object_info or {}).get(class_type)
+        if (definition is not None and definition.get('output_node')) or class_type in OUTPUT_CLASSES:
+            outputs.append(node_id)
+    return outputs
+
+def prune_unreachable(workflow, outputs):
+    """Removes every node that is not an output node or an ancestor of one (in place)."""
+    reachable = set()
+    stack = [node_id for node_id in outputs if node_id in workflow]
+    while stack:
+        node_id = stack.pop()
+        if node_id in reachable:
+            continue
+        reachable.add(node_id)
+        for value in workflow[node_id]['inputs'].values():
+            if is_link(value) and value[0] in workflow and value[0] not in reachable:
+                stack.append(value[0])
+
+    removed = [node_id for node_id in workflow if node_id not in reachable]
+    for node_id in removed:
+        del workflow[node_id]
+    return removed
+
+def rewire(workflow, node_id, slot_sources):
+    """
+    Points every consumer of node_id's outputs at another source (in place).
+
+    Parameters:
+    - slot_sources (dict): Output slot -> value (a link or constant) that replaces it.
+    """
+    for node in workflow.values():
+        inputs = node['inputs']
+        for name, value in inputs.items():
+            if is_link(value) and value[0] == node_id and value[1] in slot_sources:
+                inputs[name] = slot_sources[value[1]]
+
+def fold_controlnet_stack(workflow, node_id):
+    """Drops the image links of CR Multi-ControlNet Stack slots that are switched Off."""
+    inputs = workflow[node_id]['inputs']
+    for slot in (1, 2, 3):
+        if inputs.get(f'switch_{slot}') == 'Off':
+            inputs.pop(f'image_{slot}', None)
+    return False
+
+def fold_apply_controlnet(workflow, node_id):
+    """CR Apply Multi-ControlNet passes the conditioning through when it or its whole stack is Off."""
+    inputs = workflow[node_id]['inputs']
+    stack = inputs.get('controlnet_stack')
+    stack_node = workflow.get(stack[0]) if is_link(stack) else None
+    stack_off = (stack_node is not None
+                 and stack_node.get('class_type') == 'CR Multi-ControlNet Stack'
+                 and all(stack_node['inputs'].get(f'switch_{slot}') != 'On' for slot in (1, 2, 3)))
+    if inputs.get('switch') == 'Off' or stack is None or stack_off:
+        rewire(workflow, node_id, {0: inputs['base_positive'], 1: inputs['base_negative']})
+        return True
+    return False
+
+def fold_lora_loader(workflow, node_id):
+    """A LoraLoader with both strengths at 0 does nothing; pass model and clip through."""
+    inputs = workflow[node_id]['inputs']
+    if inputs.get('strength_model') == 0 and inputs.get('strength_clip') == 0 \
+            and is_link(inputs.get('model')) and is_link(inputs.get('clip')):
+        rewire(workflow, node_id, {0: inputs['model'], 1: inputs['clip']})
+        return True
+    return False
+
+# class_type -> function(workflow, node_id) returning True if the node was folded out of the graph
+SWITCH_FOLDERS = {
+    'CR Multi-ControlNet Stack': fold_controlnet_stack,
+    'CR Apply Multi-ControlNet': fold_apply_controlnet,
+    'LoraLoader': fold_lora_loader,
+}
+
+def fold_static_switches(workflow):
+    """
+    Folds nodes whose switch state is static in the graph (in place).
+
+    Stacks are folded before the nodes that apply them, so a stack with every
+    slot Off lets the apply node fold as well.
+
+    Returns:
+    - list: Ids of the nodes that were folded out.
+    """
+    folded = []
+    for class_type, folder in SWITCH_FOLDERS.items():
+        for node_id, node in list(workflow.items()):
+            if node.get('class_type') == class_type and folder(workflow, node_id):
+                folded.append(node_id)
+    return folded
+
+def remove_meta(workflow):
+    """Removes the _meta blocks (in place); ComfyUI does not need them to execute a graph."""
+    for node in workflow.values():
+        node.pop('_meta', None)
+
+def optimize_workflow(workflow, prune=True, fold_switches=True, strip_meta=False, object_info=None):
+    """
+    Returns a minimized copy of an API-format graph for submission.
+
+    Parameters:
+    - workflow (dict): API-format graph. It is not modified.
+    - prune (bool): Drop nodes that no output node depends on.
+    - fold_switches (bool): Fold static switch nodes (see SWITCH_FOLDERS).
+    - strip_meta (bool): Drop the _meta blocks.
+    - object_info (dict, optional): Node definitions used to find output nodes. Without
+      them only the classes in OUTPUT_CLASSES count as outputs; if no output node is
+      found the graph is not pruned.
+
+    Returns:
+    - dict: The optimized graph.
+    """
+    optimized = copy.deepcopy(workflow)
+    folded = fold_static_switches(optimized) if fold_switches else []
+    removed = []
+    if prune:
+        outputs = find_outputs(optimized, object_info)
+        if outputs:
+            removed = prune_unreachable(optimized, outputs)
+        else:
+            # pruning against no roots would empty the graph
+            logger.warning("graph_optimizer.optimize_workflow: No output nodes found, not pruning")
+    if strip_meta:
+        remove_meta(optimized)
+
+    logger.info(f"graph_optimizer.optimize_workflow: {len(workflow)} -> {len(optimized)} nodes "
+                f"({len(folded)} folded, {len(removed)} pruned), "
+                f"{len(json.dumps(workflow))} -> {len(json.dumps(optimized))} bytes")
+    return optimized
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+from PIL import Image, ImageOps
+from comfy_api import get_server, upload_image
+from config import get_path, PATHS
+from utils.file_hash import hash_file
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+class InputManager:
+    """
+    Keeps ControlNet reference images in sync with one or more ComfyUI backends.
+
+    Local images live in the project's input/ folder (the same names used in the
+    input_file column of objects.csv). Each image is hashed, uploaded to a backend
+    once under a content-addressed name, and the registry remembers which hashes
+    every backend already holds so repeated jobs never re-transfer the same file.
+    Resized copies for a given generation resolution are cached on disk as well.
+    """
+
+    def __init__(self, registry_path=None, input_dir=None):
+        self.registry_path = registry_path or get_path('cache', 'input_registry.json')
+        self.input_dir = input_dir or PATHS['input']
+        self.derived_dir = get_path('cache', 'inputs')
+        self._lock = threading.Lock()
+        self.registry = self._load_registry()
+
+    def _load_registry(self):
+        try:
+            with open(self.registry_path, 'r', encoding='utf-8') as f:
+                registry = json.load(f)
+        except FileNotFoundError:
+            registry = {}
+        except json.JSONDecodeError:
+            logger.warning(f"input_manager: Registry {self.registry_path} is corrupt, starting fresh")
+            registry = {}
+        registry.setdefault('hashes', {})
+        registry.setdefault('backends', {})
+        return registry
+
+    def _save_registry(self):
+        os.makedirs(os.path.dirname(self.registry_path), exist_ok=True)
+        tmp_path = f"{self.registry_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.registry, f, indent=2)
+        os.replace(tmp_path, self.registry_path)
+
+    def resolve_local(self, filename):
+        """Return the local path of an input image, or None if it is not available locally."""
+        if os.path.isabs(filename) and os.path.isfile(filename):
+            return filename
+        path = os.path.join(self.input_dir, filename)
+        return path if os.path.isfile(path) else None
+
+    def get_hash(self, path):
+        """
+        Returns the content hash of a local file.
+        Hashes are memoized by (size, mtime) so unchanged files are never re-read.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self.registry['hashes'].get(path)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                return entry['sha256']
+
+        sha = hash_file(path)
+        with self._lock:
+            self.registry['hashes'][path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha}
+            self._save_registry()
+        return sha
+
+    @staticmethod
+    def remote_name(path, sha):
+        """Content-addressed name so two different files with the same name never collide on the server."""
+        stem, ext = os.path.splitext(os.path.basename(path))
+        return f"{stem}_{sha[:12]}{ext.lower()}"
+
+    def ensure_uploaded(self, path, server=None):
+        """
+        Uploads a local file to the backend unless the backend already holds the same content.
+
+        Parameters:
+        - path (str): Path of the local image.
+        - server (str, optional): host:port of the backend.
+
+        Returns:
+        - str: The name to set on the LoadImage node.
+        """
+        server = get_server(server)
+        sha = self.get_hash(path)
+        with self._lock:
+            known = self.registry['backends'].get(server, {}).get(sha)
+        if known:
+            logger.info(f"input_manager.ensure_uploaded: {os.path.basename(path)} already on {server} as {known}")
+            return known
+
+        remote = upload_image(path, server=server, remote_name=self.remote_name(path, sha))
+        with self._lock:
+            self.registry['backends'].setdefault(server, {})[sha] = remote
+            self._save_registry()
+        return remote
+
+    def get_resized(self, path, width, height):
+        """
+        Returns the path of a copy of the image fitted (center crop) to width x height.
+        The copy is cached by source hash and size, so it is only computed once.
+        """
+        sha = self.get_hash(path)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        derived_path = os.path.join(self.derived_dir, f"{stem}_{sha[:12]}_{width}x{height}.png")
+        if os.path.isfile(derived_path):
+            return derived_path
+
+        os.makedirs(self.derived_dir, exist_ok=True)
+        with Image.open(path) as img:
+            fitted = ImageOps.fit(img.convert('RGB'), (width, height), Image.LANCZOS)
+            fitted.save(derived_path)
+        logger.info(f"input_manager.get_resized: Cached {width}x{height} copy of {os.path.basename(path)}")
+        return derived_path
+
+    def prepare_control_image(self, filename, server=None, width=None, height=None):
+        """
+        Makes a control image available on a backend and returns the name to use in "Load Image".
+
+        If the file is not found locally it is assumed to already sit in ComfyUI's
+        input folder and the name is returned unchanged.
+
+        Parameters:
+        - filename (str): Name from the input_file column of objects.csv, or a path.
+        - server (str, optional): host:port of the backend.
+        - width, height (int, optional): If both are given, a resized copy is uploaded instead.
+        """
+        local_path = self.resolve_local(filename)
+        if local_path is None:
+            logger.warning(f"input_manager.prepare_control_image: {filename} not found in {self.input_dir}, using it as a server-side name")
+            return filename
+
+        if width and height:
+            local_path = self.get_resized(local_path, width, height)
+        return self.ensure_uploaded(local_path, server=server)
+
+    def forget_backend(self, server=None):
+        """Drop everything remembered about a backend, e.g. after its input folder was wiped."""
+        server = get_server(server)
+        with self._lock:
+            self.registry['backends'].pop(server, None)
+            self._save_registry()
+        logger.info(f"input_manager.forget_backend: Cleared upload registry for {server}")
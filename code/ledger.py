@@ -0,0 +1,79 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from config import get_path
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+_lock = threading.Lock()
+
+def ledger_path():
+    return get_path('data', 'ledger.jsonl')
+
+def record_job(job, prompt_id=None, path=None):
+    """
+    Appends one ledger line per variant of a queued job.
+
+    A packed job renders `batch_size` variants in one ComfyUI prompt. They share
+    everything except their position in the latent batch, so each variant is
+    identified by (seed, batch_index). SaveImage writes batch items in order with
+    consecutive counters, so the n-th file saved under the job's filename_prefix
+    is the variant with batch_index n.
+
+    Parameters:
+    - job (dict): Job parameters (checkpoint, loras, style, seed, filename_prefix, batch_size, ...).
+    - prompt_id (str, optional): The prompt_id returned by ComfyUI.
+    - path (str, optional): Ledger file. Defaults to data/ledger.jsonl.
+
+    Returns:
+    - list of dict: The records written.
+    """
+    path = path or ledger_path()
+    timestamp = datetime.now().isoformat()
+    records = []
+    for batch_index in range(job.get('batch_size', 1)):
+        record = dict(job)
+        record.update({'prompt_id': prompt_id, 'batch_index': batch_index, 'queued_at': timestamp})
+        records.append(record)
+
+    with _lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+    logger.info(f"ledger.record_job: Recorded {len(records)} variants for job {job.get('job_id')} (prompt {prompt_id})")
+    return records
+
+def read_ledger(path=None):
+    """Yields every ledger record, skipping lines that fail to parse (e.g. a partial last write)."""
+    path = path or ledger_path()
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def variant_for_output(records, filename_prefix, output_index):
+    """Returns the ledger record for the output_index-th image saved under filename_prefix, or None."""
+    for record in records:
+        if record.get('filename_prefix') == filename_prefix and record.get('batch_index') == output_index:
+            return record
+    return None
+
+def output_index(filename, filename_prefix):
+    """
+    Position of a saved image within its job, from SaveImage's <prefix>_<counter>_.png name.
+
+    Job prefixes are unique, so the counter starts at 1 for every job.
+
+    Returns:
+    - int or None: 0 for the first image, None if filename was not saved under filename_prefix.
+    """
+    match = re.fullmatch(re.escape(filename_prefix) + r'_(\d+)_\.\w+', os.path.basename(filename))
+    return int(match.group(1)) - 1 if match else None
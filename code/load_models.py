@@ -1,5 +1,5 @@
-import csv
 import random
+import http.client
 import json
 from datetime import datetime
 from urllib import request
@@ -17,11 +17,23 @@ from node_manipulation import (
     update_node_input
 )
 from gen_prompt import gen_positive_prompt, gen_negative_prompt
-from config import get_path
-from utils.logger_config import setup_logger
+from comfy_api import api_url, get_object_info
+from graph_optimizer import optimize_workflow
+from workflow_validator import check_workflow
+from submission import REJECTED, breaker, backoff_delay, classify_failure, quarantine_job, read_error_body
+from utils.catalog import load_table
+from utils.logger_config import configure_logging, setup_logger
 
 logger = setup_logger(__name__)
 
+def load_checkpoint_pool(pool):
+    """Return checkpoint names from models.csv matching the configured pool."""
+    models_table = load_table('models')
+    mask = models_table.select(Type='Checkpoint', Base=pool.base) & ~models_table.flag('Excluded')
+    if pool.skip_external:
+        mask &= ~models_table.equals('Location', 'External')
+    return [row['Name'] for row in models_table.rows(mask)]
+
 def assemble_loras(checkpoint, fixed_loras, lora_categories):
     """
     Assembles a list of LoRAs based on the specified checkpoint, fixed LoRAs, and category quantities.
@@ -46,27 +58,20 @@ def assemble_loras(checkpoint, fixed_loras, lora_categories):
 
     selected_loras = []
 
-    # Read all rows from CSV file first
-    with open(get_path('res', 'models.csv'), newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        all_models = list(reader)  # Store all rows in memory
+    models_table = load_table('models')
 
     # Find checkpoint and its base
-    ckpt_row = next((row for row in all_models if row['Name'] == checkpoint), None)
-    if not ckpt_row:
+    ckpt_ids = models_table.find('Name', checkpoint)
+    if not ckpt_ids:
         logger.warning(f"No checkpoint found: {checkpoint}")
         return []
 
-    base = ckpt_row['Base']
+    base = models_table.value(ckpt_ids[0], 'Base')
     logger.info(f"load_models.assemble_loras: Found checkpoint {checkpoint} with base {base}")
 
     # Filter LoRAs by base and excluded status
-    available_loras = [
-        row for row in all_models 
-        if row['Type'] == 'Lora' 
-        and row['Base'] == base 
-        and row['Excluded'] != 'Y'
-    ]
+    available_mask = models_table.select(Type='Lora', Base=base) & ~models_table.flag('Excluded')
+    available_loras = models_table.rows(available_mask)
 
     # Add fixed loras first, only add if fixed lora is in available_loras
     for lora_name in fixed_loras_list:
@@ -79,7 +84,7 @@ def assemble_loras(checkpoint, fixed_loras, lora_categories):
 
     # Add flexible loras based on categories
     for category, quantity in lora_categories.items():
-        category_models = [lora for lora in available_loras if lora['Category'] == category and lora['Excluded'].lower() != 'y']
+        category_models = models_table.rows(available_mask & models_table.equals('Category', category))
         
         if not category_models:
             logger.warning(f"No LoRAs found for category: {category}")
@@ -131,20 +136,16 @@ def get_model_params(num_loras, checkpoint=None, loras=None, embeddings=None, sk
     Returns:
     - dict: A dictionary containing the selected checkpoint and LoRAs, along with their associated recommended attributes.
     """
-    models = []
-
-    # Read the CSV file
-    with open(get_path('res', 'models.csv'), newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            models.append(row)
+    models_table = load_table('models')
 
     # Filter out Flux.1 D base models and excluded ones
-    models = [model for model in models if model['Base'] != 'Flux.1 D' and model['Excluded'] != 'Y']
+    mask = models_table.all & ~models_table.equals('Base', 'Flux.1 D') & ~models_table.flag('Excluded')
 
     # Optionally filter out external models
     if skip_external:
-        models = [model for model in models if model.get('Location', '').lower() != 'external']
+        mask &= ~models_table.matching('Location', lambda location: location.lower() == 'external')
+
+    models = models_table.rows(mask)
 
     # If checkpoint or loras are specified, use them
     selected_checkpoint = None
@@ -245,29 +246,116 @@ def load_models_into_workflow(workflow, models):
         weight = round(random.uniform(weight_from, weight_to), 1)
         set_lora(workflow, lora_node_title, lora_name, strength_model=weight)
 
-def queue_workflow(workflow):
+def store_workflow(store, workflow, prompt_id, job=None):
+    """Appends a queued graph to a (WorkflowStore, template_hash) pair. Returns the record id, None on failure."""
+    workflow_store, template_hash = store
+    meta = {'prompt_id': prompt_id}
+    if job and job.get('job_id'):
+        meta['job_id'] = job['job_id']
+    try:
+        return workflow_store.append(workflow, template_hash, meta=meta)
+    except (OSError, ValueError) as e:
+        # the job is queued either way; only its stored graph is missing
+        logger.warning(f"load_models.store_workflow: Could not store the graph of {prompt_id}: {e}")
+        return None
+
+def queue_workflow(workflow, server=None, optimize=None, validate=True, job=None, front=False, client_id=None,
+                   store=None):
+    """
+    Queues a workflow on the ComfyUI backend.
+
+    Rejected jobs (a 4xx from the backend, or local validation errors) are not
+    retried; they are written to data/quarantine.jsonl. Transient failures are
+    retried with exponential backoff. If those retries run out, submissions pause
+    until the backend answers again (see submission.CircuitBreaker), and then the
+    job gets one more round before it is quarantined.
+
+    Parameters:
+    - workflow (dict): API-format graph.
+    - server (str, optional): host:port of the backend.
+    - optimize (dict, optional): Keyword arguments for graph_optimizer.optimize_workflow
+      (prune, fold_switches, strip_meta). The graph is sent as is if omitted or all off.
+    - validate (bool): Check the graph against the backend's node definitions first.
+      An invalid graph is not sent (and not retried).
+    - job (dict, optional): Job parameters, stored with the job if it is quarantined. They are
+      also embedded in the saved PNGs as an 'automation' text chunk (see generation_index).
+    - front (bool): Put the job at the front of the backend queue (for interactive work).
+    - client_id (str, optional): Websocket client that receives the job's progress and previews.
+    - store (tuple, optional): (WorkflowStore, template_hash). Once the backend has accepted the
+      job, the graph as sent (after optimize) is appended to the store.
 
+    Returns:
+    - dict or bool: The server response (with 'prompt_id', and 'workflow_record' if stored) on
+      success, False on failure. 'prompt_id' is None if the backend accepted the job but its
+      response could not be read.
+    """
+
+    if optimize and any(optimize.values()):
+        object_info = None
+        if optimize.get('prune'):
+            try:
+                object_info = get_object_info(server)
+            except (OSError, ValueError) as e:
+                logger.warning(f"load_models.queue_workflow: No node definitions, pruning by OUTPUT_CLASSES only: {e}")
+        workflow = optimize_workflow(workflow, object_info=object_info, **optimize)
+    if validate:
+        errors = check_workflow(workflow, server)
+        if errors:
+            logger.error("load_models.queue_workflow: Workflow failed validation, not queuing it")
+            quarantine_job(workflow, 'validation', {'errors': errors}, job=job, server=server)
+            return False
     w = {"prompt": workflow}
+    if front:
+        w["front"] = True
+    if client_id:
+        w["client_id"] = client_id
+    if job:
+        # SaveImage writes each extra_pnginfo entry to its own PNG text chunk
+        w["extra_data"] = {"extra_pnginfo": {"automation": job}}
     data = json.dumps(w).encode('utf-8')
-    max_retries = 3
-    retry_delay = 5
-    
-    for attempt in range(max_retries):
+    max_retries = 4
+    attempt = 0
+    waited_for_backend = False
+
+    while True:
+        breaker.wait_until_closed(server)
         try:
-            req = request.Request("http://127.0.0.1:8188/prompt", data=data)
-            response = request.urlopen(req)
-            logger.info(f"load_models.queue_workflow: Response: {response.read().decode()}")
-            return True
-        except urllib.error.HTTPError as e:
-            logger.error(f"HTTP Error (attempt {attempt + 1}/{max_retries}): {e.code} {e.reason}")
-            print("Response:", e.read().decode())
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
+            req = request.Request(api_url("/prompt", server), data=data, headers={'Content-Type': 'application/json'})
+            with request.urlopen(req, timeout=60) as response:
+                try:
+                    body = response.read().decode()
+                    logger.info(f"load_models.queue_workflow: Response: {body}")
+                    # The response carries the prompt_id, callers can use it to track the job
+                    result = json.loads(body)
+                except (OSError, http.client.HTTPException, ValueError) as e:
+                    # The backend answered 200, so the job is queued: sending it again would run it twice
+                    logger.warning(f"load_models.queue_workflow: Job accepted but its response is unreadable, "
+                                   f"prompt_id unknown: {e!r}")
+                    result = {'prompt_id': None}
+            if store:
+                result['workflow_record'] = store_workflow(store, workflow, result.get('prompt_id'), job)
+            return result
         except Exception as e:
-            print(f"Unexpected error (attempt {attempt + 1}/{max_retries}):", str(e))
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-    return False
+            if classify_failure(e) == REJECTED:
+                if isinstance(e, urllib.error.HTTPError):
+                    reason, details = f"http {e.code}", read_error_body(e)
+                else:
+                    reason, details = type(e).__name__, {'error': str(e)}
+                logger.error(f"load_models.queue_workflow: Rejected ({reason}): {details.get('error', details)}")
+                quarantine_job(workflow, reason, details, job=job, server=server)
+                return False
+
+            attempt += 1
+            logger.warning(f"load_models.queue_workflow: Transient failure (attempt {attempt}/{max_retries}): {e}")
+            if attempt < max_retries:
+                time.sleep(backoff_delay(attempt - 1))
+                continue
+            if waited_for_backend:
+                quarantine_job(workflow, 'retries exhausted', {'error': str(e)}, job=job, server=server)
+                return False
+            breaker.trip(server)
+            waited_for_backend = True
+            attempt = 0
 
 def main():
     # Example parameters for testing
@@ -291,4 +379,5 @@ def main():
         print("No LoRAs selected")
 
 if __name__ == "__main__":
+    configure_logging()
     main()
@@ -7,7 +7,7 @@ import time
 from datetime import datetime
 from gen_prompt import gen_positive_prompt, gen_negative_prompt
 from config import get_path
-from utils.logger_config import setup_logger
+from utils.logger_config import configure_logging, setup_logger
 
 logger = setup_logger(__name__)
 
@@ -76,8 +76,8 @@ def set_KSampler(workflow, nodeTitle, seed, steps, cfg, sampler_name, scheduler,
     else:
         logger.info(f"node_manipulation.set_KSampler: Failed - Node '{nodeTitle}' not found")
 
-def set_positive_prompt(workflow, ckpt_name, lora_names, embeddings, object_type, nodeTitle="Positive", style_name=None):
-    positive_prompt = gen_positive_prompt(ckpt_name=ckpt_name, lora_names=lora_names, embeddings=embeddings, object_type=object_type, style_name=style_name)
+def set_positive_prompt(workflow, ckpt_name, lora_names, embeddings, object_type, nodeTitle="Positive", style_name=None, compact=False, max_chunks=0, template=''):
+    positive_prompt = gen_positive_prompt(ckpt_name=ckpt_name, lora_names=lora_names, embeddings=embeddings, object_type=object_type, style_name=style_name, compact=compact, max_chunks=max_chunks, template=template)
     node_id = get_node_ID(workflow, nodeTitle)
     
     if node_id is not None:
@@ -87,8 +87,8 @@ def set_positive_prompt(workflow, ckpt_name, lora_names, embeddings, object_type
     else:
         logger.info(f"node_manipulation.set_positive_prompt: Failed - Node '{nodeTitle}' not found")
 
-def set_negative_prompt(workflow, ckpt_name, lora_names, embeddings, object_type, nodeTitle="Negative", style_name=None):
-    negative_prompt = gen_negative_prompt(ckpt_name=ckpt_name, lora_names=lora_names, object_type=object_type, embeddings=embeddings, style_name=style_name)
+def set_negative_prompt(workflow, ckpt_name, lora_names, embeddings, object_type, nodeTitle="Negative", style_name=None, compact=False, max_chunks=0, template=''):
+    negative_prompt = gen_negative_prompt(ckpt_name=ckpt_name, lora_names=lora_names, object_type=object_type, embeddings=embeddings, style_name=style_name, compact=compact, max_chunks=max_chunks, template=template)
     node_id = get_node_ID(workflow, nodeTitle)
     if node_id is not None:
         workflow[node_id]['inputs']['text'] = negative_prompt
@@ -238,6 +238,57 @@ def set_resolution(workflow, nodeTitle, width, height):
         logger.info(f"node_manipulation.set_resolution: Failed - Node '{nodeTitle}' not found")
 
 
+def set_batch_size(workflow, nodeTitle, batch_size):
+    """
+    Sets the batch size of a latent node (e.g. "Empty Latent Image") in the workflow.
+
+    Parameters:
+    - workflow (dict): The workflow dictionary containing nodes.
+    - nodeTitle (str): The title of the latent node to update.
+    - batch_size (int): Number of images generated by one job.
+    """
+
+    node_id = get_node_ID(workflow, nodeTitle)
+    if node_id is not None:
+        workflow[node_id]['inputs']['batch_size'] = batch_size
+        logger.info(f"node_manipulation.set_batch_size: Successfully set batch size {batch_size} for node {nodeTitle} - {node_id}")
+    else:
+        logger.info(f"node_manipulation.set_batch_size: Failed - Node '{nodeTitle}' not found")
+
+
+def select_batch_item(workflow, nodeTitle, batch_index):
+    """
+    Makes a packed job render only one of its variants.
+
+    The first variant is the whole job at batch_size 1 (its noise is drawn first). Any
+    other variant keeps the batch-sized empty latent and gets a LatentFromBatch node in
+    front of the latent's consumers, so the sampler draws the noise of that batch position.
+
+    Parameters:
+    - workflow (dict): The workflow dictionary containing nodes.
+    - nodeTitle (str): The title of the latent node (e.g. "Empty Latent Image").
+    - batch_index (int): Position of the variant in the batch.
+    """
+    node_id = get_node_ID(workflow, nodeTitle)
+    if node_id is None:
+        logger.info(f"node_manipulation.select_batch_item: Failed - Node '{nodeTitle}' not found")
+        return
+    if batch_index == 0:
+        set_batch_size(workflow, nodeTitle, 1)
+        return
+
+    item_id = str(max(int(key) for key in workflow if key.isdigit()) + 1)
+    for node in workflow.values():
+        for input_key, value in node.get('inputs', {}).items():
+            if isinstance(value, list) and len(value) == 2 and str(value[0]) == node_id:
+                node['inputs'][input_key] = [item_id, value[1]]
+    workflow[item_id] = {
+        'inputs': {'samples': [node_id, 0], 'batch_index': batch_index, 'length': 1},
+        'class_type': 'LatentFromBatch',
+        '_meta': {'title': 'Variant'}
+    }
+    logger.info(f"node_manipulation.select_batch_item: Selected batch item {batch_index} of {nodeTitle} - {node_id}")
+
 def output_node_relationship(workflow):
     """
     Outputs the relationships between nodes in the workflow.
@@ -331,4 +382,5 @@ def main():
         json.dump(workflow, outfile, indent=4)
 
 if __name__ == "__main__":
+    configure_logging()
     main()
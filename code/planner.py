@@ -0,0 +1,259 @@
+"""
+Covering-design planner for checkpoint / style / LoRA combinations.
+
+Independent random choices need many renders before every pair of values has
+been seen together. CoveringPlanner builds a small set of jobs such that every
+t-way combination of values (every (checkpoint, style), (checkpoint, LoRA) and
+(LoRA, style) pair for strength 2) appears in at least one job. It is a greedy
+AETG-style construction: each job is the best of a few randomized candidates,
+built value by value to cover as many still-uncovered tuples as possible.
+
+Combinations that break the LoRA base rule of assemble_loras (a LoRA is only
+used with a checkpoint of the same base) are never planned or required.
+"""
+
+import argparse
+import itertools
+import random
+from utils.catalog import load_table
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+class CoveringPlanner:
+    """
+    Greedy t-way covering array generator with constraints.
+
+    Parameters:
+    - factors (dict): Factor name -> list of values, e.g. {'checkpoint': [...], 'style': [...]}.
+    - strength (int): t, the size of the value combinations to cover.
+    - is_valid (callable, optional): is_valid(assignment dict) -> bool for (partial) assignments.
+    - seed (int, optional): Seed for tie-breaking, so plans are reproducible.
+    - candidates (int): Randomized candidate jobs evaluated per emitted job.
+    """
+
+    def __init__(self, factors, strength=2, is_valid=None, seed=None, candidates=10):
+        self.names = [name for name, values in factors.items() if values]
+        self.factors = {name: list(factors[name]) for name in self.names}
+        self.strength = max(1, min(strength, len(self.names)))
+        self.is_valid = is_valid or (lambda assignment: True)
+        self.random = random.Random(seed)
+        self.candidates = candidates
+        self.uncovered = set()
+        self.by_item = {}  # (factor, value) -> uncovered tuples containing it
+        self._extendable = {}
+        for names in itertools.combinations(self.names, self.strength):
+            for values in itertools.product(*(self.factors[name] for name in names)):
+                combination = tuple(zip(names, values))
+                if self.extendable(dict(combination)):
+                    self.uncovered.add(combination)
+                    for item in combination:
+                        self.by_item.setdefault(item, set()).add(combination)
+        self.total = len(self.uncovered)
+
+    def extendable(self, assignment):
+        """True if the partial assignment is valid and can be completed into a valid job."""
+        key = tuple(assignment.get(name) for name in self.names)
+        if key in self._extendable:
+            return self._extendable[key]
+        result = False
+        if self.is_valid(assignment):
+            missing = [name for name in self.names if name not in assignment]
+            if not missing:
+                result = True
+            else:
+                name = missing[0]
+                result = any(self.extendable({**assignment, name: value}) for value in self.factors[name])
+        self._extendable[key] = result
+        return result
+
+    def tuples_of(self, assignment):
+        """The t-way tuples contained in an assignment."""
+        names = [name for name in self.names if name in assignment]
+        for subset in itertools.combinations(names, self.strength):
+            yield tuple((name, assignment[name]) for name in subset)
+
+    def completed_tuples(self, assignment, name):
+        """For each value of factor name, the uncovered tuples that adding it to assignment would complete."""
+        completed = {}
+        for item in assignment.items():
+            for combination in self.by_item.get(item, ()):
+                missing = [(n, v) for n, v in combination if assignment.get(n) != v]
+                if len(missing) == 1 and missing[0][0] == name:
+                    completed.setdefault(missing[0][1], set()).add(combination)
+        return completed
+
+    def candidate(self):
+        """
+        Builds one job greedily, choosing factors in random order. Each factor gets the
+        value that completes the most uncovered tuples, then the one in most uncovered
+        tuples overall, ties broken at random.
+        """
+        order = self.names[:]
+        self.random.shuffle(order)
+        assignment = {}
+        for name in order:
+            completed = self.completed_tuples(assignment, name)
+            ranked = sorted(self.factors[name], reverse=True,
+                            key=lambda value: (len(completed.get(value, ())),
+                                               len(self.by_item.get((name, value), ())),
+                                               self.random.random()))
+            best = next((value for value in ranked if self.extendable({**assignment, name: value})), None)
+            if best is None:
+                return None
+            assignment[name] = best
+        return assignment
+
+    def seeded_candidate(self):
+        """Fallback: completes an arbitrary uncovered tuple, which always makes progress."""
+        assignment = dict(next(iter(self.uncovered)))
+        for name in self.names:
+            if name not in assignment:
+                assignment[name] = next(value for value in self.factors[name]
+                                        if self.extendable({**assignment, name: value}))
+        return assignment
+
+    def mark_covered(self, assignment):
+        covered = 0
+        for combination in self.tuples_of(assignment):
+            if combination in self.uncovered:
+                self.uncovered.remove(combination)
+                covered += 1
+                for item in combination:
+                    self.by_item[item].discard(combination)
+        return covered
+
+    def plan(self):
+        """
+        Yields assignments (factor -> value) until every coverable tuple is covered.
+        """
+        emitted = 0
+        while self.uncovered:
+            best, best_gain = None, 0
+            for _ in range(self.candidates):
+                assignment = self.candidate()
+                if assignment is None:
+                    continue
+                gain = sum(1 for combination in self.tuples_of(assignment) if combination in self.uncovered)
+                if gain > best_gain:
+                    best, best_gain = assignment, gain
+            if best is None:
+                best = self.seeded_candidate()
+            self.mark_covered(best)
+            emitted += 1
+            if emitted % 100 == 0:
+                logger.info(f"planner.plan: {emitted} jobs, {self.total - len(self.uncovered)}/{self.total} tuples covered")
+            yield best
+        logger.info(f"planner.plan: Covered all {self.total} {self.strength}-way tuples with {emitted} jobs")
+
+def lora_pool(checkpoints, categories=None):
+    """
+    LoRAs usable with at least one of the checkpoints, with the bases from models.csv.
+
+    Parameters:
+    - checkpoints (list of str): Checkpoint names.
+    - categories (iterable of str, optional): Only LoRAs from these categories.
+
+    Returns:
+    - tuple: (list of LoRA names, {model name: base} for checkpoints and LoRAs)
+    """
+    models_table = load_table('models')
+    bases = {}
+    for name in checkpoints:
+        row = models_table.find_row('Name', name, Type='Checkpoint')
+        if row:
+            bases[name] = row['Base']
+
+    mask = models_table.equals('Type', 'Lora') & ~models_table.flag('Excluded')
+    mask &= models_table.matching('Base', lambda base: base in set(bases.values()))
+    # Bases of every usable LoRA (fixed LoRAs may come from any category)
+    for row in models_table.rows(mask):
+        bases[row['Name']] = row['Base']
+    if categories:
+        mask &= models_table.matching('Category', lambda category: category in set(categories))
+    loras = [row['Name'] for row in models_table.rows(mask)]
+    return loras, bases
+
+def plan_jobs(checkpoints, styles=None, loras=None, bases=None, strength=2, fixed_loras=None, seed=None):
+    """
+    Streams job specs covering every t-way combination of checkpoint, style and LoRA.
+
+    Parameters:
+    - checkpoints (list of str): Checkpoint names.
+    - styles (list of str, optional): Style names. Leave empty to plan without styles.
+    - loras (list of str, optional): LoRA names. Leave empty to plan without LoRAs.
+    - bases (dict, optional): Model name -> base, for the LoRA base rule.
+    - strength (int): Covering strength t.
+    - fixed_loras (list of str, optional): Added to every job whose checkpoint base they match
+      (so their bases must be in bases).
+    - seed (int, optional): Makes the plan reproducible.
+
+    Yields:
+    - dict: {'plan_index', 'checkpoint', 'style', 'loras'}
+    """
+    bases = bases or {}
+    fixed_loras = fixed_loras or []
+
+    def is_valid(assignment):
+        checkpoint, lora = assignment.get('checkpoint'), assignment.get('lora')
+        if checkpoint is None or lora is None:
+            return True
+        return bases.get(checkpoint) == bases.get(lora)
+
+    planner = CoveringPlanner({'checkpoint': checkpoints, 'style': styles or [], 'lora': loras or []},
+                              strength=strength, is_valid=is_valid, seed=seed)
+    for index, assignment in enumerate(planner.plan()):
+        checkpoint = assignment['checkpoint']
+        job_loras = [lora for lora in fixed_loras if bases.get(lora) == bases.get(checkpoint)]
+        if assignment.get('lora') and assignment['lora'] not in job_loras:
+            job_loras.append(assignment['lora'])
+        yield {
+            'plan_index': index,
+            'checkpoint': checkpoint,
+            'style': assignment.get('style'),
+            'loras': job_loras
+        }
+
+def plan_factors(cfg, checkpoints):
+    """
+    The styles, LoRAs and model bases a run config plans over.
+
+    Returns:
+    - tuple: (style names, LoRA names, {model name: base})
+    """
+    styles_table = load_table('art_styles')
+    styles = [row['name'] for row in styles_table.rows(styles_table.flag('included'))] if cfg.use_art_style else []
+    loras, bases = lora_pool(checkpoints, cfg.lora_categories.keys())
+    return styles, loras, bases
+
+def plan_specs(cfg, checkpoints, strength=None):
+    """plan_jobs() for a run config: its styles, LoRA categories, fixed LoRAs and plan settings."""
+    styles, loras, bases = plan_factors(cfg, checkpoints)
+    return plan_jobs(checkpoints, styles, loras, bases, strength=strength or cfg.plan.strength,
+                     fixed_loras=cfg.fixed_loras, seed=cfg.plan.seed)
+
+def main():
+    from load_models import load_checkpoint_pool
+    from utils.config_loader import ConfigLoader
+
+    parser = argparse.ArgumentParser(description="Plan a covering set of checkpoint/style/LoRA jobs")
+    parser.add_argument('config', nargs='?', default='randomizer_controlnet', help="Workflow config name")
+    parser.add_argument('--strength', type=int, default=None, help="Covering strength (default: from config)")
+    parser.add_argument('--show', type=int, default=10, help="Print the first N jobs")
+    args = parser.parse_args()
+
+    cfg = ConfigLoader().get_run_config(args.config)
+    checkpoints = load_checkpoint_pool(cfg.checkpoint_pool)
+    styles, loras, _ = plan_factors(cfg, checkpoints)
+    strength = args.strength or cfg.plan.strength
+
+    jobs = list(plan_specs(cfg, checkpoints, strength=strength))
+    for job in jobs[:args.show]:
+        print(job)
+    random_combinations = len(checkpoints) * max(len(styles), 1) * max(len(loras), 1)
+    print(f"{len(jobs)} jobs cover all {strength}-way combinations "
+          f"({len(checkpoints)} checkpoints, {len(styles)} styles, {len(loras)} LoRAs; {random_combinations} full combinations)")
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
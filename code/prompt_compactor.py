@@ -0,0 +1,210 @@
+"""
+Deduplicates and trims the comma-separated prompts built by gen_prompt.
+
+Object, trigger, style and quality strings overlap a lot (most style negatives
+repeat "bad quality, low quality, ..."), and every 75 CLIP tokens beyond the
+first chunk cost another text-encoder pass. compact_prompt() normalizes and
+deduplicates terms across the parts of a prompt, and optionally drops terms from
+the lowest-priority parts until the prompt fits a number of CLIP chunks.
+
+Token counts use CLIP's BPE merges when a merges file is available: res/
+bpe_simple_vocab_16e6.txt.gz (OpenAI CLIP), res/merges.txt, or ComfyUI's own
+comfy/sd1_tokenizer/merges.txt. Without one, a per-word heuristic is used.
+"""
+
+import gzip
+import math
+import os
+import re
+from functools import lru_cache
+from config import get_path
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+TOKENS_PER_CHUNK = 75  # 77 minus the start and end tokens
+# Number of merges in the CLIP vocabulary (49152 tokens - 256 bytes - 256 byte+</w> - 2 special)
+CLIP_MERGES = 49152 - 256 - 2
+
+# Trimming order: parts with a lower number are kept longest
+PRIORITY = {'trigger': 0, 'object': 1, 'style': 2, 'quality': 3}
+
+WEIGHT_PATTERN = re.compile(r':\s*-?\d+(?:\.\d+)?\s*\)')
+WORD_PATTERN = re.compile(r"'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|[^\s\w]+|_+", re.IGNORECASE)
+
+def bytes_to_unicode():
+    """CLIP's reversible byte -> printable character table."""
+    printable = list(range(ord('!'), ord('~') + 1)) + list(range(ord('¡'), ord('¬') + 1)) + list(range(ord('®'), ord('ÿ') + 1))
+    chars = printable[:]
+    extra = 0
+    for b in range(256):
+        if b not in printable:
+            printable.append(b)
+            chars.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, map(chr, chars)))
+
+def find_merges_file():
+    """Returns the first available CLIP merges file, or None."""
+    candidates = [get_path('res', 'bpe_simple_vocab_16e6.txt.gz'), get_path('res', 'merges.txt')]
+    comfyui_path = os.path.expanduser(os.environ.get('COMFYUI_PATH', '~/ComfyUI'))
+    candidates.append(os.path.join(comfyui_path, 'comfy', 'sd1_tokenizer', 'merges.txt'))
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+class ClipTokenCounter:
+    """
+    Counts CLIP tokens with the BPE merge ranks of the CLIP text encoder.
+    Only counts are needed, so the token -> id vocabulary is not loaded.
+    """
+
+    def __init__(self, merges_path):
+        opener = gzip.open if merges_path.endswith('.gz') else open
+        with opener(merges_path, 'rt', encoding='utf-8') as f:
+            lines = f.read().split('\n')
+        # Both file formats start with a version header line
+        merges = [tuple(line.split()) for line in lines[1:CLIP_MERGES + 1] if line.strip()]
+        self.bpe_ranks = {merge: rank for rank, merge in enumerate(merges)}
+        self.byte_encoder = bytes_to_unicode()
+
+    @lru_cache(maxsize=65536)
+    def bpe_length(self, token):
+        """Number of BPE pieces one pre-tokenized word is split into."""
+        word = tuple(token[:-1]) + (token[-1] + '</w>',)
+        while len(word) > 1:
+            pairs = {(word[i], word[i + 1]) for i in range(len(word) - 1)}
+            best = min(pairs, key=lambda pair: self.bpe_ranks.get(pair, float('inf')))
+            if best not in self.bpe_ranks:
+                break
+            first, second = best
+            merged = []
+            i = 0
+            while i < len(word):
+                if i < len(word) - 1 and word[i] == first and word[i + 1] == second:
+                    merged.append(first + second)
+                    i += 2
+                else:
+                    merged.append(word[i])
+                    i += 1
+            word = tuple(merged)
+        return len(word)
+
+    def count(self, text):
+        total = 0
+        for piece in WORD_PATTERN.findall(text.lower()):
+            encoded = ''.join(self.byte_encoder[b] for b in piece.encode('utf-8'))
+            total += self.bpe_length(encoded)
+        return total
+
+def heuristic_count(text):
+    """Rough CLIP token estimate: common words are one token, long words split every ~6 characters."""
+    total = 0
+    for piece in WORD_PATTERN.findall(text.lower()):
+        if piece[0].isalpha():
+            total += 1 + (len(piece) - 1) // 6
+        else:
+            total += len(piece)
+    return total
+
+_counter = {'loaded': False, 'instance': None}
+
+def get_counter():
+    if not _counter['loaded']:
+        _counter['loaded'] = True
+        path = find_merges_file()
+        if path:
+            _counter['instance'] = ClipTokenCounter(path)
+            logger.info(f"prompt_compactor: Counting tokens with CLIP merges from {path}")
+        else:
+            logger.info("prompt_compactor: No CLIP merges file found, estimating token counts")
+    return _counter['instance']
+
+def strip_weights(term):
+    """'(red hair:1.2)' -> 'red hair'; weight syntax is removed before tokenization."""
+    return WEIGHT_PATTERN.sub(')', term).replace('(', ' ').replace(')', ' ')
+
+@lru_cache(maxsize=16384)
+def count_tokens(term):
+    counter = get_counter()
+    text = strip_weights(term)
+    return counter.count(text) if counter else heuristic_count(text)
+
+def split_terms(text):
+    """Splits a prompt at top-level commas (commas inside parentheses stay in their term)."""
+    terms, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(depth - 1, 0)
+        elif char == ',' and depth == 0:
+            terms.append(text[start:i])
+            start = i + 1
+    terms.append(text[start:])
+    return [' '.join(term.split()) for term in terms if term.strip()]
+
+def term_key(term):
+    """Comparison key: case, spacing and weights do not make a term different."""
+    return ' '.join(strip_weights(term).lower().split())
+
+def prompt_tokens(terms):
+    """Token count of terms joined with ', ' (each comma is one token)."""
+    return sum(count_tokens(term) for term in terms) + max(len(terms) - 1, 0)
+
+@lru_cache(maxsize=1024)
+def compact_terms(parts, max_chunks=0):
+    """
+    Deduplicates and (optionally) trims a prompt given as ordered parts.
+
+    Parameters:
+    - parts (tuple): ((kind, text), ...) in output order; kind is a key of PRIORITY.
+    - max_chunks (int): CLIP chunk budget, 0 for no trimming.
+
+    Returns:
+    - str: The compacted, comma-separated prompt.
+    """
+    # Dedupe in priority order so a term repeated by a style keeps its trigger position
+    seen = set()
+    kept = {}
+    for index in sorted(range(len(parts)), key=lambda i: PRIORITY.get(parts[i][0], len(PRIORITY))):
+        terms = []
+        for term in split_terms(parts[index][1] or ''):
+            key = term_key(term)
+            if key and key not in seen:
+                seen.add(key)
+                terms.append(term)
+        kept[index] = terms
+
+    if max_chunks:
+        budget = max_chunks * TOKENS_PER_CHUNK
+        trim_order = sorted(range(len(parts)), key=lambda i: PRIORITY.get(parts[i][0], len(PRIORITY)), reverse=True)
+        total = prompt_tokens([term for i in range(len(parts)) for term in kept[i]])
+        for index in trim_order:
+            if total <= budget or PRIORITY.get(parts[index][0]) == 0:
+                break
+            while kept[index] and total > budget:
+                kept[index].pop()
+                total = prompt_tokens([term for i in range(len(parts)) for term in kept[i]])
+
+    return ', '.join(term for i in range(len(parts)) for term in kept[i])
+
+def compact_prompt(parts, max_chunks=0):
+    """
+    Compacts a prompt and logs the token saving.
+
+    Parameters:
+    - parts (list): [(kind, text), ...] in output order, kinds 'trigger', 'object', 'style', 'quality'.
+    - max_chunks (int): CLIP chunk budget, 0 for no trimming. Triggers are never trimmed.
+
+    Returns:
+    - str: The compacted prompt.
+    """
+    parts = tuple((kind, text or '') for kind, text in parts)
+    compacted = compact_terms(parts, max_chunks)
+    before = prompt_tokens([term for _, text in parts for term in split_terms(text)])
+    after = prompt_tokens(split_terms(compacted))
+    logger.info(f"prompt_compactor.compact_prompt: {before} -> {after} tokens "
+                f"({math.ceil(before / TOKENS_PER_CHUNK)} -> {math.ceil(after / TOKENS_PER_CHUNK)} chunks)")
+    return compacted
@@ -0,0 +1,442 @@
+"""
+Prompt templates with alternatives, weights, wildcard files and catalog references.
+
+Syntax:
+- {a|b|c}            one of the alternatives, uniformly
+- {3::a|1::b}        weighted alternatives (weights default to 1)
+- {2$$a|b|c}         two different alternatives, joined with ", "; {1-3$$...} picks 1 to 3
+- __name__           one line of res/wildcards/name.txt (subfolders: __hair/color__)
+- __table.column__   the column of a random catalog row, e.g. __objects.positive_prompt[type=target]__
+                     or __art_styles.positive_prompt[included]__
+- ${style.positive}  a field of the context passed when sampling
+- \\{ \\| \\} \\$ \\_    literal characters
+
+Wildcard files hold one alternative per line. Lines may use the syntax above,
+including other wildcards, and may start with a weight ("3::foggy harbour").
+Empty lines and lines starting with # are ignored.
+
+A template is parsed once into a tree of sampler functions (compile_template()
+caches it), so sampling is only random draws and string joins. Draws come from
+the rng passed in, so a random.Random(seed) reproduces the same prompts.
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+from bisect import bisect
+from functools import lru_cache
+from config import get_path
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+WILDCARD_DIR = get_path('res', 'wildcards')
+
+WEIGHT_PATTERN = re.compile(r'\s*(\d+(?:\.\d+)?)\s*::')
+COUNT_PATTERN = re.compile(r'\s*(\d+)(?:\s*-\s*(\d+))?\s*\$\$')
+WILDCARD_PATTERN = re.compile(r'__([A-Za-z0-9_./-]+?(?:\[[^\]]*\])?)__')
+REFERENCE_PATTERN = re.compile(r'\$\{([A-Za-z_]\w*(?:\.\w+)*)\}')
+EMPTY_TERMS_PATTERN = re.compile(r',(\s*,)+')
+
+# The fixed concatenation of gen_prompt.gen_positive_prompt / gen_negative_prompt as templates
+DEFAULT_POSITIVE = "${object.positive}, ${triggers.positive}, ${style.positive}, masterpiece, best quality, ultra-detailed"
+DEFAULT_NEGATIVE = "${triggers.negative}, ${style.negative}, watermark, bad quality, low quality, low resolution, ${object.negative}"
+
+class TemplateError(ValueError):
+    """Raised for malformed templates, unknown wildcards and missing context fields."""
+
+def constant(text):
+    return lambda rng, context: text
+
+def join_parts(parts):
+    """Merges adjacent literal parts and returns one sampler for the sequence."""
+    merged = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        else:
+            merged.append(part)
+    if not merged:
+        return ''
+    if len(merged) == 1:
+        return merged[0]
+    samplers = tuple(constant(part) if isinstance(part, str) else part for part in merged)
+    return lambda rng, context: ''.join([sampler(rng, context) for sampler in samplers])
+
+def choice_sampler(options, weights):
+    """
+    Sampler that picks one option.
+
+    Parameters:
+    - options (list): Literal strings or sampler functions.
+    - weights (list of float): One weight per option.
+
+    Returns:
+    - str or function: The option itself when there is only one, otherwise a sampler.
+    """
+    if len(options) == 1:
+        return options[0]
+    literal = all(isinstance(option, str) for option in options)
+    options = tuple(options)
+    count = len(options)
+    if len(set(weights)) == 1:
+        if literal:
+            return lambda rng, context: options[int(rng.random() * count)]
+        samplers = tuple(constant(option) if isinstance(option, str) else option for option in options)
+        return lambda rng, context: samplers[int(rng.random() * count)](rng, context)
+
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    # guards against rng.random() * total rounding up to total
+    last = count - 1
+    if literal:
+        return lambda rng, context: options[min(bisect(cumulative, rng.random() * total), last)]
+    samplers = tuple(constant(option) if isinstance(option, str) else option for option in options)
+    return lambda rng, context: samplers[min(bisect(cumulative, rng.random() * total), last)](rng, context)
+
+def multi_choice_sampler(options, weights, low, high):
+    """Sampler that picks low..high different options and joins them with ", "."""
+    samplers = tuple(constant(option) if isinstance(option, str) else option for option in options)
+    weights = tuple(weights)
+    high = min(high, len(samplers))
+    low = min(low, high)
+
+    def sample(rng, context):
+        count = low if low == high else low + int(rng.random() * (high - low + 1))
+        remaining = list(range(len(samplers)))
+        picked = []
+        for _ in range(count):
+            total = sum(weights[i] for i in remaining)
+            target = rng.random() * total
+            for position, index in enumerate(remaining):
+                target -= weights[index]
+                if target < 0:
+                    break
+            picked.append(samplers[remaining.pop(position)](rng, context))
+        return ', '.join(part for part in picked if part)
+    return sample
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value if item)
+    return str(value)
+
+def reference_sampler(path):
+    """Sampler that reads a dotted field (style.positive) from the sampling context."""
+    keys = tuple(path.split('.'))
+
+    def sample(rng, context):
+        value = context
+        for key in keys:
+            try:
+                value = value[key]
+            except (KeyError, TypeError, IndexError):
+                raise TemplateError(f"${{{path}}}: {key!r} is not in the prompt context") from None
+        return format_value(value)
+    return sample
+
+def parse_catalog_filter(text):
+    """'type=target,included' -> [('type', 'target'), ('included', None)]"""
+    conditions = []
+    for condition in filter(None, (part.strip() for part in text.split(','))):
+        column, _, value = condition.partition('=')
+        conditions.append((column.strip(), value.strip() if _ else None))
+    return conditions
+
+def catalog_options(name):
+    """
+    Alternatives of a catalog wildcard such as objects.positive_prompt[type=target].
+
+    Every matching row is one alternative, so rows are drawn uniformly, like get_object().
+    Conditions compare case-insensitively; a condition without a value is a flag column.
+
+    Returns:
+    - list of str: The column values, or None if name is not a catalog wildcard.
+    """
+    from utils.catalog import TABLES, load_table
+
+    match = re.fullmatch(r'([A-Za-z_]+)\.([A-Za-z_]+)(?:\[([^\]]*)\])?', name)
+    if not match or match.group(1) not in TABLES:
+        return None
+    table_name, column, conditions = match.groups()
+    table = load_table(table_name)
+    if column not in table.fieldnames:
+        raise TemplateError(f"__{name}__: {table_name} has no column {column!r}")
+
+    mask = table.all
+    for condition_column, value in parse_catalog_filter(conditions or ''):
+        if condition_column not in table.fieldnames:
+            raise TemplateError(f"__{name}__: {table_name} has no column {condition_column!r}")
+        if value is None:
+            if condition_column in table.flags:
+                mask &= table.flag(condition_column)
+            else:
+                mask &= sum(1 << i for i in range(table.size) if table.value(i, condition_column).strip().lower() == 'y')
+        elif condition_column in table.categories:
+            mask &= table.matching(condition_column, lambda category: category.lower() == value.lower())
+        else:
+            mask &= sum(1 << i for i in range(table.size) if table.value(i, condition_column).lower() == value.lower())
+    return [row[column] for row in table.rows(mask)]
+
+class TemplateCompiler:
+    """
+    Parses template text into sampler functions.
+
+    Parameters:
+    - wildcard_dir (str): Folder of the wildcard .txt files.
+    """
+
+    def __init__(self, wildcard_dir=WILDCARD_DIR):
+        self.wildcard_dir = wildcard_dir
+        self.wildcards = {}
+        self.loading = []
+        self.references = {}  # ${...} paths in the template and its wildcard files, in order
+
+    def compile(self, text):
+        part, position = self.parse_sequence(text, 0, nested=False)
+        if position < len(text):
+            raise TemplateError(f"Unexpected {text[position]!r} at position {position} in {text!r}")
+        return part
+
+    def parse_sequence(self, text, position, nested):
+        """Parses until the end of text or, inside {...}, an unescaped | or }."""
+        parts = []
+        literal = []
+        length = len(text)
+        while position < length:
+            char = text[position]
+            if char == '\\' and position + 1 < length:
+                literal.append(text[position + 1])
+                position += 2
+                continue
+            if nested and char in '|}':
+                break
+            if char == '{':
+                part, position = self.parse_choice(text, position + 1)
+            elif char == '$' and text.startswith('${', position):
+                match = REFERENCE_PATTERN.match(text, position)
+                if not match:
+                    raise TemplateError(f"Malformed reference at position {position} in {text!r}")
+                self.references[match.group(1)] = None
+                part, position = reference_sampler(match.group(1)), match.end()
+            elif char == '_' and text.startswith('__', position) and WILDCARD_PATTERN.match(text, position):
+                match = WILDCARD_PATTERN.match(text, position)
+                part, position = self.wildcard(match.group(1)), match.end()
+            else:
+                literal.append(char)
+                position += 1
+                continue
+            if literal:
+                parts.append(''.join(literal))
+                literal = []
+            parts.append(part)
+        if literal:
+            parts.append(''.join(literal))
+        return join_parts(parts), position
+
+    def parse_option(self, text, position, nested=True):
+        """An alternative with an optional "weight::" prefix."""
+        weight = 1.0
+        match = WEIGHT_PATTERN.match(text, position)
+        if match:
+            weight = float(match.group(1))
+            position = match.end()
+        part, position = self.parse_sequence(text, position, nested)
+        return part, weight, position
+
+    def parse_choice(self, text, position):
+        """Parses the inside of {...}; position is just after the {."""
+        low = high = None
+        match = COUNT_PATTERN.match(text, position)
+        if match:
+            low = int(match.group(1))
+            high = int(match.group(2) or low)
+            if high < low:
+                raise TemplateError(f"Empty pick range {low}-{high} in {text!r}")
+            position = match.end()
+
+        options, weights = [], []
+        while True:
+            part, weight, position = self.parse_option(text, position)
+            options.append(part)
+            weights.append(weight)
+            if position >= len(text):
+                raise TemplateError(f"Unclosed {{ in {text!r}")
+            position += 1
+            if text[position - 1] == '}':
+                break
+        if not any(weights):
+            raise TemplateError(f"All alternatives have weight 0 in {text!r}")
+        if low is not None:
+            return multi_choice_sampler(options, weights, low, high), position
+        return choice_sampler(options, weights), position
+
+    def wildcard(self, name):
+        """Compiles a wildcard file (or catalog column) once per compiler."""
+        if name in self.wildcards:
+            return self.wildcards[name]
+        if name in self.loading:
+            raise TemplateError(f"Wildcard cycle: {' -> '.join(self.loading + [name])}")
+
+        path = os.path.join(self.wildcard_dir, *name.split('/')) + '.txt'
+        if os.path.isfile(path):
+            self.loading.append(name)
+            try:
+                options, weights = [], []
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line or line.startswith('#'):
+                            continue
+                        part, weight, position = self.parse_option(line, 0, nested=False)
+                        options.append(part)
+                        weights.append(weight)
+            finally:
+                self.loading.pop()
+            if not options:
+                raise TemplateError(f"Wildcard file {path} has no alternatives")
+        else:
+            options = catalog_options(name)
+            if options is None:
+                raise TemplateError(f"Unknown wildcard __{name}__: no file {path} and not a catalog column")
+            if not options:
+                logger.warning(f"prompt_template.wildcard: No catalog rows match __{name}__")
+                options = ['']
+            weights = [1.0] * len(options)
+
+        sampler = choice_sampler(options, weights)
+        self.wildcards[name] = sampler
+        return sampler
+
+def clean_prompt(text):
+    """Drops the empty terms left by empty alternatives or fields: "a, , b," -> "a, b"."""
+    return EMPTY_TERMS_PATTERN.sub(',', text).strip().strip(',').strip()
+
+class PromptTemplate:
+    """
+    A compiled template.
+
+    Parameters:
+    - text (str): The template source.
+    - root (str or function): The compiled sampler tree.
+    - references (tuple of str): The ${...} paths it reads from the context.
+    """
+
+    def __init__(self, text, root, references=()):
+        self.text = text
+        self.root = root
+        self.references = tuple(references)
+
+    def check_references(self, fields):
+        """
+        Checks the ${...} paths against the shape of the context the template will be sampled with.
+
+        Parameters:
+        - fields (dict): Context keys, nested dicts for dotted paths and None for values.
+
+        Raises:
+        - TemplateError: For a path the context does not have, or one that ends at a group of fields.
+        """
+        for path in self.references:
+            node = fields
+            for key in path.split('.'):
+                if not isinstance(node, dict) or key not in node:
+                    raise TemplateError(f"${{{path}}}: {key!r} is not in the prompt context")
+                node = node[key]
+            if isinstance(node, dict):
+                raise TemplateError(f"${{{path}}} is a group of fields, use one of: {', '.join(node)}")
+
+    def sample(self, context=None, rng=random):
+        """
+        Draws one prompt.
+
+        Parameters:
+        - context (dict): Values for ${...} references, nested dicts for dotted paths.
+        - rng (random.Random): Source of the draws; the random module by default.
+
+        Returns:
+        - str: The prompt, without empty comma-separated terms.
+        """
+        if isinstance(self.root, str):
+            return clean_prompt(self.root)
+        return clean_prompt(self.root(rng, context or {}))
+
+    def expand(self, count, seed=None, context=None):
+        """Yields count prompts drawn from a random.Random(seed)."""
+        rng = random.Random(seed)
+        for _ in range(count):
+            yield self.sample(context, rng)
+
+@lru_cache(maxsize=256)
+def compile_template(text, wildcard_dir=WILDCARD_DIR):
+    """
+    Parses a template once; later calls with the same text reuse the compiled tree.
+
+    Wildcard files are read at compile time, so call compile_template.cache_clear()
+    after editing them in a running process.
+
+    Raises:
+    - TemplateError: For syntax errors, unknown wildcards and wildcard cycles.
+    """
+    compiler = TemplateCompiler(wildcard_dir)
+    root = compiler.compile(text)
+    return PromptTemplate(text, root, compiler.references)
+
+def render(template, context=None, rng=random):
+    """Compiles (cached) and samples a template in one call."""
+    return compile_template(template).sample(context, rng)
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand a prompt template")
+    parser.add_argument('template', help="Template text, or @file to read it from a file")
+    parser.add_argument('-n', '--count', type=int, default=5, help="Number of prompts to print")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--set', action='append', default=[], metavar='PATH=VALUE',
+                        help="Context field for ${...} references, e.g. --set style.positive='oil painting'")
+    parser.add_argument('--bench', type=int, default=0, metavar='N', help="Time N samples instead of printing")
+    args = parser.parse_args()
+
+    text = args.template
+    if text.startswith('@'):
+        with open(text[1:], encoding='utf-8') as f:
+            text = f.read().strip()
+
+    context = {}
+    for assignment in args.set:
+        path, _, value = assignment.partition('=')
+        target = context
+        keys = path.split('.')
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+
+    try:
+        template = compile_template(text)
+    except TemplateError as e:
+        logger.error(f"prompt_template.main: {e}")
+        return 1
+
+    if args.bench:
+        rng = random.Random(args.seed)
+        start = time.perf_counter()
+        for _ in range(args.bench):
+            template.sample(context, rng)
+        elapsed = time.perf_counter() - start
+        print(f"{args.bench} prompts in {elapsed:.2f}s ({args.bench / elapsed * 60:,.0f} per minute)")
+        return 0
+
+    for prompt in template.expand(args.count, args.seed, context):
+        print(prompt)
+    return 0
+
+if __name__ == "__main__":
+    configure_logging()
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Quality gate in front of the upscale queue.
+
+A 4K upscale of a blurry, blank or washed-out base image costs as much as one of
+a good image. gate_images() loads each image at reduced resolution (JPEG draft
+mode, Image.reduce for PNG), computes the metrics in utils.image_metrics
+(Laplacian variance, entropy, clipping ratio, saturation) in a process pool and
+splits the images into passing and rejected ones. Results are appended to
+data/quality_gate.jsonl so thresholds can be tuned against real runs.
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from PIL import Image
+from config import get_path
+from utils.image_metrics import compute_metrics
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+ANALYSIS_SIZE = 256
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+# Metric -> (comparison, limit). Saturation is off by default: black and white styles would fail it.
+DEFAULT_THRESHOLDS = {
+    'laplacian_variance': ('min', 25.0),
+    'entropy': ('min', 5.0),
+    'clipping_ratio': ('max', 0.3),
+    'saturation': ('min', 0.0),
+}
+
+def load_reduced(path, size=ANALYSIS_SIZE):
+    """Loads an image as an RGB array with its shorter side near `size`, decoding as little as possible."""
+    with Image.open(path) as image:
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale directly
+        image.draft('RGB', (size, size))
+        factor = max(1, min(image.size) // size)
+        if factor > 1:
+            image = image.reduce(factor)
+        return np.asarray(image.convert('RGB'))
+
+def check_metrics(metrics, thresholds):
+    """Returns the list of failed checks, e.g. ['entropy 3.10 < 5.0']."""
+    failures = []
+    for name, (comparison, limit) in thresholds.items():
+        value = metrics.get(name)
+        if value is None:
+            continue
+        if comparison == 'min' and value < limit:
+            failures.append(f"{name} {value:.2f} < {limit}")
+        elif comparison == 'max' and value > limit:
+            failures.append(f"{name} {value:.2f} > {limit}")
+    return failures
+
+def evaluate_image(path, thresholds=None):
+    """
+    Scores one image. Runs in worker processes, so it only takes and returns plain data.
+
+    Returns:
+    - dict: {'path', 'passed', 'metrics', 'failures'}; unreadable images fail.
+    """
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    try:
+        metrics = compute_metrics(load_reduced(path))
+    except (OSError, ValueError) as e:
+        return {'path': path, 'passed': False, 'metrics': {}, 'failures': [f"unreadable: {e}"]}
+    failures = check_metrics(metrics, thresholds)
+    return {'path': path, 'passed': not failures, 'metrics': metrics, 'failures': failures}
+
+def _evaluate(args):
+    return evaluate_image(*args)
+
+def gate_images(paths, thresholds=None, workers=None, log_path=None):
+    """
+    Evaluates images in parallel and splits them by the thresholds.
+
+    Parameters:
+    - paths (list of str): Image files.
+    - thresholds (dict, optional): Metric -> ('min' | 'max', limit). Defaults to DEFAULT_THRESHOLDS.
+    - workers (int, optional): Worker processes (default: CPU count).
+    - log_path (str, optional): Results log, default data/quality_gate.jsonl.
+
+    Returns:
+    - tuple: (passed results, rejected results)
+    """
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    if not paths:
+        return [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_evaluate, [(path, thresholds) for path in paths],
+                                    chunksize=max(1, len(paths) // (4 * (workers or os.cpu_count() or 1)))))
+
+    log_path = log_path or get_path('data', 'quality_gate.jsonl')
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    timestamp = datetime.now().isoformat()
+    with open(log_path, 'a', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps({**result, 'checked_at': timestamp}) + '\n')
+
+    passed = [r for r in results if r['passed']]
+    rejected = [r for r in results if not r['passed']]
+    for result in rejected:
+        logger.info(f"quality_gate: Rejected {os.path.basename(result['path'])}: {', '.join(result['failures'])}")
+    logger.info(f"quality_gate.gate_images: {len(passed)} passed, {len(rejected)} rejected")
+    return passed, rejected
+
+def main():
+    parser = argparse.ArgumentParser(description="Score images with the quality gate without moving them")
+    parser.add_argument('directory', help="Folder with images")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    paths = [os.path.join(args.directory, name) for name in sorted(os.listdir(args.directory))
+             if name.lower().endswith(IMAGE_EXTENSIONS)]
+    passed, rejected = gate_images(paths, workers=args.workers)
+    for result in passed + rejected:
+        metrics = ', '.join(f"{k}={v:.2f}" for k, v in result['metrics'].items())
+        print(f"{'PASS' if result['passed'] else 'FAIL'} {os.path.basename(result['path'])}: {metrics}")
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
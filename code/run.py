@@ -1,10 +1,10 @@
-import csv
 import random
-import json
 from datetime import datetime
 from urllib import request
 import urllib.error
 import time
+import uuid
+from dataclasses import asdict
 from node_manipulation import (
     set_number_of_loras, 
     set_lora,
@@ -15,96 +15,130 @@ from node_manipulation import (
     set_negative_prompt,
     update_node_input,
     update_vae_input,
-    set_node_value
+    set_node_value,
+    set_batch_size
 )
 from gen_prompt import gen_positive_prompt, gen_negative_prompt, get_object
 from load_models import (
     get_model_params,
     load_models_into_workflow,
-    queue_workflow,
-    assemble_loras
+    assemble_loras,
+    load_checkpoint_pool
 )
-from config import get_path
-from utils.logger_config import setup_logger
+from input_manager import InputManager
+from workflow_compiler import load_workflow
+from ledger import record_job
+from workflow_store import WorkflowStore
+from scheduler import BULK, Scheduler
+from server_hygiene import ServerHygiene
+from planner import plan_specs
+from cost_model import estimate as estimate_duration, spec_from_workflow
+from utils.catalog import load_table
+from utils.config_loader import ConfigLoader
+from utils.logger_config import configure_logging, setup_logger
 
 logger = setup_logger(__name__)
 
-if __name__ == "__main__":
-    # Load the workflow from a JSON file
-    with open(get_path('workflow', 'Randomizer_controlNet.json'), 'r') as file:
-        workflow = json.load(file)
+# Name of the config in config/workflows/ that drives this run. The file is
+# re-checked every iteration, so edits take effect without restarting the loop.
+CONFIG_NAME = "randomizer_controlnet"
 
-    # Load CSV files
-    with open(get_path('res', 'art_styles.csv'), 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        art_styles = [row for row in reader if row.get('included', '').lower() == 'y']
-
-    with open(get_path('res', 'models.csv'), 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        rows = list(reader)  # Read all rows into memory first
-        
-        # Then get checkpoints
-        # pool of checkpoints - for now, SD 1.5 & local only
-        checkpoints = [row['Name'] for row in rows 
-                        if row['Type'] == 'Checkpoint' 
-                        and row['Base'] == "SD 1.5"
-                        and row['Location'] != 'External'
-                        and row['Excluded'] != 'y']
-
-
-    # set checkpoint and loras =================================================================================================
-    ckpt = "helloartOil_helloartOilV10kvae.safetensors"
-    set_vae = False
-    vae_name = "vaeFtMse840000EmaPruned_vaeFtMse840k.safetensors"
-    
-    fixed_loras = []
-    lora_categories = {
-        "style": 1,
-        "character_outfit": 0,
-        "lighting": 1,
-        "detail": 1,
-        "crispness": 1,
-        "quality": 1,
-        "DOF": 1
-    }
-
-    embeddings = []
-
-    use_random_seed = True
-    
+def main(config_name=CONFIG_NAME):
     """
-    Common resolutions:
-    - 16:9: 3840x2160, 1920x1080, 1280x768, 960x540, 912x512
-    - 4:3: 1024x768, 800x600
-    - 3:2: 1366x1024, 1280x800, 1152x768, 1024x682, 768x512
+    Runs the generation loop for a workflow config.
+
+    Parameters:
+    - config_name (str): Config in config/workflows/, re-read every iteration.
     """
-    width = 512
-    height = 512
-    upscale_ratio = 2
-    run_with_upscale = True
-    sleep_time_up = 80
-    sleep_time_regular = 30
+    config_loader = ConfigLoader()
+    cfg = config_loader.get_run_config(config_name)
 
-    use_art_style = True
+    # Load the workflow from a JSON file
+    workflow_file = cfg.workflow_file
+    workflow = load_workflow(workflow_file, server=cfg.server or None)
 
-    object_type = "target" # setting this to "target" will error out, need to fix
+    # executed graphs are kept as diffs against the workflow as loaded
+    workflow_store = WorkflowStore()
+    template_hash = workflow_store.put_template(workflow)
 
-    random_override = True
+    # Load the style pool
+    styles_table = load_table('art_styles')
+    art_styles = styles_table.rows(styles_table.flag('included'))
 
-    for j in range (1, 500):
-        
-        # random override
-        if random_override:
+    checkpoint_pool = cfg.checkpoint_pool
+    checkpoints = load_checkpoint_pool(checkpoint_pool)
+
+    # control images are uploaded to the backend on demand
+    input_manager = InputManager()
+
+    # history pruning, /free on checkpoint-base changes and VRAM throttling
+    hygiene = ServerHygiene(server=cfg.server or None, **asdict(cfg.hygiene))
+
+    # bulk work: held client-side and shared with the other campaigns on the backend by weight
+    scheduler = Scheduler(cfg.campaign.name or cfg.name, priority=BULK, weight=cfg.share_weight,
+                          server=cfg.server or None, max_pending=cfg.max_backend_queue)
+
+    # early abort: a websocket listener scores previews of our jobs and interrupts bad ones
+    client_id = None
+    if cfg.early_abort.enabled:
+        from early_abort import PreviewMonitor
+        abort_settings = cfg.early_abort
+        monitor = PreviewMonitor(server=cfg.server or None, scorer=abort_settings.scorer, threshold=abort_settings.threshold,
+                                 min_step=abort_settings.min_step, patience=abort_settings.patience).start()
+        client_id = monitor.client_id
+
+    # plan mode: a covering set of (checkpoint, style, lora) jobs instead of random picks
+    plan = None
+    campaign_client = None
+    if cfg.campaign.enabled:
+        # campaign mode: the plan is shared with the other clients through the campaign store
+        from campaign import CampaignClient, create_campaign
+        campaign_name = cfg.campaign.name or cfg.name
+        campaign_store = cfg.campaign.store or None
+        create_campaign(campaign_name, plan_specs(cfg, checkpoints), chunk_size=cfg.campaign.chunk_size, path=campaign_store)
+        campaign_client = CampaignClient(campaign_name, path=campaign_store, lease_seconds=cfg.campaign.lease_seconds)
+        plan = (dict(spec, campaign_index=index) for index, spec in campaign_client.jobs())
+    elif cfg.plan.enabled:
+        plan = plan_specs(cfg, checkpoints)
+
+    j = 0
+    while j < cfg.iterations:
+        j += 1
+
+        # pick up config edits made while running
+        cfg = config_loader.get_run_config(config_name)
+        server = cfg.server or None
+        scheduler.max_pending, scheduler.weight = cfg.max_backend_queue, cfg.share_weight
+        if cfg.workflow_file != workflow_file:
+            workflow_file = cfg.workflow_file
+            workflow = load_workflow(workflow_file, server=cfg.server or None)
+            template_hash = workflow_store.put_template(workflow)
+            logger.info(f"run.main: Switched workflow to {workflow_file}")
+        if cfg.checkpoint_pool != checkpoint_pool:
+            checkpoint_pool = cfg.checkpoint_pool
+            checkpoints = load_checkpoint_pool(checkpoint_pool)
+
+        width, height = cfg.width, cfg.height
+        up_width, up_height = int(width * cfg.upscale_ratio), int(height * cfg.upscale_ratio)
+        object_type = cfg.object_type
+        embeddings = cfg.embeddings
+
+        # set checkpoint and loras =================================================================================================
+        planned = None
+        if plan is not None:
+            planned = next(plan, None)
+            if planned is None:
+                logger.info(f"run.main: Plan complete after {j - 1} iterations")
+                break
+            ckpt = planned['checkpoint']
+        elif cfg.random_checkpoint:
             ckpt = random.choice(checkpoints) # this means no need to factor in random check points in get_model_params ***
-            fixed_loras = []
-
-            lora_categories = {
-                #"style": random.randint(0, 1),
-                #"lighting": random.randint(0, 1),
-                #"detail": random.randint(0, 1),
-                #"crispness": random.randint(0, 1),
-                #"quality": random.randint(0, 1)
-            }
+        else:
+            ckpt = cfg.checkpoint
+        hygiene.server = server
+        hygiene.enter_checkpoint(ckpt)
+        fixed_loras = cfg.fixed_loras
+        lora_categories = cfg.lora_categories
         
         # Get object info including input files
         object_info = get_object(object_type)
@@ -118,6 +152,10 @@ if __name__ == "__main__":
             input_img_name = None
 
         if get_node_ID(workflow, "net1") is not None and input_img_name:
+            if cfg.resize_control_image:
+                input_img_name = input_manager.prepare_control_image(input_img_name, server=server, width=width, height=height)
+            else:
+                input_img_name = input_manager.prepare_control_image(input_img_name, server=server)
             logger.info(f"run.main: Setting input image to {input_img_name}")
             set_node_value(workflow, "Load Image", "image", input_img_name)
 
@@ -125,12 +163,16 @@ if __name__ == "__main__":
             set_node_value(workflow, "\ud83d\udd79\ufe0f CR Multi-ControlNet Stack", "switch_2", "On")
 
         logger.info(f"===== run.main: Running iteration {j} =====")
-        style_name = random.choice(art_styles)['name'] if use_art_style else None
+        if planned is not None:
+            style_name = planned['style']
+        else:
+            style_name = random.choice(art_styles)['name'] if cfg.use_art_style else None
         logger.info(f"run.main: Style name: {style_name}")
 
-        for i in range(1, 2):
-            seed = random.randint(1, 1000000000) if use_random_seed else 999999999
-            loras = assemble_loras(ckpt, fixed_loras, lora_categories)
+        queued_prompts = []
+        for i in range(1, cfg.jobs_per_iteration + 1):
+            seed = random.randint(1, 1000000000) if cfg.use_random_seed else 999999999
+            loras = planned['loras'] if planned is not None else assemble_loras(ckpt, fixed_loras, lora_categories)
             logger.info(f"run.main: Selected loras: {loras}")
             num_loras = len(loras)
             models = get_model_params(num_loras=num_loras, checkpoint=ckpt, loras=loras, embeddings=embeddings)
@@ -142,39 +184,84 @@ if __name__ == "__main__":
             embeddings_used = ', '.join([models[f'embedding{i}'] for i in range(1, models.get('num_embeddings', 0) + 1)])
             
             # set the node values
-            set_node_value(workflow, "CLIP Set Last Layer", "stop_at_clip_layer", -2)
+            set_node_value(workflow, "CLIP Set Last Layer", "stop_at_clip_layer", cfg.clip_skip)
 
             # set the KSampler node values
-            set_KSampler(workflow, nodeTitle="KSampler", seed=seed, steps=30, cfg=6, sampler_name='dpmpp_2m', scheduler='karras', denoise=1)
-            set_KSampler(workflow, nodeTitle="KS_up", seed=seed, steps=10, cfg=4, sampler_name='dpmpp_2m', scheduler='karras', denoise=0.6)
-            set_positive_prompt(workflow, ckpt_name=checkpoint_used, lora_names=loras_used, embeddings=embeddings_used, object_type=object_type, style_name=style_name)
-            set_negative_prompt(workflow, ckpt_name=checkpoint_used, lora_names=loras_used, embeddings=embeddings_used, object_type=object_type, style_name=style_name)
+            set_KSampler(workflow, nodeTitle="KSampler", seed=seed, **asdict(cfg.sampler))
+            set_KSampler(workflow, nodeTitle="KS_up", seed=seed, **asdict(cfg.upscale_sampler))
+            prompt = cfg.prompt
+            set_positive_prompt(workflow, ckpt_name=checkpoint_used, lora_names=loras_used, embeddings=embeddings_used, object_type=object_type, style_name=style_name,
+                                compact=prompt.compact, max_chunks=prompt.max_chunks, template=prompt.positive_template)
+            set_negative_prompt(workflow, ckpt_name=checkpoint_used, lora_names=loras_used, embeddings=embeddings_used, object_type=object_type, style_name=style_name,
+                                compact=prompt.compact, max_chunks=prompt.max_chunks, template=prompt.negative_template)
             
             set_resolution(workflow, "Empty Latent Image", width, height)
-            set_resolution(workflow, "Up_res", width*upscale_ratio, height*upscale_ratio)
+            set_resolution(workflow, "Up_res", up_width, up_height)
+
+            # pack variants into one job: they share checkpoint, loras, prompt and resolution,
+            # and differ only by their index in the latent batch (same seed, batch_index offset)
+            set_batch_size(workflow, "Empty Latent Image", cfg.variants_per_job)
             
             # run with upscale, set the input of save image to VAE Decode_scaled
-            if run_with_upscale:
+            if cfg.run_with_upscale:
                 update_node_input(workflow, "Save Image", "images", "VAE Decode_scaled")
             
-            if set_vae:
-                update_vae_input(workflow, vae_name)
+            if cfg.set_vae:
+                update_vae_input(workflow, cfg.vae_name)
 
+            job_id = uuid.uuid4().hex[:8]
             lora_prefixes = '-'.join([lora.replace(',', '_')[:5] for lora in loras_used])
-            workflow["12"]["inputs"]["filename_prefix"] = f"{checkpoint_used.replace('.safetensors', '')}-{style_name}-{lora_prefixes}"
+            filename_prefix = f"{checkpoint_used.replace('.safetensors', '')}-{style_name}-{lora_prefixes}-{job_id}"
+            workflow["12"]["inputs"]["filename_prefix"] = filename_prefix
             
-            # save the workflow to a file
-            filename = f"last_execution_workflow.json"
-            with open(get_path('workflow', filename), 'w') as outfile:
-                json.dump(workflow, outfile, indent=4)
-                outfile.write(f'\n// Datetime stamp: {datetime.now().isoformat()}\n')
-            
-            queue_workflow(workflow)
+            job = {
+                'job_id': job_id,
+                'checkpoint': checkpoint_used,
+                'loras': loras_used,
+                'style': style_name,
+                'object_type': object_type,
+                'seed': seed,
+                'width': width,
+                'height': height,
+                'upscale': cfg.run_with_upscale,
+                'filename_prefix': filename_prefix,
+                'batch_size': cfg.variants_per_job
+            }
+            # the backend queue stays shallow so interactive jobs are not stuck behind bulk work;
+            # the graph as sent is stored only once the backend has accepted it
+            response = scheduler.submit(workflow, before_send=hygiene.wait_for_vram, optimize=asdict(cfg.payload), job=job,
+                                        client_id=client_id, store=(workflow_store, template_hash))
+            if not response:
+                # rejected jobs are in data/quarantine.jsonl; nothing was queued, so don't wait for it
+                logger.warning(f"run.main: Job {job_id} was not queued, moving on")
+                continue
+            # the record id travels with the job into the ledger
+            job['workflow_record'] = response.get('workflow_record')
+            record_job(job, prompt_id=response.get('prompt_id'))
+            queued_prompts.append(response.get('prompt_id'))
+            hygiene.track(response.get('prompt_id'))
             
             if i % 1 == 0:
-                time.sleep(sleep_time_up if run_with_upscale else sleep_time_regular)
-    
-    # Save the updated workflow
-    with open(get_path('workflow', 'randomizer_updated.json'), 'w') as outfile:
-        json.dump(workflow, outfile, indent=4)
-        outfile.write(f'\n// Datetime stamp: {datetime.now().isoformat()}\n')
\ No newline at end of file
+                if cfg.adaptive_sleep:
+                    # the spec includes batch_size, so the estimate covers every variant
+                    sleep_time = estimate_duration(spec_from_workflow(workflow))
+                    logger.info(f"run.main: Estimated execution time {sleep_time:.0f}s")
+                else:
+                    # a packed job renders variants_per_job images
+                    sleep_time = (cfg.sleep_time_up if cfg.run_with_upscale else cfg.sleep_time_regular) * cfg.variants_per_job
+                time.sleep(sleep_time)
+
+        if campaign_client is not None:
+            if queued_prompts:
+                campaign_client.complete(planned['campaign_index'], prompt_id=queued_prompts[0])
+            else:
+                campaign_client.fail(planned['campaign_index'], detail='not queued, see data/quarantine.jsonl')
+
+    if campaign_client is not None:
+        campaign_client.close()
+    scheduler.close()
+    hygiene.close()
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
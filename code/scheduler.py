@@ -0,0 +1,226 @@
+"""
+Priority classes for work sent to one ComfyUI backend.
+
+ComfyUI runs its queue first come, first served, so a tweak queued behind a few
+hundred bulk jobs waits for all of them. Instead, bulk work is held client-side
+and only released while the backend queue is shallow, and interactive work is
+queued with ComfyUI's `front` option so it runs next:
+
+- INTERACTIVE: sent immediately, to the front of the backend queue (tweak.py).
+- NORMAL: released while fewer than max_pending + NORMAL_HEADROOM jobs are pending (upscale.py).
+- BULK: released while fewer than max_pending jobs are pending (run.py).
+
+run.py, upscale.py and tweak.py are separate processes, so they submit through a
+Scheduler that keeps its state in SQLite (data/scheduler.sqlite). Waiting
+processes register there, and only the next one in line is released: the best
+priority class first, then the campaign with the least weighted usage. Each
+campaign is charged the estimated execution time of the jobs it sent divided by
+its weight (weighted fair queuing), so while two campaigns both have work, one
+of weight 2 gets about twice the backend time of one of weight 1.
+"""
+
+import os
+import sqlite3
+import time
+import uuid
+from campaign import transaction
+from comfy_api import get_json, get_server
+from config import get_path
+from cost_model import estimate as estimate_duration, spec_from_workflow
+from load_models import queue_workflow
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BULK: 'bulk'}
+
+# NORMAL work may fill the backend queue this much deeper than BULK work
+NORMAL_HEADROOM = 2
+
+# A waiting client that has not polled for this long is ignored (it stopped or is stuck), and a
+# campaign that sent nothing for this long counts as idle
+CLIENT_TIMEOUT = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS waiting (
+    client_id TEXT PRIMARY KEY,
+    server TEXT NOT NULL,
+    campaign TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    since REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage (
+    server TEXT NOT NULL,
+    campaign TEXT NOT NULL,
+    vtime REAL NOT NULL,
+    last_sent REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (server, campaign)
+);
+"""
+
+def backend_queue_depth(server=None):
+    """Returns (running, pending) job counts of the backend's queue."""
+    queue = get_json('/queue', server=server, timeout=10)
+    return len(queue.get('queue_running', [])), len(queue.get('queue_pending', []))
+
+def pending_limit(priority, max_pending):
+    if priority == INTERACTIVE:
+        return None
+    return max_pending + (NORMAL_HEADROOM if priority == NORMAL else 0)
+
+def has_capacity(priority, max_pending, server=None):
+    """True if a job of this priority may be released now."""
+    limit = pending_limit(priority, max_pending)
+    if limit is None or max_pending <= 0:
+        return True
+    try:
+        _, pending = backend_queue_depth(server)
+    except OSError:
+        # Let queue_workflow's circuit breaker handle an unreachable backend
+        return True
+    return pending < limit
+
+def wait_for_capacity(priority=BULK, max_pending=2, server=None, poll_interval=5):
+    """
+    Blocks until the backend queue is shallow enough for a job of this priority.
+
+    Parameters:
+    - priority (int): INTERACTIVE, NORMAL or BULK.
+    - max_pending (int): Pending jobs allowed in the backend queue for BULK work (0 disables holding).
+    - poll_interval (float): Seconds between /queue polls.
+    """
+    waited = 0
+    while not has_capacity(priority, max_pending, server):
+        if waited == 0:
+            logger.info(f"scheduler.wait_for_capacity: Holding {PRIORITY_NAMES[priority]} job, backend queue is full")
+        time.sleep(poll_interval)
+        waited += poll_interval
+    if waited:
+        logger.info(f"scheduler.wait_for_capacity: Released after {waited}s")
+
+class Scheduler:
+    """
+    Submits the jobs of one campaign to one backend, in turn with the other processes.
+
+    Parameters:
+    - campaign (str): Name backend time is shared by, e.g. the config name, 'upscale' or 'tweak'.
+    - priority (int): INTERACTIVE (never held, sent to the front of the queue), NORMAL or BULK.
+    - weight (float): Share of the backend relative to other campaigns of the same priority.
+    - server (str, optional): host:port of the backend.
+    - max_pending (int): Pending jobs allowed in the backend queue for BULK work (0 disables holding).
+    - poll_interval (float): Seconds between polls while waiting.
+    - path (str, optional): SQLite file shared by the clients, data/scheduler.sqlite by default.
+    """
+
+    def __init__(self, campaign, priority=BULK, weight=1.0, server=None, max_pending=2, poll_interval=5, path=None):
+        if weight <= 0:
+            raise ValueError(f"Campaign weight must be positive, got {weight}")
+        self.campaign = campaign
+        self.priority = priority
+        self.weight = weight
+        self.server = server
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.backend = get_server(server)
+        self.client_id = uuid.uuid4().hex
+        self.path = path or get_path('data', 'scheduler.sqlite')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def _floor(self, db, now):
+        """Least usage among the other campaigns waiting for the backend (None if there are none)."""
+        row = db.execute(
+            "SELECT MIN(COALESCE(u.vtime, 0)) AS floor FROM waiting w "
+            "LEFT JOIN usage u ON u.server = w.server AND u.campaign = w.campaign "
+            "WHERE w.server = ? AND w.campaign != ? AND w.heartbeat >= ?",
+            (self.backend, self.campaign, now - CLIENT_TIMEOUT)).fetchone()
+        return row['floor']
+
+    def _usage(self, db):
+        """Returns (vtime, last_sent) of the campaign."""
+        row = db.execute("SELECT vtime, last_sent FROM usage WHERE server = ? AND campaign = ?",
+                         (self.backend, self.campaign)).fetchone()
+        return (row['vtime'], row['last_sent']) if row else (0.0, 0.0)
+
+    def _set_usage(self, db, vtime, last_sent):
+        db.execute("INSERT INTO usage (server, campaign, vtime, last_sent) VALUES (?, ?, ?, ?) "
+                   "ON CONFLICT(server, campaign) DO UPDATE SET vtime = excluded.vtime, last_sent = excluded.last_sent",
+                   (self.backend, self.campaign, vtime, last_sent))
+
+    def _register(self):
+        now = time.time()
+        with transaction(self.db) as db:
+            # a campaign that was idle starts level with the others instead of far behind them
+            vtime, last_sent = self._usage(db)
+            floor = self._floor(db, now)
+            if floor is not None and vtime < floor and now - last_sent > CLIENT_TIMEOUT:
+                self._set_usage(db, floor, last_sent)
+            db.execute("INSERT OR REPLACE INTO waiting (client_id, server, campaign, priority, since, heartbeat) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", (self.client_id, self.backend, self.campaign, self.priority, now, now))
+
+    def _is_next(self):
+        """Heartbeats this client and tells whether it is first in line among the waiting clients."""
+        now = time.time()
+        self.db.execute("UPDATE waiting SET heartbeat = ? WHERE client_id = ?", (now, self.client_id))
+        rows = self.db.execute(
+            "SELECT w.client_id, w.priority, w.since, COALESCE(u.vtime, 0) AS vtime FROM waiting w "
+            "LEFT JOIN usage u ON u.server = w.server AND u.campaign = w.campaign "
+            "WHERE w.server = ? AND w.heartbeat >= ?", (self.backend, now - CLIENT_TIMEOUT)).fetchall()
+        first = min(rows, key=lambda row: (row['priority'], row['vtime'], row['since'], row['client_id']), default=None)
+        return first is None or first['client_id'] == self.client_id
+
+    def _leave(self):
+        self.db.execute("DELETE FROM waiting WHERE client_id = ?", (self.client_id,))
+
+    def wait_turn(self):
+        """Blocks until this client is first in line and the backend queue has room for its priority."""
+        if self.priority == INTERACTIVE:
+            return
+        self._register()
+        waited = 0
+        while not (self._is_next() and has_capacity(self.priority, self.max_pending, self.server)):
+            if waited == 0:
+                logger.info(f"scheduler.Scheduler: Holding {PRIORITY_NAMES[self.priority]} job of {self.campaign}")
+            time.sleep(self.poll_interval)
+            waited += self.poll_interval
+        if waited:
+            logger.info(f"scheduler.Scheduler: Released {self.campaign} after {waited}s")
+
+    def charge(self, workflow):
+        """Adds the estimated execution time of a sent job, divided by the weight, to the campaign's usage."""
+        cost = estimate_duration(spec_from_workflow(workflow)) / self.weight
+        with transaction(self.db) as db:
+            self._set_usage(db, self._usage(db)[0] + cost, time.time())
+
+    def submit(self, workflow, before_send=None, **queue_kwargs):
+        """
+        Waits for this client's turn, then queues the job.
+
+        Parameters:
+        - workflow (dict): API-format graph.
+        - before_send (callable, optional): Called once the turn has come, before sending (e.g. a VRAM check).
+        - queue_kwargs: Passed on to queue_workflow (optimize, validate, job, client_id, store).
+
+        Returns:
+        - dict or bool: The queue_workflow result.
+        """
+        try:
+            self.wait_turn()
+            if before_send:
+                before_send()
+            response = queue_workflow(workflow, server=self.server, front=(self.priority == INTERACTIVE), **queue_kwargs)
+        finally:
+            self._leave()
+        if response:
+            self.charge(workflow)
+        return response
+
+    def close(self):
+        self._leave()
+        self.db.close()
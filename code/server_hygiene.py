@@ -0,0 +1,208 @@
+"""
+Keeps a long-running backend lean: history pruning, model unloading and VRAM throttling.
+
+- History: ComfyUI keeps every finished prompt in /history (in memory). The
+  jobs this client queued are tracked, and every prune_every jobs the finished
+  ones are collected into data/job_times.jsonl (the cost model's samples) and
+  then deleted with POST /history {"delete": [...]}. Other clients' entries are
+  left alone.
+- Phases: at a phase boundary (another checkpoint base, generation -> upscale)
+  the backend queue is drained and POST /free unloads the models and releases
+  cached memory, so the next phase starts from an unfragmented card.
+- VRAM (opt-in): before each submission /system_stats is checked. Below
+  min_free_vram (a fraction of the card), jobs are held while the backend is
+  busy, until an idle backend shows that resident models alone keep memory
+  short. From then on jobs are not held, and an idle, short backend gets a /free
+  at most every pressure_free_interval submissions, so models are not reloaded
+  for every job.
+"""
+
+import time
+from comfy_api import get_json, post_json
+from cost_model import checkpoint_base, collect_samples
+from scheduler import backend_queue_depth
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+class ServerHygiene:
+    """
+    Per-client housekeeping for one backend.
+
+    Parameters:
+    - server (str, optional): host:port of the backend.
+    - prune_every (int): Prune history after this many tracked jobs (0 = never).
+    - free_on_phase_change (bool): Call /free at phase boundaries.
+    - min_free_vram (float): Hold submissions below this free fraction of VRAM (0 = never).
+    - pressure_free_interval (int): Fewest submissions between two /free calls for VRAM pressure.
+    - drain_timeout (float): Longest wait for the backend queue to empty before /free.
+    - poll_interval (float): Seconds between /queue and /system_stats polls while waiting.
+    """
+
+    def __init__(self, server=None, prune_every=50, free_on_phase_change=True, min_free_vram=0.0,
+                 pressure_free_interval=50, drain_timeout=900, poll_interval=5):
+        self.server = server
+        self.prune_every = prune_every
+        self.free_on_phase_change = free_on_phase_change
+        self.min_free_vram = min_free_vram
+        self.pressure_free_interval = pressure_free_interval
+        self.drain_timeout = drain_timeout
+        self.poll_interval = poll_interval
+        self.tracked = []
+        self.since_prune = 0
+        self.phase = None
+        self.submissions = 0
+        self.short_when_idle = False  # VRAM was short with nothing running: resident models alone exceed the threshold
+        self.last_pressure_free = None  # submission count at the last /free for VRAM pressure
+
+    def track(self, prompt_id):
+        """Remembers a queued job so its history entry is pruned once it has been collected."""
+        if not prompt_id:
+            return
+        self.tracked.append(prompt_id)
+        self.since_prune += 1
+        if self.prune_every and self.since_prune >= self.prune_every:
+            self.prune_history()
+
+    def prune_history(self):
+        """
+        Collects the finished tracked jobs into the cost model samples, then deletes their history.
+
+        Returns:
+        - int: Number of history entries deleted.
+        """
+        self.since_prune = 0
+        if not self.tracked:
+            return 0
+        try:
+            history = get_json('/history', server=self.server, timeout=60)
+            finished = {prompt_id: history[prompt_id] for prompt_id in self.tracked if prompt_id in history}
+            if not finished:
+                return 0
+            collect_samples(history=finished)
+            post_json('/history', {'delete': list(finished)}, server=self.server)
+        except OSError as e:
+            logger.warning(f"server_hygiene.prune_history: Skipped, backend unavailable: {e}")
+            return 0
+        # still running or pending jobs are pruned next time
+        self.tracked = [prompt_id for prompt_id in self.tracked if prompt_id not in finished]
+        logger.info(f"server_hygiene.prune_history: Deleted {len(finished)} history entries, {len(self.tracked)} jobs not finished yet")
+        return len(finished)
+
+    def free(self, reason, unload_models=True, free_memory=True):
+        """Asks the backend to unload models and release cached memory (done between prompts)."""
+        try:
+            post_json('/free', {'unload_models': unload_models, 'free_memory': free_memory}, server=self.server)
+        except OSError as e:
+            logger.warning(f"server_hygiene.free: /free failed ({reason}): {e}")
+            return False
+        logger.info(f"server_hygiene.free: Unloaded models and freed memory ({reason})")
+        return True
+
+    def wait_until_idle(self, timeout):
+        """Polls /queue until nothing is running or pending. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                running, pending = backend_queue_depth(self.server)
+            except OSError:
+                return False
+            if running + pending == 0:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+    def enter_phase(self, phase):
+        """
+        Marks a phase boundary when phase differs from the previous one (the first call only records it).
+
+        The backend queue is drained first, so the jobs of the old phase still find their models loaded.
+
+        Parameters:
+        - phase (str): E.g. 'generate:SDXL 1.0' or 'upscale'.
+
+        Returns:
+        - bool: True if /free was called.
+        """
+        previous, self.phase = self.phase, phase
+        if previous is None or previous == phase or not self.free_on_phase_change:
+            return False
+        logger.info(f"server_hygiene.enter_phase: {previous} -> {phase}, waiting for the backend queue to drain")
+        if not self.wait_until_idle(self.drain_timeout):
+            logger.warning(f"server_hygiene.enter_phase: Queue not drained after {self.drain_timeout}s, freeing anyway")
+        self.prune_history()
+        return self.free(f"{previous} -> {phase}")
+
+    def free_if_idle(self, reason):
+        """/free for a process that starts a new phase, unless other work is still using the loaded models."""
+        if not self.free_on_phase_change:
+            return False
+        if not self.wait_until_idle(0):
+            logger.info(f"server_hygiene.free_if_idle: Backend busy, not freeing ({reason})")
+            return False
+        return self.free(reason)
+
+    def enter_checkpoint(self, ckpt_name):
+        """Phase boundary on a change of checkpoint base (SD 1.5 -> SDXL, ...), as listed in models.csv."""
+        return self.enter_phase(f"generate:{checkpoint_base(ckpt_name) or 'unknown'}")
+
+    def vram_free_ratio(self):
+        """Free fraction of the first device's VRAM, None if unknown (CPU backends, errors)."""
+        try:
+            devices = get_json('/system_stats', server=self.server, timeout=10).get('devices') or []
+        except OSError:
+            return None
+        if not devices or not devices[0].get('vram_total'):
+            return None
+        return devices[0].get('vram_free', 0) / devices[0]['vram_total']
+
+    def wait_for_vram(self):
+        """
+        Holds a submission while VRAM is short and the backend is busy.
+
+        ComfyUI keeps models resident, so a card can be short even when idle. Once that
+        has been seen, holding stops (waiting for idle would only serialize the run), and
+        /free is called when an idle backend is found short, at most once every
+        pressure_free_interval submissions. If an idle backend is still short right after
+        a /free, resident models are not the cause and throttling is switched off.
+        """
+        if not self.min_free_vram:
+            return
+        self.submissions += 1
+        waited = 0
+        while True:
+            ratio = self.vram_free_ratio()
+            if ratio is None or ratio >= self.min_free_vram:
+                break
+            try:
+                running, pending = backend_queue_depth(self.server)
+            except OSError:
+                break
+            if running + pending:
+                if self.short_when_idle:
+                    break
+                if waited == 0:
+                    logger.info(f"server_hygiene.wait_for_vram: Holding job, {ratio:.0%} VRAM free")
+                time.sleep(self.poll_interval)
+                waited += self.poll_interval
+                continue
+
+            self.short_when_idle = True
+            if self.last_pressure_free == self.submissions:
+                logger.warning(f"server_hygiene.wait_for_vram: Only {ratio:.0%} VRAM free on an idle backend "
+                               f"after /free, no longer throttling (lower hygiene.min_free_vram)")
+                self.min_free_vram = 0
+                break
+            due = self.last_pressure_free is None or self.submissions - self.last_pressure_free >= self.pressure_free_interval
+            if not due or not self.free(f"{ratio:.0%} VRAM free on an idle backend"):
+                break
+            self.last_pressure_free = self.submissions
+            time.sleep(self.poll_interval)
+            waited += self.poll_interval
+        if waited:
+            logger.info(f"server_hygiene.wait_for_vram: Released after {waited}s")
+
+    def close(self):
+        """Prunes what is left at the end of a run (jobs still queued are kept)."""
+        self.prune_history()
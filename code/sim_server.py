@@ -0,0 +1,809 @@
+"""
+Simulated ComfyUI backend for load and capacity tests without a GPU.
+
+SimServer speaks the parts of the ComfyUI API this project uses: /prompt,
+/queue, /history, /view, /upload/image, /interrupt, /free, /object_info,
+/system_stats and the /ws progress stream (status, execution_start, executing, progress with
+optional binary preview frames, executed, execution_success). Jobs "run" for a
+configurable time per image and produce small placeholder PNGs that carry the
+submitted graph in their 'prompt' chunk plus the extra_pnginfo chunks, like
+SaveImage does, so upscale.py, tweak.py and generation_index.py work on them.
+
+Failures are injected by rate (4xx rejections, 5xx errors, dropped
+connections, errors during execution) and the pending queue can be capped, so
+the submission retry, quarantine and circuit breaker paths can be exercised.
+
+Only the standard library is used. /object_info is served from a cached real
+payload when one is given, else derived from the API graphs in workflow/.
+"""
+
+import argparse
+import base64
+import copy
+import glob
+import hashlib
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+from config import PATHS, get_path
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+# Websocket frames
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+PREVIEW_IMAGE, PREVIEW_PNG = 1, 2
+
+OUTPUT_NODES = {'SaveImage': 'output', 'PreviewImage': 'temp'}
+# Display nodes that report text in their ui output (the captioning workflow reads it from /history)
+TEXT_NODES = {'easy showAnything', 'ShowText|pysssss'}
+
+@dataclass
+class SimSettings:
+    """
+    Behaviour of the simulated backend.
+
+    - exec_time (float): Seconds of simulated execution per image in the batch.
+    - jitter (float): Random relative variation of exec_time (0.2 = +-20%).
+    - preview_every (int): Send a binary preview every N sampler steps (0 = never).
+    - reject_rate (float): Fraction of /prompt requests answered 400 (invalid prompt).
+    - error_rate (float): Fraction of /prompt requests answered 500.
+    - drop_rate (float): Fraction of /prompt requests whose connection is closed without an answer.
+    - exec_error_rate (float): Fraction of accepted jobs that fail during execution.
+    - max_queue (int): Pending jobs accepted before /prompt answers 503 (0 = unlimited).
+    - latency (float): Seconds added to every HTTP response.
+    - workers (int): Jobs executed in parallel (1, like a single GPU).
+    - image_scale (int): Placeholder PNGs are the latent size divided by this.
+    - history_limit (int): Oldest history entries are dropped beyond this many.
+    - vram_total (int): Bytes reported by /system_stats.
+    - model_vram (int): Bytes held by each loaded checkpoint until /free or eviction.
+    - vram_leak (int): Bytes per executed job that stay allocated until /free (fragmentation).
+    - seed (int, optional): Seed for injected failures and jitter.
+    """
+    exec_time: float = 0.5
+    jitter: float = 0.2
+    preview_every: int = 0
+    reject_rate: float = 0.0
+    error_rate: float = 0.0
+    drop_rate: float = 0.0
+    exec_error_rate: float = 0.0
+    max_queue: int = 0
+    latency: float = 0.0
+    workers: int = 1
+    image_scale: int = 8
+    history_limit: int = 10000
+    vram_total: int = 24 * 1024 ** 3
+    model_vram: int = 6 * 1024 ** 3
+    vram_leak: int = 0
+    seed: int = None
+
+def now_ms():
+    return int(time.time() * 1000)
+
+def png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+def png_bytes(width, height, text=None, seed=0):
+    """
+    Encodes a noise RGB PNG with tEXt chunks (stdlib only).
+
+    Parameters:
+    - text (dict, optional): Chunk keyword -> string, written before the image data like ComfyUI does.
+    - seed (int): Seeds the noise, so equal seeds give equal images.
+    """
+    row_bytes = width * 3
+    rng = random.Random(seed)
+    noise = rng.getrandbits(8 * row_bytes * height).to_bytes(row_bytes * height, 'little')
+    raw = b''.join(b'\0' + noise[y * row_bytes:(y + 1) * row_bytes] for y in range(height))
+    chunks = [png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))]
+    for key, value in (text or {}).items():
+        chunks.append(png_chunk(b'tEXt', key.encode('latin-1') + b'\0' + value.encode('latin-1', errors='replace')))
+    chunks.append(png_chunk(b'IDAT', zlib.compress(raw, 1)))
+    chunks.append(png_chunk(b'IEND', b''))
+    return b'\x89PNG\r\n\x1a\n' + b''.join(chunks)
+
+def literal_type(value):
+    if isinstance(value, bool):
+        return 'BOOLEAN'
+    if isinstance(value, (int, float)):
+        # FLOAT accepts ints too, INT would reject e.g. a cfg of 7.5 in a template that had 7
+        return 'FLOAT'
+    if isinstance(value, str):
+        return 'STRING'
+    return '*'
+
+def derive_object_info(paths=None):
+    """
+    Builds permissive node definitions from API graphs: every input seen becomes an
+    optional input, links become '*' inputs, and each node gets enough '*' outputs
+    for the highest slot linked to.
+    """
+    paths = paths if paths is not None else glob.glob(os.path.join(PATHS['workflow'], '*.json'))
+    inputs, outputs = {}, {}
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as f:
+                graph = json.loads(f.read().split('\n// ')[0])
+        except (OSError, ValueError):
+            continue
+        if not isinstance(graph, dict) or 'nodes' in graph:
+            continue  # UI exports
+        for node in graph.values():
+            if not isinstance(node, dict) or 'class_type' not in node:
+                continue
+            class_inputs = inputs.setdefault(node['class_type'], {})
+            outputs.setdefault(node['class_type'], 1)
+            for name, value in node.get('inputs', {}).items():
+                if isinstance(value, list) and len(value) == 2 and isinstance(value[1], int):
+                    # '*' outputs match any input type, so a widget also seen as a literal keeps its type
+                    class_inputs.setdefault(name, ['*'])
+                    source = graph.get(str(value[0]), {}).get('class_type')
+                    if source:
+                        outputs[source] = max(outputs.get(source, 1), value[1] + 1)
+                elif class_inputs.get(name, ['*']) == ['*']:
+                    class_inputs[name] = [literal_type(value)]
+    return {
+        class_type: {
+            'input': {'required': {}, 'optional': class_inputs},
+            'input_order': {'required': [], 'optional': list(class_inputs)},
+            'output': ['*'] * outputs.get(class_type, 1),
+            'output_is_list': [False] * outputs.get(class_type, 1),
+            'output_name': ['*'] * outputs.get(class_type, 1),
+            'name': class_type,
+            'display_name': class_type,
+            'category': 'sim',
+            'output_node': class_type in OUTPUT_NODES or class_type in TEXT_NODES,
+        }
+        for class_type, class_inputs in inputs.items()
+    }
+
+class WebSocketConnection:
+    """Server side of one websocket: thread-safe sends, frame reading for close/ping."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([length])
+        elif length < 1 << 16:
+            header += bytes([126]) + struct.pack('>H', length)
+        else:
+            header += bytes([127]) + struct.pack('>Q', length)
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.sock.sendall(header + payload)
+            except OSError:
+                self.closed = True
+
+    def send_json(self, message):
+        self.send_frame(OP_TEXT, json.dumps(message).encode('utf-8'))
+
+    def send_binary(self, payload):
+        self.send_frame(OP_BINARY, payload)
+
+    def _read_exact(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("websocket closed")
+            data += chunk
+        return data
+
+    def read_frame(self):
+        first, second = self._read_exact(2)
+        opcode, length = first & 0x0F, second & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', self._read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', self._read_exact(8))[0]
+        mask = self._read_exact(4) if second & 0x80 else None
+        payload = self._read_exact(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+    def serve(self):
+        """Blocks until the client closes the connection, answering pings."""
+        try:
+            while True:
+                opcode, payload = self.read_frame()
+                if opcode == OP_CLOSE:
+                    self.send_frame(OP_CLOSE, payload[:2])
+                    break
+                if opcode == OP_PING:
+                    self.send_frame(OP_PONG, payload)
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            self.closed = True
+
+class SimHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def sim(self):
+        return self.server.sim
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def read_json(self):
+        body = self.read_body()
+        return json.loads(body) if body.strip() else {}
+
+    def do_GET(self):
+        url = parse.urlsplit(self.path)
+        query = dict(parse.parse_qsl(url.query))
+        if url.path == '/ws':
+            return self.open_websocket(query.get('clientId') or uuid.uuid4().hex)
+        if self.sim.settings.latency:
+            time.sleep(self.sim.settings.latency)
+        if url.path == '/queue':
+            return self.send_json(self.sim.queue_snapshot())
+        if url.path == '/history':
+            max_items = int(query['max_items']) if query.get('max_items') else None
+            return self.send_json(self.sim.history_snapshot(max_items=max_items))
+        if url.path.startswith('/history/'):
+            return self.send_json(self.sim.history_snapshot(prompt_id=url.path[len('/history/'):]))
+        if url.path == '/object_info':
+            return self.send_json(self.sim.object_info)
+        if url.path.startswith('/object_info/'):
+            class_type = parse.unquote(url.path[len('/object_info/'):])
+            definition = self.sim.object_info.get(class_type)
+            return self.send_json({class_type: definition} if definition else {})
+        if url.path == '/system_stats':
+            return self.send_json(self.sim.system_stats())
+        if url.path == '/view':
+            return self.send_view(query)
+        self.send_json({'error': f"Unknown endpoint {url.path}"}, status=404)
+
+    def do_POST(self):
+        url = parse.urlsplit(self.path)
+        if self.sim.settings.latency:
+            time.sleep(self.sim.settings.latency)
+        try:
+            if url.path == '/prompt':
+                return self.post_prompt()
+            if url.path == '/upload/image':
+                return self.send_json(self.sim.store_upload(self.headers.get('Content-Type', ''), self.read_body()))
+            if url.path == '/interrupt':
+                self.sim.interrupt(self.read_json().get('prompt_id'))
+                return self.send_json({})
+            if url.path == '/queue':
+                self.sim.edit_queue(self.read_json())
+                return self.send_json({})
+            if url.path == '/history':
+                self.sim.edit_history(self.read_json())
+                return self.send_json({})
+            if url.path == '/free':
+                self.sim.free(self.read_json())
+                return self.send_json({})
+        except (ValueError, KeyError) as e:
+            return self.send_json({'error': str(e)}, status=400)
+        self.send_json({'error': f"Unknown endpoint {url.path}"}, status=404)
+
+    def post_prompt(self):
+        settings, rng = self.sim.settings, self.sim.random
+        with self.sim.lock:
+            roll = rng.random()
+        if roll < settings.drop_rate:
+            # Connection reset without a response: a transient failure for the client
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        roll -= settings.drop_rate
+        if roll < settings.error_rate:
+            return self.send_json({'error': {'type': 'server_error', 'message': 'Injected server error'}}, status=500)
+        roll -= settings.error_rate
+        if roll < settings.reject_rate:
+            return self.send_json({'error': {'type': 'prompt_outputs_failed_validation', 'message': 'Injected validation failure',
+                                             'details': '', 'extra_info': {}}, 'node_errors': {}}, status=400)
+
+        payload = self.read_json()
+        prompt = payload.get('prompt')
+        if not isinstance(prompt, dict) or not all(isinstance(node, dict) and 'class_type' in node for node in prompt.values()):
+            return self.send_json({'error': {'type': 'invalid_prompt', 'message': 'Cannot execute because the prompt is malformed'},
+                                   'node_errors': {}}, status=400)
+        if not any(node['class_type'] in OUTPUT_NODES or node['class_type'] in TEXT_NODES for node in prompt.values()):
+            return self.send_json({'error': {'type': 'prompt_no_outputs', 'message': 'Prompt has no outputs'},
+                                   'node_errors': {}}, status=400)
+        result = self.sim.enqueue(prompt, payload.get('extra_data') or {}, payload.get('client_id'), bool(payload.get('front')))
+        if result is None:
+            return self.send_json({'error': {'type': 'queue_full', 'message': 'Queue limit reached'}}, status=503)
+        self.send_json(result)
+
+    def send_view(self, query):
+        base = self.sim.output_dir if query.get('type', 'output') != 'input' else self.sim.input_dir
+        path = os.path.normpath(os.path.join(base, query.get('subfolder', ''), query.get('filename', '')))
+        if not path.startswith(os.path.abspath(base)) or not os.path.isfile(path):
+            return self.send_json({'error': 'Not found'}, status=404)
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def open_websocket(self, client_id):
+        key = self.headers.get('Sec-WebSocket-Key')
+        if not key or 'websocket' not in self.headers.get('Upgrade', '').lower():
+            return self.send_json({'error': 'Expected a websocket upgrade'}, status=400)
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        connection = WebSocketConnection(self.connection)
+        self.sim.add_client(client_id, connection)
+        try:
+            connection.serve()
+        finally:
+            self.sim.remove_client(client_id, connection)
+            self.close_connection = True
+
+class SimServer:
+    """
+    The simulated backend. start() serves in background threads; address is host:port.
+
+    Parameters:
+    - host (str): Interface to bind.
+    - port (int): Port, 0 for any free one.
+    - settings (SimSettings, optional): Timing and failure injection.
+    - output_dir (str, optional): Where placeholder images are written, default cache/sim_output.
+    - object_info (dict or str, optional): Node definitions, or the path of a cached /object_info JSON.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8188, settings=None, output_dir=None, object_info=None):
+        self.settings = settings or SimSettings()
+        self.random = random.Random(self.settings.seed)
+        self.output_dir = os.path.abspath(output_dir or get_path('cache', 'sim_output'))
+        self.input_dir = os.path.join(os.path.dirname(self.output_dir), os.path.basename(self.output_dir) + '_input')
+        os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.input_dir, exist_ok=True)
+        if isinstance(object_info, str):
+            with open(object_info, encoding='utf-8') as f:
+                object_info = json.load(f)
+        self.object_info = object_info if object_info is not None else derive_object_info()
+
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.pending = []  # [number, prompt_id, prompt, extra_data, outputs, client_id]
+        self.running = {}  # prompt_id -> item
+        self.interrupted = set()
+        self.history = OrderedDict()
+        self.clients = {}  # client_id -> set of WebSocketConnection
+        self.counters = {}  # filename prefix -> next counter
+        self.number = 0
+        self.front_number = 0
+        self.stopping = False
+        self.loaded_models = OrderedDict()  # checkpoint name -> bytes, oldest first
+        self.leaked = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), SimHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.sim = self
+        self.address = f"{host}:{self.httpd.server_address[1]}"
+        self.threads = []
+
+    def start(self):
+        self.threads.append(threading.Thread(target=self.httpd.serve_forever, name='sim-http', daemon=True))
+        for index in range(max(1, self.settings.workers)):
+            self.threads.append(threading.Thread(target=self.work, name=f'sim-worker-{index}', daemon=True))
+        for thread in self.threads:
+            thread.start()
+        logger.info(f"sim_server.SimServer: Serving a simulated ComfyUI on {self.address} (outputs in {self.output_dir})")
+        return self
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+            self.changed.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # --- API state -------------------------------------------------------------------------------
+
+    def enqueue(self, prompt, extra_data, client_id, front):
+        """Adds a job; returns the /prompt response, or None if the queue is full."""
+        with self.lock:
+            if self.settings.max_queue and len(self.pending) >= self.settings.max_queue:
+                return None
+            prompt_id = str(uuid.uuid4())
+            outputs = [node_id for node_id, node in prompt.items()
+                       if node['class_type'] in OUTPUT_NODES or node['class_type'] in TEXT_NODES]
+            if front:
+                # ComfyUI gives front jobs a negative number, so they sort before all others
+                self.front_number -= 1
+                number = self.front_number
+            else:
+                self.number += 1
+                number = self.number
+            if client_id:
+                extra_data = dict(extra_data, client_id=client_id)
+            self.pending.append([number, prompt_id, prompt, extra_data, outputs])
+            self.pending.sort(key=lambda item: item[0])
+            self.changed.notify()
+        self.broadcast_status()
+        return {'prompt_id': prompt_id, 'number': number, 'node_errors': {}}
+
+    def queue_snapshot(self):
+        with self.lock:
+            return {'queue_running': [item[:5] for item in self.running.values()],
+                    'queue_pending': [item[:5] for item in self.pending]}
+
+    def edit_queue(self, payload):
+        with self.lock:
+            if payload.get('clear'):
+                self.pending = []
+            delete = set(payload.get('delete') or [])
+            self.pending = [item for item in self.pending if item[1] not in delete]
+        self.broadcast_status()
+
+    def history_snapshot(self, prompt_id=None, max_items=None):
+        with self.lock:
+            if prompt_id is not None:
+                return {prompt_id: self.history[prompt_id]} if prompt_id in self.history else {}
+            items = list(self.history.items())
+            if max_items:
+                items = items[-max_items:]
+            return dict(items)
+
+    def edit_history(self, payload):
+        with self.lock:
+            if payload.get('clear'):
+                self.history.clear()
+            for prompt_id in payload.get('delete') or []:
+                self.history.pop(prompt_id, None)
+
+    def interrupt(self, prompt_id=None):
+        with self.lock:
+            targets = [pid for pid in self.running if prompt_id is None or pid == prompt_id]
+            self.interrupted.update(targets)
+
+    def load_models(self, prompt):
+        """Keeps the graph's checkpoints loaded, evicting the oldest ones when VRAM runs out (call with lock held)."""
+        total = self.settings.vram_total
+        for node in prompt.values():
+            name = node.get('inputs', {}).get('ckpt_name')
+            if not isinstance(name, str):
+                continue
+            self.loaded_models.pop(name, None)
+            while self.loaded_models and sum(self.loaded_models.values()) + self.settings.model_vram + self.leaked > total:
+                self.loaded_models.popitem(last=False)
+            self.loaded_models[name] = self.settings.model_vram
+        self.leaked = min(self.leaked + self.settings.vram_leak, total - sum(self.loaded_models.values()))
+
+    def free(self, payload):
+        """POST /free: unload_models drops the loaded checkpoints, free_memory the leaked allocations."""
+        with self.lock:
+            if payload.get('unload_models'):
+                self.loaded_models.clear()
+            if payload.get('free_memory') or payload.get('unload_models'):
+                self.leaked = 0
+
+    def system_stats(self):
+        with self.lock:
+            used = min(sum(self.loaded_models.values()) + self.leaked, self.settings.vram_total)
+        return {
+            'system': {'os': os.name, 'comfyui_version': 'sim', 'python_version': '', 'embedded_python': False},
+            'devices': [{'name': 'sim', 'type': 'cpu', 'index': 0,
+                         'vram_total': self.settings.vram_total, 'vram_free': self.settings.vram_total - used,
+                         'torch_vram_total': used, 'torch_vram_free': self.leaked}]
+        }
+
+    def store_upload(self, content_type, body):
+        message = BytesParser(policy=default_policy).parsebytes(
+            b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+        fields, image = {}, None
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename():
+                image = (part.get_filename(), part.get_payload(decode=True))
+            else:
+                fields[name] = part.get_content().strip()
+        if image is None:
+            raise ValueError("No image in upload")
+        subfolder = fields.get('subfolder', '')
+        folder = os.path.join(self.input_dir, subfolder)
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.basename(image[0])
+        if fields.get('overwrite', 'false').lower() != 'true':
+            stem, ext = os.path.splitext(filename)
+            counter = 1
+            while os.path.exists(os.path.join(folder, filename)):
+                filename = f"{stem} ({counter}){ext}"
+                counter += 1
+        with open(os.path.join(folder, filename), 'wb') as f:
+            f.write(image[1])
+        return {'name': filename, 'subfolder': subfolder, 'type': 'input'}
+
+    # --- websocket --------------------------------------------------------------------------------
+
+    def add_client(self, client_id, connection):
+        with self.lock:
+            self.clients.setdefault(client_id, set()).add(connection)
+            queue_remaining = len(self.pending) + len(self.running)
+        connection.send_json({'type': 'status', 'data': {'status': {'exec_info': {'queue_remaining': queue_remaining}},
+                                                         'sid': client_id}})
+
+    def remove_client(self, client_id, connection):
+        with self.lock:
+            self.clients.get(client_id, set()).discard(connection)
+
+    def send(self, client_id, message=None, binary=None):
+        if not client_id:
+            return
+        with self.lock:
+            connections = list(self.clients.get(client_id, ()))
+        for connection in connections:
+            if binary is not None:
+                connection.send_binary(binary)
+            else:
+                connection.send_json(message)
+
+    def broadcast_status(self):
+        with self.lock:
+            queue_remaining = len(self.pending) + len(self.running)
+            connections = [c for group in self.clients.values() for c in group]
+        for connection in connections:
+            connection.send_json({'type': 'status', 'data': {'status': {'exec_info': {'queue_remaining': queue_remaining}}}})
+
+    # --- execution --------------------------------------------------------------------------------
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.stopping:
+                    self.changed.wait()
+                if self.stopping:
+                    return
+                item = self.pending.pop(0)
+                self.running[item[1]] = item
+            self.broadcast_status()
+            try:
+                self.execute(item)
+            except Exception as e:
+                logger.error(f"sim_server.SimServer: Simulated execution of {item[1]} failed: {e}")
+            finally:
+                with self.lock:
+                    self.running.pop(item[1], None)
+                    self.interrupted.discard(item[1])
+                self.broadcast_status()
+
+    def execute(self, item):
+        number, prompt_id, prompt, extra_data, outputs = item
+        client_id = extra_data.get('client_id')
+        settings = self.settings
+        messages = []
+
+        def event(event_type, data, record=True):
+            data = dict(data, prompt_id=prompt_id)
+            if record:
+                messages.append([event_type, data])
+            self.send(client_id, {'type': event_type, 'data': data})
+
+        width, height, batch_size = 512, 512, 1
+        steps, sampler_id, seed = 20, None, 0
+        for node_id, node in prompt.items():
+            inputs = node.get('inputs', {})
+            if node['class_type'] == 'EmptyLatentImage':
+                width, height = int(inputs.get('width', width)), int(inputs.get('height', height))
+                batch_size = int(inputs.get('batch_size', batch_size))
+            elif node['class_type'].startswith('KSampler') and sampler_id is None:
+                steps, sampler_id = int(inputs.get('steps', steps)), node_id
+                seed = inputs.get('seed', inputs.get('noise_seed', 0))
+
+        with self.lock:
+            self.load_models(prompt)
+            duration = settings.exec_time * batch_size * (1 + settings.jitter * (2 * self.random.random() - 1))
+            fails = self.random.random() < settings.exec_error_rate
+        event('execution_start', {'timestamp': now_ms()})
+        event('execution_cached', {'nodes': [], 'timestamp': now_ms()})
+        event('executing', {'node': sampler_id, 'display_node': sampler_id}, record=False)
+
+        status = 'success'
+        for step in range(1, steps + 1):
+            if duration > 0:
+                time.sleep(duration / steps)
+            with self.lock:
+                interrupted = prompt_id in self.interrupted
+            if interrupted:
+                event('execution_interrupted', {'node_id': sampler_id, 'node_type': 'KSampler', 'executed': [],
+                                                'timestamp': now_ms()})
+                status = 'error'
+                break
+            if fails and step == steps // 2:
+                event('execution_error', {'node_id': sampler_id, 'node_type': 'KSampler', 'executed': [],
+                                          'exception_message': 'Injected execution error', 'exception_type': 'RuntimeError',
+                                          'traceback': [], 'current_inputs': {}, 'current_outputs': {},
+                                          'timestamp': now_ms()})
+                status = 'error'
+                break
+            event('progress', {'value': step, 'max': steps, 'node': sampler_id}, record=False)
+            if settings.preview_every and step % settings.preview_every == 0 and client_id:
+                preview = png_bytes(32, 32, seed=hash((prompt_id, step)))
+                self.send(client_id, binary=struct.pack('>II', PREVIEW_IMAGE, PREVIEW_PNG) + preview)
+
+        node_outputs = {}
+        if status == 'success':
+            for node_id in outputs:
+                if prompt[node_id]['class_type'] in TEXT_NODES:
+                    node_outputs[node_id] = {'text': [self.simulated_text(prompt)]}
+                    event('executed', {'node': node_id, 'display_node': node_id, 'output': node_outputs[node_id]}, record=False)
+                    continue
+                images = self.save_images(prompt, node_id, extra_data, width, height, batch_size, seed)
+                node_outputs[node_id] = {'images': images}
+                event('executed', {'node': node_id, 'display_node': node_id, 'output': {'images': images}}, record=False)
+            event('execution_success', {'timestamp': now_ms()})
+        event('executing', {'node': None}, record=False)
+
+        with self.lock:
+            self.history[prompt_id] = {
+                'prompt': [number, prompt_id, prompt, extra_data, outputs],
+                'outputs': node_outputs,
+                'status': {'status_str': status, 'completed': status == 'success', 'messages': messages},
+                'meta': {node_id: {'node_id': node_id, 'display_node': node_id} for node_id in node_outputs}
+            }
+            while len(self.history) > settings.history_limit:
+                self.history.popitem(last=False)
+
+    @staticmethod
+    def simulated_text(prompt):
+        """Stand-in caption naming the images the graph loads."""
+        images = [node['inputs'].get('image', '') for node in prompt.values() if node['class_type'] == 'LoadImage']
+        return f"A simulated caption of {', '.join(images) or 'nothing'}."
+
+    def save_images(self, prompt, node_id, extra_data, width, height, batch_size, seed):
+        """Writes placeholder PNGs the way SaveImage names them: <prefix>_<counter>_.png."""
+        node = prompt[node_id]
+        image_type = OUTPUT_NODES[node['class_type']]
+        prefix = node.get('inputs', {}).get('filename_prefix', 'ComfyUI') if image_type == 'output' else 'ComfyUI_temp'
+        subfolder, name = os.path.split(prefix)
+        folder = os.path.join(self.output_dir, subfolder)
+        os.makedirs(folder, exist_ok=True)
+
+        text = {'prompt': json.dumps(prompt)}
+        for key, value in (extra_data.get('extra_pnginfo') or {}).items():
+            text[key] = json.dumps(value)
+        scale = max(1, self.settings.image_scale)
+        size = (max(8, width // scale), max(8, height // scale))
+
+        images = []
+        for batch_index in range(batch_size):
+            with self.lock:
+                counter = self.counters.get(prefix, 1)
+                self.counters[prefix] = counter + 1
+            filename = f"{name}_{counter:05d}_.png"
+            with open(os.path.join(folder, filename), 'wb') as f:
+                f.write(png_bytes(size[0], size[1], text, seed=hash((seed, batch_index))))
+            images.append({'filename': filename, 'subfolder': subfolder, 'type': image_type})
+        return images
+
+def bench(jobs=1000, threads=8, workflow_file='Randomizer.json', settings=None, validate=False):
+    """
+    Measures client-side throughput against an in-process SimServer.
+
+    Jobs are submitted through load_models.queue_workflow from `threads` threads,
+    then the history is polled until every accepted job has finished.
+
+    Returns:
+    - dict: Submitted/accepted counts, submit and end-to-end jobs per minute, submit latency percentiles.
+    """
+    from load_models import queue_workflow
+    from workflow_compiler import load_workflow
+
+    settings = settings or SimSettings(exec_time=0.0, jitter=0.0)
+    server = SimServer(port=0, settings=settings, output_dir=get_path('cache', 'sim_bench_output')).start()
+    try:
+        template = load_workflow(workflow_file, server=server.address)
+
+        def submit(index):
+            workflow = copy.deepcopy(template)
+            for node in workflow.values():
+                if node.get('class_type', '').startswith('KSampler') and 'seed' in node.get('inputs', {}):
+                    node['inputs']['seed'] = index
+            start = time.perf_counter()
+            response = queue_workflow(workflow, server=server.address, validate=validate, job={'bench_index': index})
+            return time.perf_counter() - start, response
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(submit, range(jobs)))
+        submit_time = time.perf_counter() - start
+        accepted = {response['prompt_id'] for _, response in results if response}
+
+        while True:
+            with server.lock:
+                done = len(accepted & set(server.history))
+                idle = not server.pending and not server.running
+            if done == len(accepted) or idle:
+                break
+            time.sleep(0.05)
+        total_time = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _ in results)
+        return {
+            'submitted': jobs,
+            'accepted': len(accepted),
+            'completed': done,
+            'submit_per_minute': round(jobs / submit_time * 60),
+            'end_to_end_per_minute': round(done / total_time * 60),
+            'submit_p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+            'submit_p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+        }
+    finally:
+        server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a simulated ComfyUI backend, or benchmark the client against one")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8188)
+    parser.add_argument('--output-dir', default=None, help="Folder for placeholder images (default: cache/sim_output)")
+    parser.add_argument('--object-info', default=None, help="Cached /object_info JSON to serve")
+    defaults = SimSettings()
+    for field, value in vars(defaults).items():
+        if field == 'seed':
+            parser.add_argument('--seed', type=int, default=None)
+        else:
+            parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument('--bench', type=int, default=0, metavar='JOBS', help="Benchmark queue_workflow with this many jobs and exit")
+    parser.add_argument('--threads', type=int, default=8, help="Submitting threads for --bench")
+    parser.add_argument('--validate', action='store_true', help="Validate graphs during --bench")
+    args = parser.parse_args()
+
+    settings = replace(defaults, **{field: getattr(args, field) for field in vars(defaults)})
+    if args.bench:
+        if not any(arg.startswith('--exec-time') for arg in sys.argv[1:]):
+            settings = replace(settings, exec_time=0.0, jitter=0.0)
+        print(json.dumps(bench(args.bench, args.threads, settings=settings, validate=args.validate), indent=4))
+        return
+
+    server = SimServer(args.host, args.port, settings, output_dir=args.output_dir, object_info=args.object_info).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
@@ -0,0 +1,140 @@
+"""
+Failure handling for queue_workflow.
+
+Failures are split into two classes:
+- rejected: the backend refused this payload (HTTP 4xx, or the local validator
+  found errors). Sending it again gives the same answer, so the job is written
+  to data/quarantine.jsonl with the server's node_errors and dropped.
+- transient: connection refused, timeouts, HTTP 5xx / 429, a connection that
+  drops before the response status arrives. These are retried
+  with exponential backoff. When the retries run out, the circuit breaker for
+  the backend opens and every submission waits until the backend answers again,
+  instead of failing one job after another while it restarts.
+"""
+
+import http.client
+import json
+import os
+import random
+import socket
+import threading
+import time
+import urllib.error
+from datetime import datetime
+from comfy_api import get_json, get_server
+from config import get_path
+from utils.logger_config import setup_logger
+
+logger = setup_logger(__name__)
+
+REJECTED = 'rejected'
+TRANSIENT = 'transient'
+
+# HTTP statuses that are worth retrying
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+def classify_failure(error):
+    """
+    Classifies an exception raised while posting a prompt.
+
+    Only failures before the backend answered reach this: once /prompt returned
+    200 the job is queued, and queue_workflow treats an unreadable body as accepted.
+
+    Returns:
+    - str: REJECTED or TRANSIENT.
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return TRANSIENT if error.code in TRANSIENT_STATUSES else REJECTED
+    if isinstance(error, (urllib.error.URLError, ConnectionError, socket.timeout, TimeoutError,
+                          http.client.HTTPException)):
+        return TRANSIENT
+    return REJECTED
+
+def read_error_body(error):
+    """Decodes the JSON error body ComfyUI sends with a 400 ({"error": ..., "node_errors": ...})."""
+    try:
+        body = error.read().decode('utf-8')
+    except Exception:
+        return {}
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError:
+        return {'error': body}
+
+def backoff_delay(attempt, base=2, cap=60):
+    """Exponential backoff with full jitter: a random delay up to base * 2^attempt, capped."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+_quarantine_lock = threading.Lock()
+
+def quarantine_path():
+    return get_path('data', 'quarantine.jsonl')
+
+def quarantine_job(workflow, reason, details=None, job=None, server=None, path=None):
+    """
+    Appends a rejected job to data/quarantine.jsonl so it can be inspected and fixed.
+
+    Parameters:
+    - workflow (dict): The graph that was rejected.
+    - reason (str): Short reason, e.g. 'validation' or 'http 400'.
+    - details (dict, optional): The server's error payload (error, node_errors) or local errors.
+    - job (dict, optional): Job parameters from the caller (checkpoint, loras, seed, ...).
+    """
+    path = path or quarantine_path()
+    record = {
+        'quarantined_at': datetime.now().isoformat(),
+        'server': get_server(server),
+        'reason': reason,
+        'details': details or {},
+        'job': job or {},
+        'prompt': workflow
+    }
+    with _quarantine_lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+    logger.warning(f"submission.quarantine_job: Quarantined job ({reason}) to {path}")
+
+class CircuitBreaker:
+    """
+    Per-backend breaker. It opens when a submission exhausts its retries on
+    transient errors. While it is open, wait_until_closed() probes /system_stats
+    with growing intervals and returns once the backend answers.
+    """
+
+    def __init__(self, probe_interval=5, max_probe_interval=300):
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.open_since = {}
+        self.lock = threading.Lock()
+
+    def is_open(self, server=None):
+        return get_server(server) in self.open_since
+
+    def trip(self, server=None):
+        server = get_server(server)
+        with self.lock:
+            if server not in self.open_since:
+                self.open_since[server] = time.time()
+                logger.error(f"submission.CircuitBreaker: Backend {server} unavailable, pausing submissions")
+
+    def reset(self, server=None):
+        server = get_server(server)
+        with self.lock:
+            opened = self.open_since.pop(server, None)
+        if opened is not None:
+            logger.info(f"submission.CircuitBreaker: Backend {server} is back after {time.time() - opened:.0f}s, resuming")
+
+    def wait_until_closed(self, server=None):
+        """Blocks while the breaker is open, probing the backend until it responds."""
+        interval = self.probe_interval
+        while self.is_open(server):
+            try:
+                get_json('/system_stats', server=server, timeout=10)
+                self.reset(server)
+            except (OSError, ValueError):
+                logger.info(f"submission.CircuitBreaker: {get_server(server)} still down, next probe in {interval}s")
+                time.sleep(interval)
+                interval = min(interval * 2, self.max_probe_interval)
+
+breaker = CircuitBreaker()
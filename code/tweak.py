@@ -1,14 +1,14 @@
 import json
 import os
 from PIL import Image
-from load_models import queue_workflow, load_models_into_workflow, get_model_params
-import time
-from config import get_path
-from utils.logger_config import setup_logger
+from load_models import load_models_into_workflow, get_model_params
+from utils.logger_config import configure_logging, setup_logger
 from node_manipulation import update_node_input, set_resolution, get_node_ID, set_lora
 from datetime import datetime
-from upscale import extract_metadata
-import csv
+from upscale import extract_metadata, select_variant
+from utils.catalog import load_table
+from dedup_index import DEFAULT_MAX_DISTANCE, DedupIndex, filter_duplicates, move_duplicates
+from scheduler import INTERACTIVE, Scheduler
 
 logger = setup_logger(__name__)
 
@@ -29,23 +29,25 @@ def get_loras_from_workflow(workflow):
 
 def get_lora_params(lora_name):
     """Get LoRA parameters from models.csv"""
-    with open(get_path('res', 'models.csv'), newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['Type'] == 'Lora' and row['Name'] == lora_name:
-                return {
-                    'weight_from': float(row['Weight_from']) if row['Weight_from'] else 1.0,
-                    'weight_to': float(row['Weight_to']) if row['Weight_to'] else 1.0
-                }
+    row = load_table('models').find_row('Name', lora_name, Type='Lora')
+    if row:
+        return {
+            'weight_from': float(row['Weight_from']) if row['Weight_from'] else 1.0,
+            'weight_to': float(row['Weight_to']) if row['Weight_to'] else 1.0
+        }
     return None
 
-def tweak_image(image_path, num_tweaks=5):
+def tweak_image(image_path, num_tweaks=5, scheduler=None):
     """
     Tweak an image by adjusting LoRA weights and generate variations.
     
     Parameters:
     - image_path: Path to the image to tweak
     - num_tweaks: Number of variations to generate (default: 5)
+    - scheduler: Scheduler to submit through (default: an interactive 'tweak' one)
+
+    Returns:
+    - bool: True if at least one variation was queued.
     """
     logger.info(f"tweak.tweak_image: Processing {image_path}")
     
@@ -53,15 +55,19 @@ def tweak_image(image_path, num_tweaks=5):
     metadata = extract_metadata(image_path)
     if not metadata or 'workflow' not in metadata:
         logger.error(f"tweak.tweak_image: No valid workflow found in metadata for {image_path}")
-        return
+        return False
     
+    scheduler = scheduler or Scheduler('tweak', priority=INTERACTIVE)
+
     # Get original workflow and extract LoRA information
     workflow = metadata['workflow']
+    # a packed job's graph renders all its variants; tweak only this one
+    select_variant(workflow, os.path.basename(image_path))
     original_loras = get_loras_from_workflow(workflow)
     
     if not original_loras:
         logger.error(f"tweak.tweak_image: No LoRAs found in workflow for {image_path}")
-        return
+        return False
     
     # Create output directory if it doesn't exist
     output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), '98-Tweaked')
@@ -71,6 +77,7 @@ def tweak_image(image_path, num_tweaks=5):
     base_filename = os.path.splitext(os.path.basename(image_path))[0]
     
     # Generate variations
+    queued = 0
     for tweak_num in range(num_tweaks):
         # Create a new workflow for each tweak
         tweaked_workflow = workflow.copy()
@@ -99,29 +106,52 @@ def tweak_image(image_path, num_tweaks=5):
         
         # Queue the workflow
         logger.info(f"tweak.tweak_image: Queuing tweaked workflow {tweak_num+1}")
-        queue_workflow(tweaked_workflow)
-        
-        # Wait between generations
-        time.sleep(30)  # Adjust sleep time as needed
-        
+        # Interactive work goes to the front of the backend queue, ahead of held bulk jobs
+        if scheduler.submit(tweaked_workflow):
+            queued += 1
+        else:
+            logger.error(f"tweak.tweak_image: Tweaked workflow {tweak_num+1} was not queued")
+    return queued > 0
+
 
-def process_directory():
-    """Process all images in the to_tweak directory"""
+def process_directory(dedup=True, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Process all images in the to_tweak directory
+
+    Parameters:
+    - dedup (bool): Skip near-duplicates of images tweaked before; they are moved to to_tweak/duplicates
+    - max_distance (int): Largest perceptual-hash distance counted as a near-duplicate
+    """
     processing_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'to_tweak')
     
     if not os.path.exists(processing_dir):
         logger.error("tweak.process_directory: Processing directory does not exist")
         return
     
-    for image_file in os.listdir(processing_dir):
-        if image_file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-            image_path = os.path.join(processing_dir, image_file)
-            tweak_image(image_path)
-            
-            # Move processed image to a 'processed' subdirectory
-            processed_dir = os.path.join(processing_dir, 'processed')
-            os.makedirs(processed_dir, exist_ok=True)
-            os.rename(image_path, os.path.join(processed_dir, image_file))
+    image_paths = [os.path.join(processing_dir, f) for f in os.listdir(processing_dir)
+                   if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif'))]
+    if dedup:
+        dedup_index = DedupIndex('tweak')
+        unique, duplicates = filter_duplicates(image_paths, dedup_index, max_distance)
+        move_duplicates(processing_dir, duplicates)
+    else:
+        unique = [(path, None) for path in image_paths]
+
+    scheduler = Scheduler('tweak', priority=INTERACTIVE)
+    for image_path, image_hash in unique:
+        image_file = os.path.basename(image_path)
+        if not tweak_image(image_path, scheduler=scheduler):
+            # left in to_tweak and not indexed, so it is picked up again on the next run
+            continue
+        if dedup and image_hash is not None:
+            dedup_index.add(image_file, image_hash)
+            dedup_index.save()
+        
+        # Move processed image to a 'processed' subdirectory
+        processed_dir = os.path.join(processing_dir, 'processed')
+        os.makedirs(processed_dir, exist_ok=True)
+        os.rename(image_path, os.path.join(processed_dir, image_file))
+    scheduler.close()
 
 def main():
     try:
@@ -130,5 +160,6 @@ def main():
         logger.error(f"tweak.main: Unexpected error: {str(e)}")
 
 if __name__ == "__main__":
+    configure_logging()
     main()
 
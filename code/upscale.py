@@ -1,11 +1,17 @@
 import json
 import os
 from PIL import Image
-from load_models import queue_workflow, set_KSampler
+from load_models import set_KSampler
 import time
 from config import get_path
-from utils.logger_config import setup_logger
-from node_manipulation import update_node_input, set_resolution, get_node_ID
+from utils.logger_config import configure_logging, setup_logger
+from node_manipulation import update_node_input, set_resolution, get_node_ID, select_batch_item
+from ledger import output_index
+from scheduler import NORMAL, Scheduler
+from server_hygiene import ServerHygiene
+from cost_model import estimate as estimate_duration, spec_from_workflow
+from quality_gate import IMAGE_EXTENSIONS, gate_images
+from dedup_index import DEFAULT_MAX_DISTANCE, DedupIndex, filter_duplicates, move_duplicates
 from datetime import datetime
 
 logger = setup_logger(__name__)
@@ -35,6 +41,29 @@ def extract_metadata(image_path):
         logger.error(f"Error extracting metadata from {image_path}: {str(e)}")
         return None
 
+def select_variant(workflow, image_file):
+    """
+    Reduces the graph embedded in a packed job's image to the variant saved as image_file.
+
+    The embedded graph renders all variants of the job; re-queued unchanged, upscaling or
+    tweaking one image would render every one of them again.
+
+    Returns:
+    - bool: False if the variant could not be identified (the graph is left unchanged).
+    """
+    latent_id = get_node_ID(workflow, "Empty Latent Image")
+    if latent_id is None or int(workflow[latent_id]['inputs'].get('batch_size', 1)) <= 1:
+        return True
+    save_id = get_node_ID(workflow, "Save Image")
+    prefix = os.path.basename(workflow[save_id]['inputs'].get('filename_prefix', '')) if save_id else ''
+    # SaveImage writes a job's variants in batch order, so the file counter gives the batch index
+    batch_index = output_index(image_file, prefix)
+    if batch_index is None:
+        logger.warning(f"upscale.select_variant: Cannot tell which variant {image_file} is, all of them will be rendered")
+        return False
+    select_batch_item(workflow, "Empty Latent Image", batch_index)
+    return True
+
 def determine_up_res(base_width, base_height, new_width=None, new_height=None):
     if new_width is not None and new_height is not None:
         return new_width, new_height
@@ -49,83 +78,135 @@ def determine_up_res(base_width, base_height, new_width=None, new_height=None):
     else:
         return None
 
-def upscale_images(new_width=None, new_height=None):
+def reject_images(to_upscale, rejected):
+    """Moves images that failed the quality gate to to_upscale/rejected"""
+    rejected_dir = os.path.join(to_upscale, 'rejected')
+    os.makedirs(rejected_dir, exist_ok=True)
+    for result in rejected:
+        os.rename(result['path'], os.path.join(rejected_dir, os.path.basename(result['path'])))
+
+def upscale_images(new_width=None, new_height=None, adaptive_sleep=False, quality_gate=True, dedup=True,
+                   max_distance=DEFAULT_MAX_DISTANCE, hygiene=True, weight=1.0):
     """
     Process images in the to_upscale directory and execute workflows
     
     Parameters:
     - new_width (int): New width for the images
     - new_height (int): New height for the images
+    - adaptive_sleep (bool): Sleep for the cost model's estimate of the queued jobs instead of SLEEP_DURATION
+    - quality_gate (bool): Only upscale images that pass quality_gate; the others are moved to to_upscale/rejected
+    - dedup (bool): Skip near-duplicates of images upscaled before; they are moved to to_upscale/duplicates
+    - max_distance (int): Largest perceptual-hash distance counted as a near-duplicate
+    - hygiene (bool): /free the generation models first if the backend is idle, prune the history
+      of queued jobs and hold jobs while VRAM is short (see server_hygiene)
+    - weight (float): Share of the backend against other campaigns of the same priority (see scheduler)
     """
     # Use get_path to get the correct to_upscale directory path
     to_upscale = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'to_upscale')
     image_count = 0
     SLEEP_INTERVAL = 5  # Process 5 images before sleeping
     SLEEP_DURATION = 1800  # Sleep for 30 minutes
+    queued_estimate = 0  # estimated seconds of work queued since the last sleep
     
     # Create to_upscale directory if it doesn't exist
     os.makedirs(to_upscale, exist_ok=True)
 
-    for image_file in os.listdir(to_upscale):
-        if image_file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-            image_path = os.path.join(to_upscale, image_file)
-            logger.info(f"upscale.process_images: Processing {image_file}")
+    image_files = [f for f in os.listdir(to_upscale) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    if quality_gate:
+        passed, rejected = gate_images([os.path.join(to_upscale, f) for f in image_files])
+        reject_images(to_upscale, rejected)
+        image_files = [os.path.basename(result['path']) for result in passed]
+
+    hashes = {}
+    if dedup:
+        dedup_index = DedupIndex('upscale')
+        unique, duplicates = filter_duplicates([os.path.join(to_upscale, f) for f in image_files], dedup_index, max_distance)
+        move_duplicates(to_upscale, duplicates)
+        hashes = {os.path.basename(path): value for path, value in unique}
+        image_files = list(hashes)
+
+    server_hygiene = ServerHygiene() if hygiene else None
+    scheduler = Scheduler('upscale', priority=NORMAL, weight=weight)
+    if server_hygiene and image_files:
+        server_hygiene.free_if_idle('switching to upscale')
+
+    for image_file in image_files:
+        image_path = os.path.join(to_upscale, image_file)
+        logger.info(f"upscale.process_images: Processing {image_file}")
+        
+        # Extract metadata including workflow
+        metadata = extract_metadata(image_path)
+        if not metadata or 'workflow' not in metadata:
+            logger.error(f"upscale.process_images: Skipping {image_file} - no valid workflow in metadata")
+            continue
+        
+        workflow = metadata['workflow']
+        select_variant(workflow, image_file)
+        resolution = metadata['resolution']
+        base_width, base_height = resolution
+
+        # Determine new resolution based on provided new_width and new_height
+        up_res = determine_up_res(base_width=base_width, base_height=base_height, 
+                                new_width=new_width, new_height=new_height)
+        
+        if up_res is None:
+            logger.error(f"Could not determine upscale resolution for {image_file}")
+            continue
+
+        try:
+            # Set resolution for upscale nodes - note we're using tuple unpacking here
+            width, height = up_res  # Unpack the tuple
+            set_resolution(workflow, "Up_res", width=width, height=height)
             
-            # Extract metadata including workflow
-            metadata = extract_metadata(image_path)
-            if not metadata or 'workflow' not in metadata:
-                logger.error(f"upscale.process_images: Skipping {image_file} - no valid workflow in metadata")
-                continue
+            # Update Save Image node to use upscaled output
+            update_node_input(workflow, "Save Image", "images", "VAE Decode_scaled")
             
-            workflow = metadata['workflow']
-            resolution = metadata['resolution']
-            base_width, base_height = resolution
+            # Update output filename to indicate upscaled version
+            base_name = os.path.splitext(image_file)[0]
+            workflow[get_node_ID(workflow, "Save Image")]["inputs"]["filename_prefix"] = f"{base_name}_upscaled"
 
-            # Determine new resolution based on provided new_width and new_height
-            up_res = determine_up_res(base_width=base_width, base_height=base_height, 
-                                    new_width=new_width, new_height=new_height)
+            # set the KSampler node values
+            set_KSampler(workflow, nodeTitle="KS_up", seed=888, steps=10, cfg=7, sampler_name='dpmpp_2m', scheduler='karras', denoise=0.4)
             
-            if up_res is None:
-                logger.error(f"Could not determine upscale resolution for {image_file}")
+            # Queue the modified workflow
+            logger.info(f"upscale.process_images: Queuing workflow for {image_file}")
+            response = scheduler.submit(workflow, before_send=server_hygiene.wait_for_vram if server_hygiene else None,
+                                        job={'source_image': image_file})
+            if not response:
+                # left in to_upscale so it is picked up again on the next run
+                logger.error(f"upscale.process_images: {image_file} was not queued")
                 continue
+            if server_hygiene:
+                server_hygiene.track(response.get('prompt_id'))
+            logger.info(f"upscale.process_images: Successfully queued workflow for {image_file}")
+            if hashes.get(image_file) is not None:
+                dedup_index.add(image_file, hashes[image_file])
+                dedup_index.save()
+            
+            # Move processed image to a 'processed' folder
+            processed_dir = os.path.join(to_upscale, 'processed')
+            os.makedirs(processed_dir, exist_ok=True)
+            os.rename(image_path, os.path.join(processed_dir, image_file))
+            
+            # Increment image counter
+            image_count += 1
+            queued_estimate += estimate_duration(spec_from_workflow(workflow))
+            
+            # Check if we need to sleep
+            if image_count % SLEEP_INTERVAL == 0:
+                sleep_duration = queued_estimate if adaptive_sleep else SLEEP_DURATION
+                logger.info(f"Processed {SLEEP_INTERVAL} images. Sleeping for {sleep_duration/60:.1f} minutes...")
+                time.sleep(sleep_duration)
+                queued_estimate = 0
+                logger.info("Resuming processing...")
+            
+        except Exception as e:
+            logger.error(f"Error processing {image_file}: {str(e)}")
+            continue
 
-            try:
-                # Set resolution for upscale nodes - note we're using tuple unpacking here
-                width, height = up_res  # Unpack the tuple
-                set_resolution(workflow, "Up_res", width=width, height=height)
-                
-                # Update Save Image node to use upscaled output
-                update_node_input(workflow, "Save Image", "images", "VAE Decode_scaled")
-                
-                # Update output filename to indicate upscaled version
-                base_name = os.path.splitext(image_file)[0]
-                workflow[get_node_ID(workflow, "Save Image")]["inputs"]["filename_prefix"] = f"{base_name}_upscaled"
-
-                # set the KSampler node values
-                set_KSampler(workflow, nodeTitle="KS_up", seed=888, steps=10, cfg=7, sampler_name='dpmpp_2m', scheduler='karras', denoise=0.4)
-                
-                # Queue the modified workflow
-                logger.info(f"upscale.process_images: Queuing workflow for {image_file}")
-                queue_workflow(workflow)
-                logger.info(f"upscale.process_images: Successfully queued workflow for {image_file}")
-                
-                # Move processed image to a 'processed' folder
-                processed_dir = os.path.join(to_upscale, 'processed')
-                os.makedirs(processed_dir, exist_ok=True)
-                os.rename(image_path, os.path.join(processed_dir, image_file))
-                
-                # Increment image counter
-                image_count += 1
-                
-                # Check if we need to sleep
-                if image_count % SLEEP_INTERVAL == 0:
-                    logger.info(f"Processed {SLEEP_INTERVAL} images. Sleeping for {SLEEP_DURATION/60} minutes...")
-                    time.sleep(SLEEP_DURATION)
-                    logger.info("Resuming processing...")
-                
-            except Exception as e:
-                logger.error(f"Error processing {image_file}: {str(e)}")
-                continue
+    scheduler.close()
+    if server_hygiene:
+        server_hygiene.close()
 
     # After processing all images, save the last workflow if any were processed
     if image_count > 0:
@@ -145,4 +226,5 @@ def main():
         logger.error(f"Unexpected error: {str(e)}")
 
 if __name__ == "__main__":
+    configure_logging()
     main()
\ No newline at end of file
@@ -0,0 +1,285 @@
+"""
+Compiled, columnar form of the CSV resources in res/.
+
+`python code/utils/catalog.py` compiles models.csv, art_styles.csv and objects.csv
+into cache/catalog.pkl. Each column is an array of ids into one shared, interned
+string table, and flag/category columns get precomputed bitmaps (Python ints, one
+bit per row) so filters such as "Lora, SD 1.5, not excluded" are a few integer
+ANDs. Rows are only turned into dicts when they are actually selected.
+
+Runtime modules call load_table(). It uses the compiled file when present and not
+older than the CSV it was built from; otherwise the CSV is compiled in memory, so
+hand edits to the CSVs are always picked up.
+"""
+
+import os
+import csv
+import pickle
+import argparse
+from array import array
+import sys
+
+# Add the parent directory to the Python path so we can import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import get_path
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+CATALOG_VERSION = 1
+
+TABLES = {
+    'models': {
+        'file': 'models.csv',
+        'flags': ['Excluded'],
+        'categories': ['Type', 'Base', 'Location', 'Category'],
+        'keys': ['Name']
+    },
+    'art_styles': {
+        'file': 'art_styles.csv',
+        'flags': ['included'],
+        'categories': [],
+        'keys': ['name']
+    },
+    'objects': {
+        'file': 'objects.csv',
+        'flags': [],
+        'categories': ['type'],
+        'keys': ['serial_no']
+    },
+}
+
+def is_flag_set(value):
+    """Flag columns use 'y' / 'Y' for yes."""
+    return (value or '').strip().lower() == 'y'
+
+def iter_bits(mask):
+    """Yields the row ids set in a bitmap, in ascending order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def bitmap_from_ids(row_ids):
+    """Builds a bitmap from row ids in linear time (avoids repeated big-int ORs)."""
+    if not row_ids:
+        return 0
+    bits = bytearray(max(row_ids) // 8 + 1)
+    for i in row_ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+def read_csv_rows(path):
+    """Reads a CSV as utf-8, falling back to latin-1 for files saved by older editors."""
+    try:
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            reader = csv.DictReader(csvfile)
+            return reader.fieldnames, list(reader)
+    except UnicodeDecodeError:
+        with open(path, newline='', encoding='latin-1') as csvfile:
+            reader = csv.DictReader(csvfile)
+            return reader.fieldnames, list(reader)
+
+class Table:
+    """
+    One compiled CSV table.
+
+    Parameters:
+    - strings (list of str): Shared interned string table.
+    - fieldnames (list of str): Column names in CSV order.
+    - columns (dict): Column name -> array('I') of string ids.
+    - flags (dict): Flag column -> bitmap of rows where the flag is 'y'.
+    - categories (dict): Category column -> {value: bitmap}.
+    - keys (dict): Key column -> {value: [row ids]}.
+    """
+
+    def __init__(self, strings, fieldnames, columns, flags, categories, keys):
+        self.strings = strings
+        self.fieldnames = fieldnames
+        self.columns = columns
+        self.flags = flags
+        self.categories = categories
+        self.keys = keys
+        self.size = len(columns[fieldnames[0]]) if fieldnames else 0
+        self.all = (1 << self.size) - 1
+        self._rows = [None] * self.size
+        self._folded_keys = {}
+
+    def value(self, row_id, column):
+        return self.strings[self.columns[column][row_id]]
+
+    def row(self, row_id):
+        """Returns the row as a dict (shared, do not modify)."""
+        row = self._rows[row_id]
+        if row is None:
+            row = {name: self.strings[self.columns[name][row_id]] for name in self.fieldnames}
+            self._rows[row_id] = row
+        return row
+
+    def rows(self, mask=None):
+        """Returns the rows selected by a bitmap (all rows if mask is None), in CSV order."""
+        if mask is None:
+            return [self.row(i) for i in range(self.size)]
+        return [self.row(i) for i in iter_bits(mask)]
+
+    def flag(self, column):
+        """Bitmap of rows where a flag column is set."""
+        return self.flags.get(column, 0)
+
+    def equals(self, column, value):
+        """Bitmap of rows where a category column equals value exactly."""
+        return self.categories.get(column, {}).get(value, 0)
+
+    def matching(self, column, predicate):
+        """Bitmap of rows whose category value satisfies predicate (evaluated once per distinct value)."""
+        mask = 0
+        for value, bits in self.categories.get(column, {}).items():
+            if predicate(value):
+                mask |= bits
+        return mask
+
+    def select(self, **equals):
+        """Bitmap of rows where every given category column equals the given value."""
+        mask = self.all
+        for column, value in equals.items():
+            mask &= self.equals(column, value)
+        return mask
+
+    def find(self, column, value):
+        """Row ids with the given value in a key column."""
+        return self.keys.get(column, {}).get(value, [])
+
+    def find_casefold(self, column, value):
+        """Row ids whose key column equals value, ignoring case."""
+        folded = self._folded_keys.get(column)
+        if folded is None:
+            folded = {}
+            for key, row_ids in self.keys.get(column, {}).items():
+                folded.setdefault(key.lower(), []).extend(row_ids)
+            self._folded_keys[column] = folded
+        return sorted(folded.get(value.lower(), []))
+
+    def find_row(self, column, value, **equals):
+        """First row with a key value that also matches the given category values, or None."""
+        for row_id in self.find(column, value):
+            if all(self.value(row_id, c) == v for c, v in equals.items()):
+                return self.row(row_id)
+        return None
+
+def compile_table(fieldnames, rows, spec, strings, string_ids):
+    """Builds the columnar representation of one table, interning into strings/string_ids."""
+    def intern(value):
+        value = value if value is not None else ''
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = len(strings)
+            strings.append(value)
+            string_ids[value] = string_id
+        return string_id
+
+    columns = {name: array('I', (intern(row.get(name)) for row in rows)) for name in fieldnames}
+
+    flags = {}
+    for column in spec['flags']:
+        flags[column] = bitmap_from_ids([i for i, row in enumerate(rows) if is_flag_set(row.get(column))])
+
+    categories = {}
+    for column in spec['categories']:
+        values = {}
+        for i, row in enumerate(rows):
+            values.setdefault(row.get(column) or '', []).append(i)
+        categories[column] = {value: bitmap_from_ids(ids) for value, ids in values.items()}
+
+    keys = {}
+    for column in spec['keys']:
+        index = {}
+        for i, row in enumerate(rows):
+            index.setdefault(row.get(column) or '', []).append(i)
+        keys[column] = index
+
+    return {'fieldnames': fieldnames, 'columns': columns, 'flags': flags, 'categories': categories, 'keys': keys}
+
+def source_stat(table_name):
+    stat = os.stat(get_path('res', TABLES[table_name]['file']))
+    return (stat.st_size, stat.st_mtime_ns)
+
+def compile_catalog(output_path=None):
+    """
+    Compiles every CSV table into one pickle file.
+
+    Returns:
+    - str: Path of the compiled catalog.
+    """
+    output_path = output_path or get_path('cache', 'catalog.pkl')
+    strings, string_ids = [], {}
+    tables, sources = {}, {}
+    for name, spec in TABLES.items():
+        fieldnames, rows = read_csv_rows(get_path('res', spec['file']))
+        tables[name] = compile_table(fieldnames, rows, spec, strings, string_ids)
+        sources[name] = source_stat(name)
+        logger.info(f"catalog.compile_catalog: {name}: {len(rows)} rows")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'version': CATALOG_VERSION, 'sources': sources, 'strings': strings, 'tables': tables},
+                    f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, output_path)
+    logger.info(f"catalog.compile_catalog: Wrote {output_path} ({len(strings)} distinct strings)")
+    return output_path
+
+_compiled = {'stat': None, 'data': None}
+_tables = {}  # table name -> (source stat, Table)
+
+def _load_compiled():
+    """Loads cache/catalog.pkl, re-reading it only when the file changed."""
+    path = get_path('cache', 'catalog.pkl')
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_size, stat.st_mtime_ns)
+    if _compiled['stat'] != key:
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"catalog: Could not read {path}: {e}")
+            return None
+        _compiled['stat'], _compiled['data'] = key, data if data.get('version') == CATALOG_VERSION else None
+    return _compiled['data']
+
+def load_table(name):
+    """
+    Returns the Table for 'models', 'art_styles' or 'objects'.
+
+    The compiled catalog is used when it was built from the current CSV; otherwise
+    the CSV is compiled in memory. Either way the result is cached until the CSV changes.
+    """
+    stat = source_stat(name)
+    cached = _tables.get(name)
+    if cached and cached[0] == stat:
+        return cached[1]
+
+    data = _load_compiled()
+    if data and tuple(data['sources'].get(name, ())) == stat:
+        compiled, strings = data['tables'][name], data['strings']
+    else:
+        strings = []
+        fieldnames, rows = read_csv_rows(get_path('res', TABLES[name]['file']))
+        compiled = compile_table(fieldnames, rows, TABLES[name], strings, {})
+
+    table = Table(strings, **compiled)
+    _tables[name] = (stat, table)
+    return table
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the CSV resources into cache/catalog.pkl")
+    parser.add_argument('--output', default=None, help="Output path (default: cache/catalog.pkl)")
+    args = parser.parse_args()
+    compile_catalog(args.output)
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
@@ -1,46 +1,328 @@
 import yaml
 import os
-from pathlib import Path
-from config import get_path
+import dataclasses
+import typing
+from dataclasses import dataclass, field
+from typing import Dict, List, Union
+from config import PATHS
 from utils.logger_config import setup_logger
 
 logger = setup_logger(__name__)
 
+class ConfigError(ValueError):
+    """Raised when a configuration file does not match the expected schema."""
+
+@dataclass(frozen=True)
+class SamplerSettings:
+    steps: int = 30
+    cfg: float = 6
+    sampler_name: str = 'dpmpp_2m'
+    scheduler: str = 'karras'
+    denoise: float = 1.0
+
+@dataclass(frozen=True)
+class CheckpointPool:
+    base: str = 'SD 1.5'
+    skip_external: bool = True
+
+@dataclass(frozen=True)
+class PayloadSettings:
+    """graph_optimizer passes applied to each queued graph. All off keeps images upscalable/tweakable."""
+    prune: bool = False
+    fold_switches: bool = False
+    strip_meta: bool = False
+
+@dataclass(frozen=True)
+class PlanSettings:
+    """Covering plan instead of random picks (planner.py)."""
+    enabled: bool = False
+    strength: int = 2  # cover every combination of this many of checkpoint, style and LoRA
+    seed: int = 0
+
+@dataclass(frozen=True)
+class CampaignSettings:
+    """Shared campaign across client hosts (campaign.py). Jobs come from the covering plan."""
+    enabled: bool = False
+    name: str = ''  # defaults to the config name
+    store: str = ''  # SQLite file on a shared volume, empty means data/campaign.sqlite
+    chunk_size: int = 20
+    lease_seconds: float = 300
+
+@dataclass(frozen=True)
+class EarlyAbortSettings:
+    """Preview-and-abort (early_abort.py). Needs the backend started with a --preview-method."""
+    enabled: bool = False
+    scorer: str = 'not_blank'
+    threshold: float = 8.0
+    min_step: int = 8
+    patience: int = 2
+
+@dataclass(frozen=True)
+class PromptSettings:
+    compact: bool = True
+    max_chunks: int = 0  # CLIP chunks of 75 tokens, 0 = dedupe only
+    positive_template: str = ''  # prompt_template text, empty = fixed object/trigger/style/quality order
+    negative_template: str = ''
+
+@dataclass(frozen=True)
+class HygieneSettings:
+    prune_every: int = 50  # delete collected /history entries every N jobs, 0 = never
+    free_on_phase_change: bool = True  # /free when the checkpoint base changes
+    min_free_vram: float = 0.0  # hold jobs below this free fraction of VRAM, 0 = never
+    pressure_free_interval: int = 50  # fewest jobs between two /free calls for VRAM pressure
+
+@dataclass(frozen=True)
+class RunConfig:
+    """Typed settings for one run.py campaign, built from base_config.yaml + a workflow yaml."""
+    name: str
+    workflow_file: str
+    server: str = ''  # empty means config.SERVER_ADDRESS
+    iterations: int = 500
+    width: int = 512
+    height: int = 512
+    upscale_ratio: float = 2
+    run_with_upscale: bool = True
+    sleep_time_up: float = 80
+    sleep_time_regular: float = 30
+    max_backend_queue: int = 2  # hold jobs while this many are pending on the backend, 0 = never hold
+    share_weight: float = 1.0  # backend share against other campaigns of the same priority (scheduler.py)
+    adaptive_sleep: bool = False  # sleep for the cost model's estimate instead of the fixed times
+    use_random_seed: bool = True
+    jobs_per_iteration: int = 1
+    variants_per_job: int = 1
+    use_art_style: bool = True
+    object_type: str = 'target'
+    checkpoint: str = ''
+    random_checkpoint: bool = True
+    checkpoint_pool: CheckpointPool = field(default_factory=CheckpointPool)
+    set_vae: bool = False
+    vae_name: str = ''
+    fixed_loras: List[str] = field(default_factory=list)
+    lora_categories: Dict[str, Union[int, str]] = field(default_factory=dict)
+    embeddings: List[str] = field(default_factory=list)
+    clip_skip: int = -2
+    resize_control_image: bool = True
+    sampler: SamplerSettings = field(default_factory=SamplerSettings)
+    upscale_sampler: SamplerSettings = field(default_factory=lambda: SamplerSettings(steps=10, cfg=4, denoise=0.6))
+    plan: PlanSettings = field(default_factory=PlanSettings)
+    campaign: CampaignSettings = field(default_factory=CampaignSettings)
+    early_abort: EarlyAbortSettings = field(default_factory=EarlyAbortSettings)
+    prompt: PromptSettings = field(default_factory=PromptSettings)
+    hygiene: HygieneSettings = field(default_factory=HygieneSettings)
+    payload: PayloadSettings = field(default_factory=PayloadSettings)
+
+    def __post_init__(self):
+        for name in ('iterations', 'jobs_per_iteration', 'variants_per_job', 'width', 'height'):
+            if getattr(self, name) < 1:
+                raise ConfigError(f"{name}: must be at least 1")
+        if self.upscale_ratio <= 0:
+            raise ConfigError("upscale_ratio: must be greater than 0")
+        if self.max_backend_queue < 0:
+            raise ConfigError("max_backend_queue: must be 0 (no holding) or more")
+        if self.share_weight <= 0:
+            raise ConfigError("share_weight: must be greater than 0")
+        if not 1 <= self.plan.strength <= 3:
+            raise ConfigError("plan.strength: must be 1, 2 or 3")
+        if self.campaign.chunk_size < 1:
+            raise ConfigError("campaign.chunk_size: must be at least 1")
+        if self.campaign.lease_seconds < 30:
+            raise ConfigError("campaign.lease_seconds: must be at least 30")
+        if self.prompt.max_chunks < 0:
+            raise ConfigError("prompt.max_chunks: must be 0 (no limit) or more")
+        if self.hygiene.prune_every < 0:
+            raise ConfigError("hygiene.prune_every: must be 0 (never) or more")
+        if not 0 <= self.hygiene.min_free_vram < 1:
+            raise ConfigError("hygiene.min_free_vram: must be a fraction between 0 (never hold) and 1")
+        if self.hygiene.pressure_free_interval < 1:
+            raise ConfigError("hygiene.pressure_free_interval: must be at least 1")
+        if self.prompt.positive_template or self.prompt.negative_template:
+            from gen_prompt import CONTEXT_FIELDS
+            from prompt_template import TemplateError, compile_template
+            for name in ('positive_template', 'negative_template'):
+                try:
+                    compile_template(getattr(self.prompt, name)).check_references(CONTEXT_FIELDS)
+                except TemplateError as e:
+                    raise ConfigError(f"prompt.{name}: {e}") from None
+
+def deep_merge(base, override):
+    """Recursively merge two dicts, values from override win."""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def _check_value(value, expected, path):
+    """Validate (and lightly coerce) a single value against a type annotation."""
+    origin = typing.get_origin(expected)
+
+    if dataclasses.is_dataclass(expected):
+        return build_config(expected, value, path)
+    if origin is Union:
+        for option in typing.get_args(expected):
+            if option is type(None) and value is None:
+                return None
+            try:
+                return _check_value(value, option, path)
+            except ConfigError:
+                continue
+        raise ConfigError(f"{path}: {value!r} does not match any of {typing.get_args(expected)}")
+    if origin in (list, List):
+        if not isinstance(value, list):
+            raise ConfigError(f"{path}: expected a list, got {type(value).__name__}")
+        (item_type,) = typing.get_args(expected)
+        return [_check_value(item, item_type, f"{path}[{i}]") for i, item in enumerate(value)]
+    if origin in (dict, Dict):
+        if not isinstance(value, dict):
+            raise ConfigError(f"{path}: expected a mapping, got {type(value).__name__}")
+        key_type, value_type = typing.get_args(expected)
+        return {_check_value(k, key_type, f"{path}.<key>"): _check_value(v, value_type, f"{path}.{k}") for k, v in value.items()}
+    if expected is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ConfigError(f"{path}: expected a number, got {value!r}")
+        return float(value)
+    if expected is int:
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ConfigError(f"{path}: expected an integer, got {value!r}")
+        return value
+    if expected is str:
+        if value is None:
+            return ''
+        if not isinstance(value, str):
+            raise ConfigError(f"{path}: expected a string, got {value!r}")
+        return value
+    if expected is bool:
+        if not isinstance(value, bool):
+            raise ConfigError(f"{path}: expected true/false, got {value!r}")
+        return value
+    return value
+
+def build_config(cls, data, path=''):
+    """
+    Builds a typed config dataclass from a plain dict, rejecting unknown keys and wrong types.
+
+    Parameters:
+    - cls (type): The dataclass to build.
+    - data (dict): Parsed YAML data.
+    - path (str): Dotted location used in error messages.
+
+    Returns:
+    - An instance of cls.
+
+    Raises:
+    - ConfigError: If a key is unknown, missing or has the wrong type.
+    """
+    if not isinstance(data, dict):
+        raise ConfigError(f"{path or cls.__name__}: expected a mapping, got {type(data).__name__}")
+
+    hints = typing.get_type_hints(cls)
+    known = {f.name for f in dataclasses.fields(cls)}
+    unknown = set(data) - known
+    if unknown:
+        raise ConfigError(f"{path or cls.__name__}: unknown keys {sorted(unknown)}")
+
+    kwargs = {}
+    for f in dataclasses.fields(cls):
+        key_path = f"{path}.{f.name}" if path else f.name
+        if f.name in data:
+            kwargs[f.name] = _check_value(data[f.name], hints[f.name], key_path)
+        elif f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING:
+            raise ConfigError(f"{key_path}: required key is missing")
+    return cls(**kwargs)
+
 class ConfigLoader:
-    def __init__(self):
-        self.config_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'config')
+    """
+    Loads base_config.yaml and config/workflows/<name>.yaml.
+
+    Parsed files are cached by modification time, so calling the loader on every
+    iteration of a long-running loop only costs a stat() per file. Editing a file
+    on disk is picked up on the next call (hot reload). If an edited file fails to
+    parse or validate, the last good config is kept and the error is logged.
+    """
+
+    def __init__(self, config_dir=None):
+        self.config_dir = config_dir or PATHS['config']
         self.base_config = None
+        self._file_cache = {}  # path -> (mtime, parsed yaml)
+        self._run_configs = {}  # workflow name -> (mtimes, RunConfig)
+
+    def _read_yaml(self, path):
+        """Parse a YAML file, reusing the cached result while its mtime is unchanged."""
+        mtime = os.path.getmtime(path)
+        cached = self._file_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'r') as f:
+            data = yaml.safe_load(f) or {}
+        self._file_cache[path] = (mtime, data)
+        logger.info(f"config_loader: Parsed {path}")
+        return data
+
+    def _base_path(self):
+        return os.path.join(self.config_dir, 'base_config.yaml')
+
+    def _workflow_path(self, workflow_name):
+        return os.path.join(self.config_dir, 'workflows', f'{workflow_name}.yaml')
 
     def load_base_config(self):
         """Load the base configuration file"""
-        base_config_path = os.path.join(self.config_dir, 'base_config.yaml')
         try:
-            with open(base_config_path, 'r') as f:
-                self.base_config = yaml.safe_load(f)
+            self.base_config = self._read_yaml(self._base_path())
         except Exception as e:
             logger.error(f"Error loading base config: {e}")
             raise
+        return self.base_config
 
     def load_workflow_config(self, workflow_name):
-        """Load a specific workflow configuration"""
-        if self.base_config is None:
-            self.load_base_config()
+        """Load a specific workflow configuration, deep-merged over the base config"""
+        self.load_base_config()
 
-        workflow_path = os.path.join(self.config_dir, 'workflows', f'{workflow_name}.yaml')
         try:
-            with open(workflow_path, 'r') as f:
-                workflow_config = yaml.safe_load(f)
-                
-            # Merge with base config
-            config = {
-                **self.base_config['common'],
-                **workflow_config['settings']
-            }
-            
+            workflow_config = self._read_yaml(self._workflow_path(workflow_name))
+
+            config = deep_merge(self.base_config.get('common', {}), workflow_config.get('settings', {}))
             config['workflow_file'] = workflow_config['workflow_file']
             config['name'] = workflow_config['name']
-            
+
             return config
         except Exception as e:
             logger.error(f"Error loading workflow config {workflow_name}: {e}")
-            raise 
\ No newline at end of file
+            raise
+
+    def get_run_config(self, workflow_name):
+        """
+        Returns the validated RunConfig for a workflow.
+
+        The compiled object is cached and only rebuilt when one of the YAML files changed.
+        A broken edit does not stop a running campaign: the previous config is returned.
+
+        Raises:
+        - ConfigError: If the config is invalid and there is no previous good version.
+        """
+        paths = (self._base_path(), self._workflow_path(workflow_name))
+        cached = self._run_configs.get(workflow_name)
+        try:
+            mtimes = tuple(os.path.getmtime(p) for p in paths)
+        except OSError as e:
+            # editors that save by rename leave the file missing for a moment
+            if cached:
+                logger.warning(f"config_loader.get_run_config: Keeping previous config for {workflow_name}, cannot stat: {e}")
+                return cached[1]
+            raise ConfigError(f"Invalid config {workflow_name}: {e}") from e
+        if cached and cached[0] == mtimes:
+            return cached[1]
+
+        try:
+            run_config = build_config(RunConfig, self.load_workflow_config(workflow_name))
+        except (ConfigError, yaml.YAMLError, KeyError, OSError) as e:
+            if cached:
+                logger.error(f"config_loader.get_run_config: Keeping previous config for {workflow_name}, reload failed: {e}")
+                return cached[1]
+            raise ConfigError(f"Invalid config {workflow_name}: {e}") from e
+
+        if cached:
+            logger.info(f"config_loader.get_run_config: Reloaded config for {workflow_name}")
+        self._run_configs[workflow_name] = (mtimes, run_config)
+        return run_config
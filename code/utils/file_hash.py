@@ -0,0 +1,11 @@
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """Return the sha256 hex digest of a file, read in chunks so large files never sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,76 @@
+"""
+Cheap, vectorized image quality metrics on NumPy arrays.
+
+All functions take an RGB uint8 array of shape (h, w, 3) or a grayscale array of
+shape (h, w) and work at whatever resolution they are given, so callers should
+pass small images (previews, or outputs loaded with PIL draft/reduce).
+"""
+
+import numpy as np
+
+def to_gray(image):
+    """Luma (ITU-R 601) as float32 in 0..255."""
+    image = np.asarray(image)
+    if image.ndim == 2:
+        return image.astype(np.float32)
+    rgb = image[..., :3].astype(np.float32)
+    return rgb[..., 0] * 0.299 + rgb[..., 1] * 0.587 + rgb[..., 2] * 0.114
+
+def laplacian_variance(image):
+    """Variance of the 4-neighbour Laplacian: low for blurry or flat images."""
+    gray = to_gray(image)
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    laplacian = (gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+                 - 4 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+def contrast(image):
+    """Standard deviation of the luma: near 0 for blank frames."""
+    return float(to_gray(image).std())
+
+def entropy(image):
+    """Shannon entropy of the luma histogram in bits (0..8): low for blank or posterized images."""
+    histogram = np.bincount(np.clip(to_gray(image), 0, 255).astype(np.uint8).ravel(), minlength=256)
+    p = histogram[histogram > 0] / histogram.sum()
+    return float(-(p * np.log2(p)).sum())
+
+def clipping_ratio(image, low=2, high=253):
+    """Fraction of pixels that are crushed to black or blown out to white."""
+    gray = to_gray(image)
+    return float(((gray <= low) | (gray >= high)).mean())
+
+def saturation(image):
+    """Mean HSV saturation (0..1): low for washed-out or grey images."""
+    image = np.asarray(image)
+    if image.ndim == 2:
+        return 0.0
+    rgb = image[..., :3].astype(np.float32)
+    high = rgb.max(axis=-1)
+    low = rgb.min(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.where(high > 0, (high - low) / high, 0.0)
+    return float(s.mean())
+
+def not_blank(image):
+    """Combined blank-frame score: contrast scaled down when the histogram is nearly flat."""
+    return contrast(image) * min(entropy(image) / 4.0, 1.0)
+
+# Name -> function(image) -> float, higher is better. Used by early_abort and quality_gate.
+SCORERS = {
+    'sharpness': laplacian_variance,
+    'contrast': contrast,
+    'entropy': entropy,
+    'saturation': saturation,
+    'not_blank': not_blank,
+}
+
+def compute_metrics(image):
+    """All metrics for one image, as used by the quality gate."""
+    return {
+        'laplacian_variance': laplacian_variance(image),
+        'entropy': entropy(image),
+        'clipping_ratio': clipping_ratio(image),
+        'saturation': saturation(image),
+        'contrast': contrast(image),
+    }
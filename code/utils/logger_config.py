@@ -1,50 +1,60 @@
 import logging
 import os
 from datetime import datetime
-from config import get_path
+
+LOGS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'logs')
+
+_configured = False
+
+class LazyFileHandler(logging.FileHandler):
+    """FileHandler that creates the logs directory and the file only when the first record is written."""
+
+    def __init__(self, filename):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+def configure_logging(level=logging.INFO, log_file=True):
+    """
+    Sets up console and file logging for the process. Only the first call has an effect.
+
+    Parameters:
+    - level (int): Level of the project's log records.
+    - log_file (bool): Also write to logs/comfyui_<timestamp>.log. The file is created on the
+      first log record, so commands that log nothing leave no file behind.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    root = logging.getLogger()
+    root.setLevel(level)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+    root.addHandler(console_handler)
+
+    if log_file:
+        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_handler = LazyFileHandler(os.path.join(LOGS_DIR, f'comfyui_{current_time}.log'))
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        root.addHandler(file_handler)
 
 def setup_logger(name):
     """
-    Creates a logger instance with consistent configuration.
-    
+    Returns the logger of a module.
+
+    Importing a module installs no handlers: entry points (cli.main and each module's
+    __main__ block) call configure_logging(), and a program that imports these modules
+    keeps its own logging setup.
+
     Parameters:
     - name (str): The name of the logger (usually __name__ from the calling module)
-    
+
     Returns:
-    - logging.Logger: Configured logger instance
+    - logging.Logger: Logger instance
     """
-    # Create logs directory if it doesn't exist
-    logs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'logs')
-    os.makedirs(logs_dir, exist_ok=True)
-
-    # Create logger with module name
-    logger = logging.getLogger(name)
-    
-    # Only add handlers if they haven't been added yet
-    if not logger.handlers:
-        logger.setLevel(logging.INFO)
-        
-        # Create formatters
-        file_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        console_formatter = logging.Formatter(
-            '%(levelname)s - %(message)s'
-        )
-        
-        # File handler with timestamp in filename
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_handler = logging.FileHandler(
-            os.path.join(logs_dir, f'comfyui_{current_time}.log')
-        )
-        file_handler.setFormatter(file_formatter)
-        
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(console_formatter)
-        
-        # Add handlers to logger
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
-    
-    return logger 
\ No newline at end of file
+    return logging.getLogger(name)
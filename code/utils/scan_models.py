@@ -0,0 +1,244 @@
+"""
+This script fills res/models.csv from the model files themselves.
+
+Only the JSON header of each .safetensors file is read (8-byte little-endian
+length prefix followed by the header), never the tensors, so scanning a large
+model store takes seconds. From the header we infer the type, base architecture,
+LoRA rank and trigger words, and upsert rows into the catalog.
+"""
+
+import os
+import csv
+import json
+import struct
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
+# Add the parent directory to the Python path so we can import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import get_path
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+MAX_HEADER_SIZE = 100 * 1024 * 1024
+DEFAULT_CATEGORY = 'uncategorized'
+MAX_TRIGGER_TAGS = 3
+
+TYPE_BY_FOLDER = {
+    'checkpoints': 'Checkpoint',
+    'loras': 'Lora',
+    'embeddings': 'Embedding'
+}
+
+# Substrings of ss_base_model_version / modelspec.architecture, checked in order
+BASE_BY_METADATA = [
+    ('flux', 'Flux.1 D'),
+    ('sdxl', 'SDXL 1.0'),
+    ('stable-diffusion-xl', 'SDXL 1.0'),
+    ('sd_v2', 'SD 2.1'),
+    ('stable-diffusion-v2', 'SD 2.1'),
+    ('sd_v1', 'SD 1.5'),
+    ('stable-diffusion-v1', 'SD 1.5'),
+]
+
+def read_safetensors_header(path):
+    """
+    Reads the JSON header of a .safetensors file without touching the tensor data.
+
+    Returns:
+    - tuple: (tensors, metadata) where tensors maps tensor name to {'dtype', 'shape', ...}
+             and metadata is the optional __metadata__ string dict.
+
+    Raises:
+    - ValueError: If the file is not a valid safetensors file.
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError(f"{path}: file too short for a safetensors header")
+        (header_size,) = struct.unpack('<Q', prefix)
+        if header_size <= 0 or header_size > MAX_HEADER_SIZE:
+            raise ValueError(f"{path}: implausible header size {header_size}")
+        header = json.loads(f.read(header_size))
+
+    metadata = header.pop('__metadata__', None) or {}
+    return header, metadata
+
+def infer_base(tensors, metadata):
+    """Infers the base architecture, using training metadata first and tensor names as fallback."""
+    for key in ('ss_base_model_version', 'modelspec.architecture'):
+        value = metadata.get(key, '').lower()
+        for needle, base in BASE_BY_METADATA:
+            if needle in value:
+                return base
+
+    names = tensors.keys()
+    if any('double_blocks' in name or 'single_transformer_blocks' in name for name in names):
+        return 'Flux.1 D'
+    # SD 1.5 UNets have a single transformer block per attention layer, SDXL has several
+    if any(name.startswith(('conditioner.embedders.1', 'lora_te2_')) or name in ('clip_g', 'clip_l')
+           or 'transformer_blocks_1' in name for name in names):
+        return 'SDXL 1.0'
+    if any(name.startswith(('cond_stage_model.', 'lora_te_', 'lora_unet_')) for name in names):
+        return 'SD 1.5'
+    # Textual inversion embeddings: SD 1.5 uses 768-wide vectors
+    for name, info in tensors.items():
+        shape = info.get('shape', [])
+        if shape and shape[-1] == 768:
+            return 'SD 1.5'
+    return ''
+
+def infer_type(folder, tensors):
+    if folder in TYPE_BY_FOLDER:
+        return TYPE_BY_FOLDER[folder]
+    if any('lora_down' in name or 'lora_A' in name for name in tensors):
+        return 'Lora'
+    return 'Checkpoint'
+
+def infer_lora_rank(tensors, metadata):
+    """Rank from ss_network_dim, or the first dimension of a lora_down / lora_A weight."""
+    dim = metadata.get('ss_network_dim')
+    if dim and str(dim).isdigit():
+        return int(dim)
+    for name, info in tensors.items():
+        if name.endswith(('lora_down.weight', 'lora_A.weight')) and info.get('shape'):
+            return info['shape'][0]
+    return None
+
+def extract_triggers(metadata, max_tags=MAX_TRIGGER_TAGS):
+    """Trigger words from modelspec.trigger_phrase, or the most frequent training tags."""
+    phrase = metadata.get('modelspec.trigger_phrase', '').strip()
+    if phrase:
+        return [t.strip() for t in phrase.split(',') if t.strip()]
+
+    try:
+        tag_frequency = json.loads(metadata.get('ss_tag_frequency', '{}'))
+    except json.JSONDecodeError:
+        return []
+    counts = {}
+    for dataset_tags in tag_frequency.values():
+        for tag, count in dataset_tags.items():
+            tag = tag.strip()
+            if tag:
+                counts[tag] = counts.get(tag, 0) + count
+    return [tag for tag, _ in sorted(counts.items(), key=lambda item: -item[1])[:max_tags]]
+
+def inspect_model(path, folder=''):
+    """
+    Reads a model file's header and returns the catalog fields it implies.
+
+    Returns:
+    - dict or None: {'Type', 'Base', 'Name', 'Pos_trigger', 'Pos_trigger_select', 'Tags'},
+                    or None if the header cannot be read.
+    """
+    try:
+        tensors, metadata = read_safetensors_header(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"scan_models.inspect_model: Skipping {path}: {e}")
+        return None
+
+    model_type = infer_type(folder, tensors)
+    triggers = extract_triggers(metadata)
+    tags = []
+    if model_type == 'Lora':
+        rank = infer_lora_rank(tensors, metadata)
+        if rank:
+            tags.append(f"rank:{rank}")
+
+    return {
+        'Type': model_type,
+        'Base': infer_base(tensors, metadata),
+        'Name': os.path.basename(path),
+        'Pos_trigger': ','.join(triggers),
+        'Pos_trigger_select': 'all' if triggers else '',
+        'Tags': ','.join(tags)
+    }
+
+def find_safetensors(comfyui_path):
+    """Yields (folder, path) for every .safetensors file under the model folders."""
+    for folder in TYPE_BY_FOLDER:
+        model_dir = os.path.join(comfyui_path, 'models', folder)
+        for root, _, filenames in os.walk(model_dir):
+            for filename in filenames:
+                if filename.lower().endswith('.safetensors'):
+                    yield folder, os.path.join(root, filename)
+
+def upsert_catalog(models, csv_path=None, category=DEFAULT_CATEGORY):
+    """
+    Inserts new models into models.csv and fills blank fields of existing rows.
+    Values that were entered by hand are never overwritten.
+
+    Parameters:
+    - models (list of dict): Output of inspect_model.
+    - csv_path (str, optional): Defaults to res/models.csv.
+    - category (str): Category assigned to newly added LoRAs.
+
+    Returns:
+    - tuple: (number of rows added, number of rows updated)
+    """
+    csv_path = csv_path or get_path('res', 'models.csv')
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        fieldnames = reader.fieldnames
+        rows = list(reader)
+
+    by_key = {(row['Type'], row['Name'].lower()): row for row in rows}
+    added = updated = 0
+    for model in models:
+        row = by_key.get((model['Type'], model['Name'].lower()))
+        if row is None:
+            row = {name: '' for name in fieldnames}
+            row.update(model)
+            if model['Type'] == 'Lora':
+                row['Category'] = category
+            rows.append(row)
+            by_key[(model['Type'], model['Name'].lower())] = row
+            added += 1
+            logger.info(f"scan_models.upsert_catalog: Added {model['Type']} {model['Name']} ({model['Base'] or 'unknown base'})")
+            continue
+
+        changed = False
+        for key, value in model.items():
+            if value and not row.get(key):
+                row[key] = value
+                changed = True
+        if changed:
+            updated += 1
+            logger.info(f"scan_models.upsert_catalog: Filled blank fields for {model['Name']}")
+
+    tmp_path = f"{csv_path}.tmp"
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, csv_path)
+    return added, updated
+
+def scan_models(comfyui_path, csv_path=None, workers=8, category=DEFAULT_CATEGORY):
+    """Reads every safetensors header in parallel and upserts the results into models.csv."""
+    files = list(find_safetensors(comfyui_path))
+    logger.info(f"scan_models: Reading {len(files)} safetensors headers with {workers} workers...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        models = [m for m in executor.map(lambda item: inspect_model(item[1], item[0]), files) if m]
+
+    added, updated = upsert_catalog(models, csv_path=csv_path, category=category)
+    logger.info(f"scan_models: {added} models added, {updated} updated")
+    return added, updated
+
+def main():
+    from utils.verify_models import default_comfyui_path
+
+    parser = argparse.ArgumentParser(description="Populate models.csv from safetensors headers")
+    parser.add_argument('comfyui_path', nargs='?', default=default_comfyui_path(),
+                        help="ComfyUI root (default: $COMFYUI_PATH or ~/ComfyUI)")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--category', default=DEFAULT_CATEGORY, help="Category for newly added LoRAs")
+    args = parser.parse_args()
+    scan_models(os.path.expanduser(args.comfyui_path), workers=args.workers, category=args.category)
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
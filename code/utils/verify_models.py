@@ -1,32 +1,157 @@
-import os
-import csv
-from pathlib import Path
-import sys
-
 """
 This script verifies that all models in the CSV exist in the directories and vice versa.
+
+File state is kept in a persistent index (cache/model_index.json) of
+(path, size, mtime, sha256). On each run only files whose size or mtime changed
+are re-hashed, so a rescan of an unchanged model store is just a directory walk.
+The index is also used to report renamed and duplicate model files.
 """
 
+import os
+import csv
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
 # Add the parent directory to the Python path so we can import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import get_path
-from utils.logger_config import setup_logger
+from utils.file_hash import hash_file
+from utils.logger_config import configure_logging, setup_logger
 
 
 logger = setup_logger(__name__)
 
-def get_model_files(base_path, subfolder):
-    """Get all model files from a specified directory."""
+MODEL_CATEGORIES = ['checkpoints', 'loras', 'embeddings']
+EXTENSIONS = {'.safetensors', '.pt', '.ckpt', '.pth'}
+INDEX_VERSION = 1
+
+def default_comfyui_path():
+    """ComfyUI location from COMFYUI_PATH, falling back to ~/ComfyUI."""
+    return os.environ.get('COMFYUI_PATH', os.path.join(os.path.expanduser('~'), 'ComfyUI'))
+
+def scan_model_files(base_path, subfolder):
+    """
+    Walks a model directory (including subfolders) and stats every model file.
+
+    Returns:
+    - dict: Relative path (posix style, e.g. "loras/style/foo.safetensors") -> (size, mtime_ns)
+    """
     model_dir = os.path.join(base_path, 'models', subfolder)
     if not os.path.exists(model_dir):
         logger.error(f"Directory not found: {model_dir}")
-        return set()
-    
-    extensions = {'.safetensors', '.pt', '.ckpt', '.pth'}
-    # Convert all filenames to lowercase for case-insensitive comparison
-    return {f.name.lower() for f in Path(model_dir).iterdir() 
-            if f.is_file() and f.suffix.lower() in extensions}
+        return {}
+
+    files = {}
+    stack = [model_dir]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=True):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=True) and os.path.splitext(entry.name)[1].lower() in EXTENSIONS:
+                    stat = entry.stat()
+                    rel_path = os.path.relpath(entry.path, os.path.join(base_path, 'models')).replace(os.sep, '/')
+                    files[rel_path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def get_model_files(base_path, subfolder):
+    """Get all model file names (lowercase, for case-insensitive comparison) from a directory."""
+    return {os.path.basename(path).lower() for path in scan_model_files(base_path, subfolder)}
+
+def load_index(index_path):
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION:
+            return index
+        logger.info("Model index has an old format, rebuilding")
+    except FileNotFoundError:
+        pass
+    except json.JSONDecodeError:
+        logger.warning(f"Model index {index_path} is corrupt, rebuilding")
+    return {'version': INDEX_VERSION, 'files': {}}
+
+def save_index(index, index_path):
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+def update_index(comfyui_path, index_path=None, workers=4):
+    """
+    Brings the persistent model index up to date with the model directories.
+
+    Only files that are new or whose size/mtime changed are hashed; hashing runs
+    in a thread pool with chunked reads.
+
+    Parameters:
+    - comfyui_path (str): Root of the ComfyUI install (containing models/).
+    - index_path (str, optional): Where to keep the index. Defaults to cache/model_index.json.
+    - workers (int): Number of files hashed in parallel.
+
+    Returns:
+    - dict: {'files': {rel_path: entry}, 'added': [...], 'removed': [...],
+             'renamed': [(old, new), ...], 'duplicates': [[path, ...], ...]}
+    """
+    index_path = index_path or get_path('cache', 'model_index.json')
+    index = load_index(index_path)
+    if index.get('root') != comfyui_path:
+        index = {'version': INDEX_VERSION, 'files': {}}
+    old_files = index['files']
+
+    current = {}
+    for category in MODEL_CATEGORIES:
+        current.update(scan_model_files(comfyui_path, category))
+
+    # A move keeps size and mtime, so a vanished entry with the same stat can lend its hash
+    vanished_by_stat = {(e['size'], e['mtime_ns']): e for p, e in old_files.items() if p not in current}
+
+    files = {}
+    to_hash = []
+    for rel_path, (size, mtime_ns) in current.items():
+        entry = old_files.get(rel_path) or vanished_by_stat.get((size, mtime_ns))
+        if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+            files[rel_path] = entry
+        else:
+            to_hash.append(rel_path)
+
+    if to_hash:
+        logger.info(f"Hashing {len(to_hash)} new or modified files with {workers} workers...")
+        models_dir = os.path.join(comfyui_path, 'models')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = executor.map(lambda p: hash_file(os.path.join(models_dir, p)), to_hash)
+            for rel_path, sha in zip(to_hash, hashes):
+                size, mtime_ns = current[rel_path]
+                files[rel_path] = {'size': size, 'mtime_ns': mtime_ns, 'sha256': sha}
+
+    removed = sorted(set(old_files) - set(current))
+    added = sorted(set(current) - set(old_files))
+
+    # A removed path whose content shows up under a new path is a rename
+    removed_by_hash = {old_files[p]['sha256']: p for p in removed}
+    renamed = [(removed_by_hash[files[p]['sha256']], p) for p in added if files[p]['sha256'] in removed_by_hash]
+    renamed_old = {old for old, _ in renamed}
+    renamed_new = {new for _, new in renamed}
+
+    by_hash = {}
+    for rel_path, entry in files.items():
+        by_hash.setdefault(entry['sha256'], []).append(rel_path)
+    duplicates = [sorted(paths) for paths in by_hash.values() if len(paths) > 1]
+
+    save_index({'version': INDEX_VERSION, 'root': comfyui_path, 'files': files}, index_path)
+
+    return {
+        'files': files,
+        'added': [p for p in added if p not in renamed_new],
+        'removed': [p for p in removed if p not in renamed_old],
+        'renamed': renamed,
+        'duplicates': duplicates
+    }
 
 def get_csv_models():
     """Get model names from CSV file grouped by type."""
@@ -35,7 +160,7 @@ def get_csv_models():
         'loras': set(),
         'embeddings': set()
     }
-    
+
     try:
         with open(get_path('res', 'models.csv'), 'r', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
@@ -51,48 +176,73 @@ def get_csv_models():
     except FileNotFoundError:
         logger.error("models.csv not found")
         return csv_models
-    
+
     return csv_models
 
-def verify_models(comfyui_path):
+def verify_models(comfyui_path, index_path=None, workers=4):
     """Verify that all models in the CSV exist in the directories and vice versa."""
     logger.info("Starting model verification...")
-    
-    # Get files from directories
-    file_models = {
-        'checkpoints': get_model_files(comfyui_path, 'checkpoints'),
-        'loras': get_model_files(comfyui_path, 'loras'),
-        'embeddings': get_model_files(comfyui_path, 'embeddings')
-    }
-    
+
+    result = update_index(comfyui_path, index_path=index_path, workers=workers)
+
+    # Get files from the index
+    file_models = {category: set() for category in MODEL_CATEGORIES}
+    for rel_path in result['files']:
+        category = rel_path.split('/', 1)[0]
+        file_models[category].add(os.path.basename(rel_path).lower())
+
     # Get models from CSV
     csv_models = get_csv_models()
-    
+
     # Check each category
-    for category in ['checkpoints', 'loras', 'embeddings']:
+    for category in MODEL_CATEGORIES:
         logger.info(f"\nChecking {category}...")
-        
+
         # Files that exist but aren't in CSV
         missing_in_csv = file_models[category] - csv_models[category]
         if missing_in_csv:
             logger.warning(f"\nFiles existing but not in CSV ({len(missing_in_csv)}):")
             for model in sorted(missing_in_csv):
                 logger.warning(f"- {model}")
-        
+
         # CSV entries that don't exist as files
         missing_files = csv_models[category] - file_models[category]
         if missing_files:
             logger.warning(f"\nCSV entries without files ({len(missing_files)}):")
             for model in sorted(missing_files):
                 logger.warning(f"- {model}")
-        
+
         # Matching entries
         matching = file_models[category] & csv_models[category]
         logger.info(f"\nMatching entries: {len(matching)}/{len(csv_models[category])}")
 
+    if result['renamed']:
+        logger.warning(f"\nRenamed since last scan ({len(result['renamed'])}):")
+        for old, new in result['renamed']:
+            logger.warning(f"- {old} -> {new}")
+
+    if result['duplicates']:
+        logger.warning(f"\nDuplicate model files ({len(result['duplicates'])} groups):")
+        for paths in result['duplicates']:
+            logger.warning(f"- {', '.join(paths)}")
+
+    return result
+
 def main():
-    comfyui_path = r"C:\Users\leife\Documents\Projects\ComfyUI_windows_portable_nvidia\ComfyUI_windows_portable\ComfyUI"
-    verify_models(comfyui_path)
+    parser = argparse.ArgumentParser(description="Verify models.csv against the ComfyUI model directories")
+    parser.add_argument('comfyui_path', nargs='?', default=default_comfyui_path(),
+                        help="ComfyUI root (default: $COMFYUI_PATH or ~/ComfyUI)")
+    parser.add_argument('--workers', type=int, default=4, help="Files hashed in parallel")
+    parser.add_argument('--update-catalog', action='store_true',
+                        help="Add missing safetensors models to models.csv from their headers")
+    args = parser.parse_args()
+    comfyui_path = os.path.expanduser(args.comfyui_path)
+    verify_models(comfyui_path, workers=args.workers)
+
+    if args.update_catalog:
+        from utils.scan_models import scan_models
+        scan_models(comfyui_path, workers=args.workers)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    configure_logging()
+    main()
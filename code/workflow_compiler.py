@@ -0,0 +1,220 @@
+"""
+Converts ComfyUI UI-format exports ("nodes" + "links") into API-format graphs,
+the format node_manipulation and queue_workflow work with.
+
+Widget values are mapped to input names using the node definitions from
+/object_info (cached locally by comfy_api.get_object_info). Reroute nodes are
+followed to their source, PrimitiveNode values are inlined, muted nodes are
+dropped and bypassed nodes are passed through. Compiled graphs are cached in
+cache/compiled_workflows/ keyed by the sha256 of the export file.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from comfy_api import get_object_info
+from config import get_path
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+# Node modes in UI exports
+MODE_MUTED = 2
+MODE_BYPASS = 4
+
+# Extra widget values that follow a seed input in exports
+SEED_CONTROL_VALUES = {'fixed', 'increment', 'decrement', 'randomize'}
+WIDGET_TYPES = {'INT', 'FLOAT', 'STRING', 'BOOLEAN', 'COMBO'}
+
+def is_ui_format(data):
+    """UI exports have top-level "nodes" and "links", API graphs are keyed by node id."""
+    return isinstance(data, dict) and 'nodes' in data and 'links' in data
+
+def is_widget_input(spec):
+    """An input is a widget (stored in widgets_values) if it is a combo list or a primitive type."""
+    input_type = spec[0] if isinstance(spec, (list, tuple)) and spec else spec
+    options = spec[1] if isinstance(spec, (list, tuple)) and len(spec) > 1 and isinstance(spec[1], dict) else {}
+    if options.get('forceInput'):
+        return False
+    return isinstance(input_type, list) or input_type in WIDGET_TYPES
+
+def ordered_inputs(definition):
+    """Yields (name, spec) for a node's inputs in definition order: required, then optional."""
+    inputs = definition.get('input', {})
+    input_order = definition.get('input_order', {})
+    for section in ('required', 'optional'):
+        section_inputs = inputs.get(section, {})
+        for name in input_order.get(section, section_inputs.keys()):
+            if name in section_inputs:
+                yield name, section_inputs[name]
+
+def map_widget_values(node, definition):
+    """
+    Maps a UI node's widgets_values onto input names.
+
+    Returns:
+    - dict: Input name -> widget value.
+    """
+    values = node.get('widgets_values')
+    if values is None:
+        return {}
+    if isinstance(values, dict):
+        # Some custom nodes store widgets by name already
+        return {name: value for name, value in values.items() if name in dict(ordered_inputs(definition))}
+
+    mapped = {}
+    index = 0
+    for name, spec in ordered_inputs(definition):
+        if not is_widget_input(spec) or index >= len(values):
+            continue
+        mapped[name] = values[index]
+        index += 1
+
+        options = spec[1] if isinstance(spec, (list, tuple)) and len(spec) > 1 and isinstance(spec[1], dict) else {}
+        next_value = values[index] if index < len(values) else None
+        # Seeds are followed by the "control after generate" widget
+        if (options.get('control_after_generate') or name in ('seed', 'noise_seed')) and next_value in SEED_CONTROL_VALUES:
+            index += 1
+        # LoadImage style nodes are followed by the upload button widget
+        elif options.get('image_upload') and index < len(values):
+            mapped['upload'] = next_value
+            index += 1
+    return mapped
+
+def compile_ui_workflow(ui_workflow, object_info):
+    """
+    Compiles a UI-format export into an API-format graph.
+
+    Parameters:
+    - ui_workflow (dict): The parsed UI export.
+    - object_info (dict): Node definitions from /object_info.
+
+    Returns:
+    - dict: API-format graph {node_id: {"inputs", "class_type", "_meta"}}.
+
+    Raises:
+    - ValueError: If the export uses node types the backend does not know, or subgraphs.
+    """
+    if ui_workflow.get('definitions', {}).get('subgraphs'):
+        raise ValueError("Workflows with subgraphs / group nodes are not supported")
+
+    nodes = {node['id']: node for node in ui_workflow['nodes']}
+    links = {link[0]: link for link in ui_workflow['links'] if link}
+    linked_outputs = {link[1] for link in links.values()}
+
+    def resolve(link_id, seen=()):
+        """Follows a link to a real source. Returns ('link', [id, slot]), ('value', v) or None."""
+        link = links.get(link_id)
+        if link is None or link_id in seen:
+            return None
+        _, origin_id, origin_slot, _, _, link_type = link[:6]
+        origin = nodes.get(origin_id)
+        if origin is None:
+            return None
+        seen = seen + (link_id,)
+
+        if origin['type'] == 'Reroute':
+            inputs = origin.get('inputs') or []
+            return resolve(inputs[0].get('link'), seen) if inputs else None
+        if origin['type'] == 'PrimitiveNode':
+            values = origin.get('widgets_values') or []
+            return ('value', values[0]) if values else None
+        if origin.get('mode') == MODE_MUTED:
+            return None
+        if origin.get('mode') == MODE_BYPASS:
+            # A bypassed node passes through its first input of the same type
+            for node_input in origin.get('inputs') or []:
+                if node_input.get('type') == link_type and node_input.get('link') is not None:
+                    return resolve(node_input['link'], seen)
+            return None
+        return ('link', [str(origin_id), origin_slot])
+
+    api_workflow = {}
+    for node_id in sorted(nodes):
+        node = nodes[node_id]
+        node_type = node['type']
+        if node_type in ('Reroute', 'PrimitiveNode') or node.get('mode') in (MODE_MUTED, MODE_BYPASS):
+            continue
+        definition = object_info.get(node_type)
+        if definition is None:
+            if node_id in linked_outputs:
+                raise ValueError(f"Node {node_id} ({node.get('title', node_type)}) has unknown type '{node_type}'")
+            # Notes, labels and other frontend-only nodes
+            logger.info(f"workflow_compiler: Skipping frontend-only node {node_id} ({node_type})")
+            continue
+
+        inputs = map_widget_values(node, definition)
+        for node_input in node.get('inputs') or []:
+            if node_input.get('link') is None:
+                continue
+            resolved = resolve(node_input['link'])
+            if resolved is None:
+                inputs.pop(node_input['name'], None)
+            else:
+                inputs[node_input['name']] = resolved[1]
+
+        api_workflow[str(node_id)] = {
+            'inputs': inputs,
+            'class_type': node_type,
+            '_meta': {'title': node.get('title') or definition.get('display_name') or node_type}
+        }
+    return api_workflow
+
+def compiled_cache_path(file_hash):
+    return get_path('cache', os.path.join('compiled_workflows', f'{file_hash}.json'))
+
+def load_workflow(filename, server=None, refresh=False):
+    """
+    Loads a workflow from the workflow/ folder (or a path) as an API-format graph.
+
+    UI exports are compiled once and the result cached by file hash, so later
+    loads only read the small compiled graph. Node definitions are only needed
+    on a cache miss.
+
+    Parameters:
+    - filename (str): Name in workflow/ or a path.
+    - server (str, optional): Backend whose /object_info is used for compiling.
+    - refresh (bool): Recompile even if a cached result exists.
+
+    Returns:
+    - dict: API-format graph.
+    """
+    path = filename if os.path.isfile(filename) else get_path('workflow', filename)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw)
+    if not is_ui_format(data):
+        return data
+
+    file_hash = hashlib.sha256(raw).hexdigest()
+    cache_path = compiled_cache_path(file_hash)
+    if not refresh and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    api_workflow = compile_ui_workflow(data, get_object_info(server))
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(api_workflow, f)
+    logger.info(f"workflow_compiler.load_workflow: Compiled {os.path.basename(path)} ({len(api_workflow)} nodes)")
+    return api_workflow
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a UI-format ComfyUI export into an API-format graph")
+    parser.add_argument('workflow', help="File in workflow/ or a path")
+    parser.add_argument('--output', help="Write the API graph to this file in workflow/")
+    parser.add_argument('--refresh', action='store_true', help="Re-fetch /object_info and recompile")
+    args = parser.parse_args()
+
+    if args.refresh:
+        get_object_info(refresh=True)
+    api_workflow = load_workflow(args.workflow, refresh=args.refresh)
+    if args.output:
+        with open(get_path('workflow', args.output), 'w') as outfile:
+            json.dump(api_workflow, outfile, indent=4)
+        logger.info(f"Saved API workflow to {args.output}")
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
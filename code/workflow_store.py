@@ -0,0 +1,227 @@
+"""
+Compact history of executed API workflows.
+
+A run changes a handful of inputs per job (seed, prompts, LoRAs, resolution) in a
+graph of 10-120 KB. The store keeps each template graph once, under the SHA-256
+of its canonical JSON, and each job as a node/input-level diff against its
+template. Records are zlib-compressed, using the template as preset dictionary,
+and appended to segment files. records.idx holds one fixed-size (segment, offset,
+length) entry per record, so any record is read with two seeks. Each record starts
+with its template hash, uncompressed, so the dictionary is known before decoding.
+
+Layout under data/workflows/:
+- templates/<hash>.json: canonical template graphs
+- segment_00000.seg, ...: compressed records, a new segment every segment_size bytes
+- records.idx: 16 bytes per record id
+
+Diffs are checked on write: a record is only stored if it reconstructs to the
+exact graph.
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from config import get_path
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+INDEX_ENTRY = struct.Struct('>IQI')  # segment number, offset, length
+SEGMENT_SIZE = 64 * 1024 * 1024
+ZDICT_SIZE = 32 * 1024  # zlib uses at most the last 32 KB of a preset dictionary
+HASH_LENGTH = 32
+
+def canonical_json(workflow):
+    # Key order is kept: it is part of the graph that has to be reconstructed
+    return json.dumps(workflow, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def diff_workflow(template, workflow):
+    """
+    Node/input-level difference between two API graphs.
+
+    Returns:
+    - dict: 'inputs' {node_id: {input: value}} for changed or added inputs, 'removed_inputs'
+      {node_id: [input, ...]}, 'nodes' {node_id: node} for added nodes or nodes whose
+      class_type or _meta changed, 'removed_nodes' [node_id, ...], and 'order' (node ids)
+      only if the node order differs from the template. Empty parts are left out.
+    """
+    diff = {'inputs': {}, 'removed_inputs': {}, 'nodes': {}, 'removed_nodes': []}
+    for node_id, node in workflow.items():
+        base = template.get(node_id)
+        if base is None or {k: v for k, v in node.items() if k != 'inputs'} != {k: v for k, v in base.items() if k != 'inputs'}:
+            diff['nodes'][node_id] = node
+            continue
+        inputs, base_inputs = node.get('inputs', {}), base.get('inputs', {})
+        changed = {name: value for name, value in inputs.items() if name not in base_inputs or base_inputs[name] != value}
+        if changed:
+            diff['inputs'][node_id] = changed
+        removed = [name for name in base_inputs if name not in inputs]
+        if removed:
+            diff['removed_inputs'][node_id] = removed
+        if list(inputs) != [name for name in base_inputs if name in inputs] + [name for name in inputs if name not in base_inputs]:
+            # input order changed (not just appended): store the node whole
+            diff['inputs'].pop(node_id, None)
+            diff['removed_inputs'].pop(node_id, None)
+            diff['nodes'][node_id] = node
+    diff['removed_nodes'] = [node_id for node_id in template if node_id not in workflow]
+    expected_order = [node_id for node_id in template if node_id in workflow] + [node_id for node_id in workflow if node_id not in template]
+    if list(workflow) != expected_order:
+        diff['order'] = list(workflow)
+    return {key: value for key, value in diff.items() if value}
+
+def apply_diff(template, diff):
+    """Rebuilds a graph from its template and diff_workflow output."""
+    workflow = copy.deepcopy(template)
+    for node_id in diff.get('removed_nodes', []):
+        del workflow[node_id]
+    for node_id, names in diff.get('removed_inputs', {}).items():
+        for name in names:
+            del workflow[node_id]['inputs'][name]
+    for node_id, inputs in diff.get('inputs', {}).items():
+        workflow[node_id]['inputs'].update(copy.deepcopy(inputs))
+    for node_id, node in diff.get('nodes', {}).items():
+        workflow[node_id] = copy.deepcopy(node)
+    if 'order' in diff:
+        workflow = {node_id: workflow[node_id] for node_id in diff['order']}
+    return workflow
+
+class WorkflowStore:
+    """
+    Append-only store of executed workflows.
+
+    Parameters:
+    - root (str, optional): Store folder, default data/workflows.
+    - segment_size (int): Bytes per segment file before a new one is started.
+    """
+
+    def __init__(self, root=None, segment_size=SEGMENT_SIZE):
+        self.root = root or get_path('data', 'workflows')
+        self.segment_size = segment_size
+        self.templates = {}  # hash -> (graph, canonical bytes)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, 'templates'), exist_ok=True)
+        self.index_file = os.path.join(self.root, 'records.idx')
+
+    def __len__(self):
+        if not os.path.exists(self.index_file):
+            return 0
+        return os.path.getsize(self.index_file) // INDEX_ENTRY.size
+
+    def segment_path(self, number):
+        return os.path.join(self.root, f"segment_{number:05d}.seg")
+
+    def template_path(self, template_hash):
+        return os.path.join(self.root, 'templates', f"{template_hash}.json")
+
+    def put_template(self, workflow):
+        """
+        Stores a template graph (once per content) and returns its hash. The graph is
+        snapshotted, so callers may keep modifying it.
+        """
+        data = canonical_json(workflow)
+        template_hash = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        if template_hash not in self.templates:
+            path = self.template_path(template_hash)
+            if not os.path.exists(path):
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(path + '.tmp', path)
+                logger.info(f"workflow_store.put_template: Stored template {template_hash} ({len(data)} bytes)")
+            self.templates[template_hash] = (json.loads(data), data)
+        return template_hash
+
+    def template(self, template_hash):
+        if template_hash not in self.templates:
+            with open(self.template_path(template_hash), 'rb') as f:
+                data = f.read()
+            self.templates[template_hash] = (json.loads(data), data)
+        return self.templates[template_hash]
+
+    def append(self, workflow, template_hash, meta=None):
+        """
+        Stores a workflow as a diff against a template.
+
+        Parameters:
+        - workflow (dict): The API graph as queued.
+        - template_hash (str): Hash from put_template.
+        - meta (dict, optional): Small JSON-serializable context (job_id, prompt_id, ...).
+
+        Returns:
+        - int: The record id, for get().
+        """
+        template, zdict = self.template(template_hash)
+        diff = diff_workflow(template, workflow)
+        if apply_diff(template, diff) != workflow:
+            raise ValueError("workflow_store: Diff does not reconstruct the workflow")
+        record = {'diff': diff, 'meta': meta or {}, 'stored_at': datetime.now().isoformat()}
+        compressor = zlib.compressobj(level=9, zdict=zdict[-ZDICT_SIZE:])
+        payload = template_hash.encode('ascii') + compressor.compress(canonical_json(record)) + compressor.flush()
+
+        with self._lock:
+            record_id = len(self)
+            segment = 0
+            if record_id:
+                with open(self.index_file, 'rb') as f:
+                    f.seek((record_id - 1) * INDEX_ENTRY.size)
+                    segment, offset, length = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+                if offset + length + len(payload) > self.segment_size:
+                    segment += 1
+            segment_file = self.segment_path(segment)
+            offset = os.path.getsize(segment_file) if os.path.exists(segment_file) else 0
+            # Index written last: a record only exists once its index entry does
+            with open(segment_file, 'ab') as f:
+                f.write(payload)
+            with open(self.index_file, 'ab') as f:
+                f.write(INDEX_ENTRY.pack(segment, offset, len(payload)))
+        return record_id
+
+    def get(self, record_id):
+        """
+        Reconstructs a stored workflow.
+
+        Returns:
+        - tuple: (workflow dict, record dict with 'template', 'meta' and 'stored_at')
+        """
+        if not 0 <= record_id < len(self):
+            raise IndexError(f"workflow_store: No record {record_id}")
+        with open(self.index_file, 'rb') as f:
+            f.seek(record_id * INDEX_ENTRY.size)
+            segment, offset, length = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+        with open(self.segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            payload = f.read(length)
+        template_hash = payload[:HASH_LENGTH].decode('ascii')
+        template, zdict = self.template(template_hash)
+        decompressor = zlib.decompressobj(zdict=zdict[-ZDICT_SIZE:])
+        record = json.loads(decompressor.decompress(payload[HASH_LENGTH:]) + decompressor.flush())
+        record['template'] = template_hash
+        return apply_diff(template, record['diff']), record
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the executed-workflow store")
+    parser.add_argument('record', nargs='?', type=int, default=-1, help="Record id (default: the latest)")
+    parser.add_argument('--output', help="Write the graph to this file instead of printing it")
+    args = parser.parse_args()
+
+    store = WorkflowStore()
+    if not len(store):
+        print("The store is empty")
+        return
+    record_id = args.record if args.record >= 0 else len(store) + args.record
+    workflow, record = store.get(record_id)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(workflow, f, indent=4)
+    else:
+        print(json.dumps(workflow, indent=4))
+    print(f"Record {record_id}/{len(store) - 1}: template {record['template']}, {record['meta']}, stored {record['stored_at']}")
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
@@ -0,0 +1,215 @@
+"""
+Checks an API-format graph against the backend's node definitions before it is queued.
+
+ComfyUI only reports a broken graph (a misspelled sampler, a link to the wrong
+output slot, a missing required input) after the POST, and queue_workflow used
+to retry such payloads. validate_workflow() runs the same kind of checks locally
+against the cached /object_info, and reports every problem with the title of the
+node it was found in.
+"""
+
+import argparse
+import time
+from comfy_api import get_object_info
+from graph_optimizer import is_link
+from workflow_compiler import load_workflow
+from utils.logger_config import configure_logging, setup_logger
+
+logger = setup_logger(__name__)
+
+# Combos that list files on the backend (uploads, models) change whenever a file is added, and
+# the backend checks the file itself, so their values are only checked to be names
+FILE_EXTENSIONS = ('.safetensors', '.ckpt', '.pt', '.pth', '.bin', '.gguf', '.sft', '.onnx',
+                   '.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.mp4', '.webm', '.wav', '.mp3', '.flac')
+UPLOAD_FLAGS = ('image_upload', 'video_upload', 'audio_upload')
+
+# Fewest seconds between two re-fetches of one backend's definitions after a failed check
+REFRESH_INTERVAL = 60
+
+def input_definitions(definition):
+    """Returns {input name: (spec, required)} for a node definition, including hidden inputs."""
+    inputs = definition.get('input', {})
+    specs = {}
+    for section in ('required', 'optional', 'hidden'):
+        for name, spec in (inputs.get(section) or {}).items():
+            specs[name] = (spec, section == 'required')
+    return specs
+
+def split_spec(spec):
+    """Splits an input spec into (type, options). Combo inputs have a list of choices as type."""
+    if isinstance(spec, (list, tuple)) and spec:
+        options = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+        return spec[0], options
+    return spec, {}
+
+def types_match(output_type, input_type):
+    """Mirrors ComfyUI's rule: '*' matches anything, otherwise comma-separated type sets must intersect."""
+    if isinstance(input_type, list):
+        # A combo fed by a link, e.g. from a primitive or a string-list node
+        input_type = 'COMBO'
+    if isinstance(output_type, list):
+        output_type = 'COMBO'
+    if output_type == '*' or input_type == '*':
+        return True
+    return bool(set(str(output_type).split(',')) & set(str(input_type).split(',')))
+
+def is_file_combo(choices, options):
+    """True for combos filled from a folder on the backend: upload widgets and model or media file lists."""
+    if any(options.get(flag) for flag in UPLOAD_FLAGS):
+        return True
+    return any(isinstance(choice, str) and choice.lower().endswith(FILE_EXTENSIONS) for choice in choices)
+
+def check_value(name, value, input_type, options):
+    """Checks a literal input value. Returns an error message or None."""
+    choices = input_type if isinstance(input_type, list) else options.get('options') if input_type == 'COMBO' else None
+    if choices is not None and is_file_combo(choices, options):
+        if not isinstance(value, str):
+            return f"{name}: expected a file name, got {value!r}"
+        return None
+    if isinstance(input_type, list):
+        if input_type and value not in input_type:
+            shown = ', '.join(map(str, input_type[:8])) + (', ...' if len(input_type) > 8 else '')
+            return f"{name}: {value!r} is not one of [{shown}]"
+        return None
+    if input_type == 'COMBO' and options.get('options'):
+        if value not in options['options']:
+            return f"{name}: {value!r} is not an allowed value"
+        return None
+    if input_type == 'INT':
+        if isinstance(value, bool) or not isinstance(value, int):
+            return f"{name}: expected an integer, got {value!r}"
+    elif input_type == 'FLOAT':
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"{name}: expected a number, got {value!r}"
+    elif input_type == 'STRING':
+        if not isinstance(value, str):
+            return f"{name}: expected a string, got {value!r}"
+        return None
+    elif input_type == 'BOOLEAN':
+        if not isinstance(value, bool):
+            return f"{name}: expected true/false, got {value!r}"
+        return None
+    else:
+        # Other types (MODEL, IMAGE, ...) can only come from a link
+        return f"{name}: expects a {input_type} link, got the value {value!r}"
+
+    if 'min' in options and value < options['min']:
+        return f"{name}: {value} is below the minimum {options['min']}"
+    if 'max' in options and value > options['max']:
+        return f"{name}: {value} is above the maximum {options['max']}"
+    return None
+
+def validate_workflow(workflow, object_info):
+    """
+    Validates an API-format graph against node definitions.
+
+    Parameters:
+    - workflow (dict): API-format graph.
+    - object_info (dict): Node definitions from /object_info.
+
+    Returns:
+    - list of str: Problems found, each prefixed with the node id and title. Empty if valid.
+    """
+    errors = []
+    for node_id, node in workflow.items():
+        class_type = node.get('class_type')
+        title = node.get('_meta', {}).get('title', class_type)
+        where = f"Node {node_id} ({title})"
+
+        definition = object_info.get(class_type)
+        if definition is None:
+            errors.append(f"{where}: unknown node type '{class_type}'")
+            continue
+
+        specs = input_definitions(definition)
+        inputs = node.get('inputs', {})
+        for name, (spec, required) in specs.items():
+            if required and name not in inputs:
+                errors.append(f"{where}: missing required input '{name}'")
+
+        for name, value in inputs.items():
+            if name not in specs:
+                # LoadImage style nodes carry the upload widget in UI-compiled graphs
+                if name == 'upload':
+                    continue
+                errors.append(f"{where}: unknown input '{name}'")
+                continue
+            input_type, options = split_spec(specs[name][0])
+
+            if is_link(value):
+                source_id, slot = value
+                source = workflow.get(source_id)
+                if source is None:
+                    errors.append(f"{where}: {name} is linked to missing node {source_id}")
+                    continue
+                source_definition = object_info.get(source.get('class_type'))
+                if source_definition is None:
+                    # Reported on the source node itself
+                    continue
+                outputs = source_definition.get('output', [])
+                source_title = source.get('_meta', {}).get('title', source.get('class_type'))
+                if slot < 0 or slot >= len(outputs):
+                    errors.append(f"{where}: {name} is linked to output {slot} of {source_title}, "
+                                  f"which has {len(outputs)} outputs")
+                elif not types_match(outputs[slot], input_type):
+                    errors.append(f"{where}: {name} expects {input_type if not isinstance(input_type, list) else 'COMBO'}, "
+                                  f"but output {slot} of {source_title} is {outputs[slot]}")
+                continue
+
+            error = check_value(name, value, input_type, options)
+            if error:
+                errors.append(f"{where}: {error}")
+    return errors
+
+_last_refresh = {}  # backend -> time.monotonic() of the last re-fetch of its definitions
+
+def check_workflow(workflow, server=None):
+    """
+    Validates a graph against the (cached) node definitions of a backend.
+
+    The cached definitions may predate newly installed nodes or new choices, so a
+    failed check re-fetches them and validates again, at most once every
+    REFRESH_INTERVAL seconds per backend. File lists (uploaded images, models) are
+    not checked against the choices at all, see is_file_combo().
+    A cached copy that does not parse is fetched again. Validation is skipped,
+    with a warning, when the definitions can be neither read nor fetched; the
+    backend will then validate the graph itself.
+
+    Returns:
+    - list of str: Problems found. Empty if valid or not checked.
+    """
+    try:
+        try:
+            object_info = get_object_info(server)
+        except ValueError as e:
+            logger.warning(f"workflow_validator.check_workflow: Cached node definitions are corrupt, fetching them again: {e}")
+            object_info = get_object_info(server, refresh=True)
+    except (OSError, ValueError) as e:
+        logger.warning(f"workflow_validator.check_workflow: No node definitions available, skipping validation: {e}")
+        return []
+    errors = validate_workflow(workflow, object_info)
+    if errors and time.monotonic() - _last_refresh.get(server, float('-inf')) >= REFRESH_INTERVAL:
+        _last_refresh[server] = time.monotonic()
+        try:
+            errors = validate_workflow(workflow, get_object_info(server, refresh=True))
+        except (OSError, ValueError) as e:
+            logger.warning(f"workflow_validator.check_workflow: Could not refresh node definitions: {e}")
+    for error in errors:
+        logger.error(f"workflow_validator: {error}")
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate an API-format workflow against the backend's node definitions")
+    parser.add_argument('workflow', help="File in workflow/ (API or UI export) or a path")
+    parser.add_argument('--refresh', action='store_true', help="Re-fetch /object_info before validating")
+    args = parser.parse_args()
+
+    if args.refresh:
+        get_object_info(refresh=True)
+    workflow = load_workflow(args.workflow)
+    errors = check_workflow(workflow)
+    print(f"{len(errors)} problem(s) found" if errors else "Workflow is valid")
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
@@ -1,13 +1,45 @@
-from setuptools import setup, find_packages
+import glob
+import os
+from setuptools import setup, find_namespace_packages
+from setuptools.command.build_py import build_py
+
+# The modules live directly in code/ and import each other by top-level name (from config import ...)
+MODULES = sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob('code/*.py'))
+
+class EditableOnlyBuildPy(build_py):
+    """
+    Refuses regular installs. config.BASE_DIR is the checkout (workflow/, res/, config/ ...),
+    and top-level modules named config, run or utils must not be copied into site-packages.
+    """
+
+    def run(self):
+        if not getattr(self, 'editable_mode', False):
+            raise SystemExit("comfyui_automation runs from its checkout: install it with 'pip install -e .'")
+        super().run()
 
 setup(
     name="comfyui_automation",
     version="0.1",
-    packages=find_packages(),
+    package_dir={'': 'code'},
+    py_modules=MODULES,
+    packages=find_namespace_packages(where='code', include=['utils']),
     install_requires=[
-        'pytest',
-        'pytest-cov',
-        'pytest-mock',
-        'pyyaml'
+        'pyyaml',
+        'Pillow',
+        'numpy',
+        'websocket-client'
     ],
-) 
\ No newline at end of file
+    extras_require={
+        'dev': [
+            'pytest',
+            'pytest-cov',
+            'pytest-mock',
+        ],
+    },
+    cmdclass={'build_py': EditableOnlyBuildPy},
+    entry_points={
+        'console_scripts': [
+            'comfyui-automation=cli:main',
+        ],
+    },
+)
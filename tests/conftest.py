@@ -0,0 +1,11 @@
+import pytest
+import config
+
+@pytest.fixture
+def tmp_paths(tmp_path, monkeypatch):
+    """Points the data, cache and res directories at tmp_path, so tests never touch the checkout."""
+    for category in ('data', 'cache', 'res'):
+        directory = tmp_path / category
+        directory.mkdir()
+        monkeypatch.setitem(config.PATHS, category, str(directory))
+    return tmp_path
@@ -0,0 +1,127 @@
+import threading
+import pytest
+import campaign
+from campaign import CampaignClient, campaign_status, create_campaign
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / 'campaign.sqlite')
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls campaign's time.time(); heartbeats never fire with the default 300 s leases."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(campaign.time, 'time', lambda: now[0])
+    return now
+
+@pytest.fixture
+def clients(store):
+    opened = []
+
+    def open_client(client_id, **kwargs):
+        client = CampaignClient('test', path=store, client_id=client_id, **kwargs)
+        opened.append(client)
+        return client
+    yield open_client
+    for client in opened:
+        if not client._stop.is_set():
+            client.close()
+
+def specs(count):
+    return [{'plan_index': i} for i in range(count)]
+
+def test_create_is_idempotent(store):
+    assert create_campaign('test', specs(5), chunk_size=2, path=store)
+    assert not create_campaign('test', specs(9), chunk_size=2, path=store)
+    assert campaign_status('test', path=store)['jobs'] == {'pending': 5}
+
+def test_unknown_campaign(store):
+    with pytest.raises(ValueError):
+        CampaignClient('missing', path=store)
+
+def test_single_client_runs_every_job_in_order(store, clients):
+    create_campaign('test', specs(7), chunk_size=3, path=store)
+    client = clients('a')
+    seen = []
+    for job_index, spec in client.jobs():
+        assert spec == {'plan_index': job_index}
+        seen.append(job_index)
+        client.complete(job_index, prompt_id=f"p{job_index}")
+    assert seen == list(range(7))
+    assert campaign_status('test', path=store)['jobs'] == {'done': 7}
+    assert campaign_status('test', path=store)['clients']['a']['jobs_done'] == 7
+
+def test_clients_lease_different_chunks(store, clients, clock):
+    create_campaign('test', specs(6), chunk_size=3, path=store)
+    a, b = clients('a'), clients('b')
+    assert a._claim()[0] == 0
+    assert b._claim()[0] == 3
+    assert a._claim()[0] == 1
+
+def test_idle_client_steals_the_upper_half(store, clients, clock):
+    create_campaign('test', specs(10), chunk_size=10, path=store)
+    a, b = clients('a'), clients('b')
+    assert a._claim()[0] == 0
+    # 9 unclaimed jobs in a's chunk: b splits off the last 4
+    assert b._claim()[0] == 6
+    a.complete(0)
+    for expected in [1, 2, 3, 4, 5]:
+        job_index, _ = a._claim()
+        assert job_index == expected
+        a.complete(job_index)
+    # a's chunk is used up, so it splits b's: 7, 8, 9 unclaimed -> a takes 9
+    assert a._claim()[0] == 9
+
+def test_too_small_chunk_is_not_stolen(store, clients, clock):
+    create_campaign('test', specs(2), chunk_size=2, path=store)
+    a, b = clients('a'), clients('b')
+    assert a._claim()[0] == 0
+    assert b._claim() is None
+
+def test_expired_lease_is_taken_over_and_unfinished_jobs_rerun(store, clients, clock):
+    create_campaign('test', specs(3), chunk_size=3, path=store)
+    a, b = clients('a'), clients('b')
+    assert a._claim()[0] == 0
+    a.complete(0)
+    assert a._claim()[0] == 1  # claimed, never completed
+
+    # a's lease is still live: the chunk cannot be taken, only split, and 1 job is too few
+    assert b._claim() is None
+    clock[0] += a.lease_seconds + 1
+    assert [b._claim()[0] for _ in range(2)] == [1, 2]
+    assert campaign_status('test', path=store)['jobs'] == {'done': 1, 'running': 2}
+
+def test_close_releases_claimed_jobs(store, clients, clock):
+    create_campaign('test', specs(3), chunk_size=3, path=store)
+    a = clients('a')
+    assert a._claim()[0] == 0
+    a.close()
+    assert clients('b')._claim()[0] == 0
+
+def test_failed_jobs_are_not_retried(store, clients):
+    create_campaign('test', specs(2), chunk_size=2, path=store)
+    client = clients('a')
+    for job_index, _ in client.jobs():
+        client.fail(job_index, detail='rejected')
+    assert campaign_status('test', path=store)['jobs'] == {'failed': 2}
+    assert client.remaining() == 0
+
+def test_concurrent_clients_run_each_job_once(store, clients):
+    create_campaign('test', specs(60), chunk_size=4, path=store)
+    workers = [clients(f"c{i}", poll_interval=0.01) for i in range(4)]
+    done = {worker.client_id: [] for worker in workers}
+
+    def work(worker):
+        for job_index, _ in worker.jobs():
+            done[worker.client_id].append(job_index)
+            worker.complete(job_index)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    all_jobs = [job for jobs in done.values() for job in jobs]
+    assert sorted(all_jobs) == list(range(60))
+    assert campaign_status('test', path=store)['jobs'] == {'done': 60}
@@ -0,0 +1,111 @@
+import csv
+import os
+import pytest
+from utils import catalog
+from utils.catalog import TABLES, bitmap_from_ids, compile_table, iter_bits, load_table, Table
+
+MODELS = [
+    {'Type': 'Checkpoint', 'Base': 'SD 1.5', 'Name': 'a.safetensors', 'Category': '', 'Location': '', 'Excluded': ''},
+    {'Type': 'Lora', 'Base': 'SD 1.5', 'Name': 'b.safetensors', 'Category': 'style', 'Location': 'external', 'Excluded': 'y'},
+    {'Type': 'Lora', 'Base': 'SDXL', 'Name': 'c.safetensors', 'Category': 'style', 'Location': '', 'Excluded': 'Y'},
+    {'Type': 'Lora', 'Base': 'SD 1.5', 'Name': 'd.safetensors', 'Category': 'detail', 'Location': '', 'Excluded': 'n'},
+    {'Type': 'Lora', 'Base': 'SD 1.5', 'Name': 'D.safetensors', 'Category': 'style', 'Location': '', 'Excluded': ' y '},
+    {'Type': 'Checkpoint', 'Base': 'SDXL', 'Name': 'a.safetensors', 'Category': '', 'Location': '', 'Excluded': ''},
+]
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def build(rows):
+    strings = []
+    return Table(strings, **compile_table(list(rows[0]), rows, TABLES['models'], strings, {}))
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    catalog._tables.clear()
+    catalog._compiled.update({'stat': None, 'data': None})
+    yield
+    catalog._tables.clear()
+    catalog._compiled.update({'stat': None, 'data': None})
+
+def test_bitmap_round_trip():
+    ids = [0, 3, 8, 9, 64, 65, 200]
+    assert list(iter_bits(bitmap_from_ids(ids))) == ids
+    assert bitmap_from_ids([]) == 0
+
+def test_flag_bitmap_matches_csv_yes_values():
+    table = build(MODELS)
+    expected = [row for row in MODELS if row['Excluded'].strip().lower() == 'y']
+    assert table.rows(table.flag('Excluded')) == expected
+
+def test_filters_match_a_plain_csv_scan():
+    table = build(MODELS)
+    mask = table.select(Type='Lora', Base='SD 1.5') & ~table.flag('Excluded')
+    expected = [row for row in MODELS
+                if row['Type'] == 'Lora' and row['Base'] == 'SD 1.5' and row['Excluded'].strip().lower() != 'y']
+    assert table.rows(mask) == expected
+
+def test_matching_and_unknown_values():
+    table = build(MODELS)
+    assert table.rows(table.matching('Base', lambda base: base.startswith('SD '))) == \
+        [row for row in MODELS if row['Base'].startswith('SD ')]
+    assert table.equals('Base', 'Flux') == 0
+    assert table.flag('NoSuchFlag') == 0
+    assert table.rows(table.select()) == MODELS
+
+def test_key_lookups():
+    table = build(MODELS)
+    assert table.find('Name', 'a.safetensors') == [0, 5]
+    assert table.find_row('Name', 'a.safetensors', Base='SDXL') == MODELS[5]
+    assert table.find_row('Name', 'a.safetensors', Base='Flux') is None
+    assert table.find_casefold('Name', 'D.SAFETENSORS') == [3, 4]
+
+def test_compiled_catalog_matches_the_csv(tmp_paths):
+    res = tmp_paths / 'res'
+    write_csv(res / 'models.csv', MODELS)
+    write_csv(res / 'art_styles.csv', [{'name': 'ink', 'included': 'y'}, {'name': 'oil', 'included': ''}])
+    write_csv(res / 'objects.csv', [{'serial_no': '1', 'type': 'animal'}, {'serial_no': '2', 'type': 'plant'}])
+    catalog.compile_catalog()
+    assert (tmp_paths / 'cache' / 'catalog.pkl').exists()
+
+    for name, spec in TABLES.items():
+        rows = read_csv(res / spec['file'])
+        table = load_table(name)
+        assert table.rows() == rows
+        for column in spec['flags']:
+            assert table.rows(table.flag(column)) == [row for row in rows if row[column].strip().lower() == 'y']
+        for column in spec['categories']:
+            for value in {row[column] for row in rows}:
+                assert table.rows(table.equals(column, value)) == [row for row in rows if row[column] == value]
+
+def test_csv_edit_after_compiling_is_picked_up(tmp_paths):
+    res = tmp_paths / 'res'
+    for name, spec in TABLES.items():
+        write_csv(res / spec['file'], MODELS if name == 'models' else [{'name': 'x', 'included': 'y', 'serial_no': '1', 'type': 't'}])
+    catalog.compile_catalog()
+    assert len(load_table('models').rows()) == len(MODELS)
+
+    edited = MODELS + [{'Type': 'Lora', 'Base': 'SDXL', 'Name': 'e.safetensors', 'Category': 'style', 'Location': '', 'Excluded': ''}]
+    write_csv(res / 'models.csv', edited)
+    stat = os.stat(res / 'models.csv')
+    os.utime(res / 'models.csv', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    table = load_table('models')
+    assert table.rows() == edited
+    assert table.find('Name', 'e.safetensors') == [len(MODELS)]
+
+def test_checked_in_csvs_compile_to_the_same_rows():
+    for spec in TABLES.values():
+        path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'res', spec['file'])
+        if not os.path.exists(path):
+            continue
+        fieldnames, rows = catalog.read_csv_rows(path)
+        strings = []
+        table = Table(strings, **compile_table(fieldnames, rows, spec, strings, {}))
+        assert table.rows() == [{name: row.get(name) or '' for name in fieldnames} for row in rows]
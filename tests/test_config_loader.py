@@ -0,0 +1,92 @@
+import os
+import pytest
+from utils.config_loader import ConfigError, ConfigLoader, RunConfig, build_config, deep_merge
+
+BASE = """
+common:
+  iterations: 10
+  sampler:
+    steps: 20
+    cfg: 7
+"""
+
+WORKFLOW = """
+name: test
+workflow_file: test.json
+settings:
+  width: {width}
+  sampler:
+    steps: 25
+"""
+
+def write(path, text, mtime):
+    path.write_text(text)
+    # mtime resolution differs between filesystems; set it explicitly so every edit is seen
+    os.utime(path, (mtime, mtime))
+
+@pytest.fixture
+def config_dir(tmp_path):
+    (tmp_path / 'workflows').mkdir()
+    write(tmp_path / 'base_config.yaml', BASE, 1000)
+    write(tmp_path / 'workflows' / 'test.yaml', WORKFLOW.format(width=768), 1000)
+    return tmp_path
+
+def test_deep_merge_keeps_nested_base_values():
+    merged = deep_merge({'a': 1, 'sampler': {'steps': 20, 'cfg': 7}}, {'sampler': {'steps': 25}})
+    assert merged == {'a': 1, 'sampler': {'steps': 25, 'cfg': 7}}
+
+def test_run_config_merges_base_and_workflow(config_dir):
+    run_config = ConfigLoader(str(config_dir)).get_run_config('test')
+    assert run_config.name == 'test'
+    assert run_config.iterations == 10
+    assert run_config.width == 768
+    assert run_config.sampler.steps == 25
+    assert run_config.sampler.cfg == 7.0
+    assert isinstance(run_config.sampler.cfg, float)
+
+def test_unchanged_files_return_the_cached_config(config_dir):
+    loader = ConfigLoader(str(config_dir))
+    assert loader.get_run_config('test') is loader.get_run_config('test')
+
+def test_edited_file_is_reloaded(config_dir):
+    loader = ConfigLoader(str(config_dir))
+    assert loader.get_run_config('test').width == 768
+    write(config_dir / 'workflows' / 'test.yaml', WORKFLOW.format(width=1024), 2000)
+    assert loader.get_run_config('test').width == 1024
+
+@pytest.mark.parametrize('broken', [
+    WORKFLOW.format(width='[unclosed'),  # yaml syntax error
+    WORKFLOW.format(width='wide'),  # wrong type
+    WORKFLOW.format(width=0),  # fails __post_init__
+    WORKFLOW.format(width=768) + "  no_such_key: 1\n",  # unknown key
+])
+def test_broken_edit_keeps_last_good_config(config_dir, broken):
+    loader = ConfigLoader(str(config_dir))
+    good = loader.get_run_config('test')
+    write(config_dir / 'workflows' / 'test.yaml', broken, 2000)
+    assert loader.get_run_config('test') is good
+
+    # once fixed, the new version is picked up again
+    write(config_dir / 'workflows' / 'test.yaml', WORKFLOW.format(width=640), 3000)
+    assert loader.get_run_config('test').width == 640
+
+def test_missing_file_keeps_last_good_config(config_dir):
+    loader = ConfigLoader(str(config_dir))
+    good = loader.get_run_config('test')
+    os.remove(config_dir / 'workflows' / 'test.yaml')
+    assert loader.get_run_config('test') is good
+
+def test_invalid_config_without_previous_version_raises(config_dir):
+    write(config_dir / 'workflows' / 'test.yaml', WORKFLOW.format(width='wide'), 2000)
+    with pytest.raises(ConfigError, match='width'):
+        ConfigLoader(str(config_dir)).get_run_config('test')
+
+def test_build_config_rejects_unknown_and_missing_keys():
+    with pytest.raises(ConfigError, match='unknown keys'):
+        build_config(RunConfig, {'name': 'x', 'workflow_file': 'x.json', 'iteratons': 5})
+    with pytest.raises(ConfigError, match='workflow_file'):
+        build_config(RunConfig, {'name': 'x'})
+
+def test_build_config_reports_the_dotted_path():
+    with pytest.raises(ConfigError, match=r'sampler\.steps'):
+        build_config(RunConfig, {'name': 'x', 'workflow_file': 'x.json', 'sampler': {'steps': 'many'}})
@@ -0,0 +1,86 @@
+import random
+import numpy as np
+import pytest
+from PIL import Image
+from dedup_index import DedupIndex, filter_duplicates, hamming, image_hash
+
+def flip(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+@pytest.fixture
+def hashes():
+    rng = random.Random(3)
+    base = [rng.getrandbits(64) for _ in range(50)]
+    # near neighbours of the first few hashes at known distances
+    near = [flip(base[i % 5], i % 13, rng) for i in range(100)]
+    return base + near
+
+# blocks and radii where each table is probed with at most 3 flipped bits
+@pytest.mark.parametrize('blocks, max_distance', [
+    (1, 0), (1, 2), (2, 3), (2, 6), (4, 0), (4, 6), (4, 12), (8, 6), (8, 12), (8, 20),
+])
+def test_query_matches_brute_force(hashes, blocks, max_distance):
+    index = DedupIndex(blocks=blocks)
+    for i, value in enumerate(hashes):
+        index.add(f"img{i}", value)
+
+    rng = random.Random(max_distance)
+    queries = hashes[:10] + [flip(hashes[i], max_distance, rng) for i in range(10)] + [rng.getrandbits(64)]
+    for query in queries:
+        expected = sorted((f"img{i}", hamming(query, value)) for i, value in enumerate(hashes)
+                          if hamming(query, value) <= max_distance)
+        assert sorted(index.query(query, max_distance)) == expected
+
+def test_query_is_sorted_and_nearest_is_closest(hashes):
+    index = DedupIndex()
+    for i, value in enumerate(hashes):
+        index.add(f"img{i}", value)
+    distances = [distance for _, distance in index.query(hashes[0], 12)]
+    assert distances == sorted(distances) and distances[0] == 0
+    assert index.nearest(hashes[0]) == ('img0', 0)
+    assert index.nearest(hashes[0] ^ (2 ** 64 - 1)) is None
+
+def test_saved_index_loads_back(tmp_paths, hashes):
+    index = DedupIndex('test')
+    for i, value in enumerate(hashes[:10]):
+        index.add(f"img{i}", value)
+    index.save()
+    index.save()  # nothing new, nothing appended
+
+    reloaded = DedupIndex('test')
+    assert len(reloaded) == 10
+    assert reloaded.nearest(hashes[3]) == ('img3', 0)
+    # entries of another method are ignored
+    assert len(DedupIndex('test', method='dhash')) == 0
+    assert len((tmp_paths / 'cache' / 'dedup_test.jsonl').read_text().splitlines()) == 10
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        DedupIndex(method='md5')
+    with pytest.raises(ValueError):
+        DedupIndex(blocks=3)
+
+def save_image(path, pixels):
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path)
+
+def test_filter_duplicates_finds_near_copies(tmp_path):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:128, 0:128]
+    first = (x * 2.0 + np.sin(y / 9.0) * 60)
+    other = rng.uniform(0, 255, (128, 128))
+    save_image(tmp_path / 'a.png', first)
+    save_image(tmp_path / 'a_noisy.png', first + rng.normal(0, 2, first.shape))
+    save_image(tmp_path / 'b.png', other)
+    save_image(tmp_path / 'known.png', other)
+
+    index = DedupIndex()
+    index.add('known.png', image_hash(str(tmp_path / 'known.png')))
+    paths = [str(tmp_path / name) for name in ('a.png', 'a_noisy.png', 'b.png')]
+    unique, duplicates = filter_duplicates(paths, index)
+
+    assert [path for path, _ in unique] == [paths[0]]
+    assert [(path, key) for path, key, _ in duplicates] == [(paths[1], 'a.png'), (paths[2], 'known.png')]
+    # new images are reported, not added
+    assert len(index) == 1
@@ -0,0 +1,90 @@
+import copy
+from graph_optimizer import find_outputs, fold_static_switches, optimize_workflow, prune_unreachable
+
+def node(class_type, **inputs):
+    return {'class_type': class_type, 'inputs': inputs, '_meta': {'title': class_type}}
+
+def base_graph():
+    return {
+        '1': node('CheckpointLoaderSimple', ckpt_name='a.safetensors'),
+        '2': node('LoraLoader', model=['1', 0], clip=['1', 1], strength_model=0, strength_clip=0),
+        '3': node('CLIPTextEncode', clip=['2', 1], text='pos'),
+        '4': node('CLIPTextEncode', clip=['2', 1], text='neg'),
+        '5': node('KSampler', model=['2', 0], positive=['3', 0], negative=['4', 0]),
+        '6': node('VAEDecode', samples=['5', 0], vae=['1', 2]),
+        '7': node('SaveImage', images=['6', 0]),
+        # unused upscale branch
+        '8': node('LatentUpscale', samples=['5', 0]),
+        '9': node('VAEDecode', samples=['8', 0], vae=['1', 2]),
+    }
+
+def test_prune_keeps_only_ancestors_of_outputs():
+    graph = base_graph()
+    removed = prune_unreachable(graph, find_outputs(graph))
+    assert sorted(removed) == ['8', '9']
+    assert sorted(graph) == ['1', '2', '3', '4', '5', '6', '7']
+
+def test_object_info_output_flag_finds_custom_outputs():
+    graph = base_graph()
+    graph['7']['class_type'] = 'My Custom Saver'
+    assert find_outputs(graph) == []
+    assert find_outputs(graph, {'My Custom Saver': {'output_node': True}}) == ['7']
+
+def test_no_outputs_leaves_the_graph_unpruned():
+    graph = base_graph()
+    graph['7']['class_type'] = 'My Custom Saver'
+    optimized = optimize_workflow(graph, prune=True, fold_switches=False)
+    assert optimized == graph
+
+def test_fold_zero_strength_lora():
+    graph = base_graph()
+    assert fold_static_switches(graph) == ['2']
+    assert graph['5']['inputs']['model'] == ['1', 0]
+    assert graph['3']['inputs']['clip'] == ['1', 1]
+    prune_unreachable(graph, find_outputs(graph))
+    assert '2' not in graph
+
+def test_active_lora_is_not_folded():
+    graph = base_graph()
+    graph['2']['inputs']['strength_model'] = 0.8
+    assert fold_static_switches(graph) == []
+    assert graph['5']['inputs']['model'] == ['2', 0]
+
+def controlnet_graph(stack_switches, apply_switch='On'):
+    graph = base_graph()
+    graph['10'] = node('LoadImage', image='ref.png')
+    stack = {f'switch_{slot}': state for slot, state in enumerate(stack_switches, 1)}
+    stack.update({f'image_{slot}': ['10', 0] for slot in (1, 2, 3)})
+    graph['11'] = node('CR Multi-ControlNet Stack', **stack)
+    graph['12'] = node('CR Apply Multi-ControlNet', base_positive=['3', 0], base_negative=['4', 0],
+                       controlnet_stack=['11', 0], switch=apply_switch)
+    graph['5']['inputs'].update(positive=['12', 0], negative=['12', 1])
+    return graph
+
+def test_all_off_controlnet_stack_folds_the_apply_node():
+    graph = controlnet_graph(['Off', 'Off', 'Off'])
+    optimized = optimize_workflow(graph, prune=True, fold_switches=True)
+    assert optimized['5']['inputs']['positive'] == ['3', 0]
+    assert optimized['5']['inputs']['negative'] == ['4', 0]
+    assert not {'10', '11', '12'} & set(optimized)
+
+def test_partial_controlnet_stack_keeps_only_active_images():
+    graph = controlnet_graph(['On', 'Off', 'Off'])
+    optimized = optimize_workflow(graph, prune=True, fold_switches=True)
+    assert optimized['5']['inputs']['positive'] == ['12', 0]
+    assert 'image_1' in optimized['11']['inputs']
+    assert 'image_2' not in optimized['11']['inputs'] and 'image_3' not in optimized['11']['inputs']
+
+def test_switched_off_apply_node_is_folded():
+    graph = controlnet_graph(['On', 'On', 'On'], apply_switch='Off')
+    optimized = optimize_workflow(graph, prune=True, fold_switches=True)
+    assert optimized['5']['inputs']['positive'] == ['3', 0]
+    assert '12' not in optimized
+
+def test_optimize_copies_and_strips_meta():
+    graph = base_graph()
+    original = copy.deepcopy(graph)
+    optimized = optimize_workflow(graph, prune=False, fold_switches=False, strip_meta=True)
+    assert graph == original
+    assert all('_meta' not in n for n in optimized.values())
+    assert len(optimized) == len(graph)
@@ -0,0 +1,59 @@
+import itertools
+import pytest
+from planner import CoveringPlanner, plan_jobs
+
+def covered(jobs, names, strength):
+    return {tuple((name, job[name]) for name in subset)
+            for job in jobs for subset in itertools.combinations(names, strength)}
+
+def required(factors, strength, is_valid=lambda assignment: True):
+    names = list(factors)
+    return {tuple(zip(subset, values))
+            for subset in itertools.combinations(names, strength)
+            for values in itertools.product(*(factors[name] for name in subset))
+            if is_valid(dict(zip(subset, values)))}
+
+@pytest.mark.parametrize('strength', [1, 2, 3])
+def test_every_tuple_is_covered(strength):
+    factors = {'a': list(range(4)), 'b': list('xyz'), 'c': list('pq'), 'd': list(range(3))}
+    jobs = list(CoveringPlanner(factors, strength=strength, seed=1).plan())
+    assert required(factors, strength) <= covered(jobs, list(factors), strength)
+    assert all(set(job) == set(factors) for job in jobs)
+
+def test_pairwise_plan_is_much_smaller_than_the_product():
+    factors = {name: list(range(5)) for name in 'abcdef'}
+    jobs = list(CoveringPlanner(factors, strength=2, seed=0).plan())
+    assert required(factors, 2) <= covered(jobs, list(factors), 2)
+    # 5^6 = 15625 exhaustive jobs; pairwise needs at least 25
+    assert 25 <= len(jobs) <= 50
+
+def test_plan_is_reproducible_with_a_seed():
+    factors = {'a': list(range(4)), 'b': list(range(4)), 'c': list(range(4))}
+    assert list(CoveringPlanner(factors, seed=7).plan()) == list(CoveringPlanner(factors, seed=7).plan())
+
+def test_empty_factors_are_ignored():
+    jobs = list(CoveringPlanner({'a': [1, 2], 'b': [], 'c': ['x', 'y']}, strength=2, seed=0).plan())
+    assert sorted((job['a'], job['c']) for job in jobs) == [(1, 'x'), (1, 'y'), (2, 'x'), (2, 'y')]
+
+BASES = {'ck15': 'SD 1.5', 'ckxl': 'SDXL', 'l15a': 'SD 1.5', 'l15b': 'SD 1.5', 'lxl': 'SDXL', 'fixed15': 'SD 1.5'}
+
+def test_plan_jobs_respects_the_lora_base_rule():
+    checkpoints, styles, loras = ['ck15', 'ckxl'], ['ink', 'oil', 'photo'], ['l15a', 'l15b', 'lxl']
+    jobs = list(plan_jobs(checkpoints, styles, loras, BASES, strength=2, seed=0))
+
+    assert [job['plan_index'] for job in jobs] == list(range(len(jobs)))
+    for job in jobs:
+        assert all(BASES[lora] == BASES[job['checkpoint']] for lora in job['loras'])
+
+    pairs = {(job['checkpoint'], job['style']) for job in jobs}
+    assert pairs == set(itertools.product(checkpoints, styles))
+    lora_pairs = {(job['checkpoint'], lora) for job in jobs for lora in job['loras']}
+    assert lora_pairs == {(c, l) for c in checkpoints for l in loras if BASES[c] == BASES[l]}
+    # (LoRA, style) pairs are required too, for every LoRA
+    lora_styles = {(lora, job['style']) for job in jobs for lora in job['loras']}
+    assert lora_styles == set(itertools.product(loras, styles))
+
+def test_fixed_loras_only_join_jobs_of_their_base():
+    jobs = list(plan_jobs(['ck15', 'ckxl'], ['ink'], ['l15a', 'lxl'], BASES, fixed_loras=['fixed15'], seed=0))
+    for job in jobs:
+        assert ('fixed15' in job['loras']) == (job['checkpoint'] == 'ck15')
@@ -0,0 +1,110 @@
+import random
+from collections import Counter
+from pathlib import Path
+import pytest
+from gen_prompt import CONTEXT_FIELDS
+from prompt_template import DEFAULT_NEGATIVE, DEFAULT_POSITIVE, TemplateError, clean_prompt, compile_template
+from utils import catalog
+
+@pytest.fixture
+def wildcards(tmp_path):
+    directory = tmp_path / 'wildcards'
+    (directory / 'hair').mkdir(parents=True)
+    (directory / 'weather.txt').write_text("# comment\n\nfoggy\n3::sunny\n{light|heavy} rain\n", encoding='utf-8')
+    (directory / 'hair' / 'color.txt').write_text("red\nblack\n", encoding='utf-8')
+    (directory / 'scene.txt').write_text("__weather__ over the sea\n", encoding='utf-8')
+    (directory / 'loop_a.txt').write_text("__loop_b__\n", encoding='utf-8')
+    (directory / 'loop_b.txt').write_text("__loop_a__\n", encoding='utf-8')
+    (directory / 'empty.txt').write_text("# nothing\n", encoding='utf-8')
+    return str(directory)
+
+def samples(text, wildcard_dir, count=2000, context=None):
+    return Counter(compile_template(text, wildcard_dir).expand(count, seed=1, context=context))
+
+def test_literal_text(wildcards):
+    assert compile_template("a cat, sitting", wildcards).sample() == "a cat, sitting"
+
+def test_alternatives_are_uniform(wildcards):
+    counts = samples("{a|b|c}", wildcards, 3000)
+    assert set(counts) == {'a', 'b', 'c'}
+    assert all(800 < count < 1200 for count in counts.values())
+
+def test_weighted_alternatives(wildcards):
+    counts = samples("{3::a|1::b|0::c}", wildcards, 4000)
+    assert set(counts) == {'a', 'b'}
+    assert 2700 < counts['a'] < 3300
+
+def test_nested_alternatives(wildcards):
+    assert set(samples("{a {x|y}|b}", wildcards)) == {'a x', 'a y', 'b'}
+
+def test_multiple_picks_are_distinct(wildcards):
+    for prompt in samples("{2$$a|b|c}", wildcards):
+        picked = prompt.split(', ')
+        assert len(picked) == 2 and len(set(picked)) == 2
+    sizes = {len(prompt.split(', ')) for prompt in samples("{1-3$$a|b|c|d}", wildcards)}
+    assert sizes == {1, 2, 3}
+    assert set(samples("{5$$a|b}", wildcards)) == {'a, b', 'b, a'}
+
+def test_escapes(wildcards):
+    assert compile_template(r"\{a\|b\} \$\{x\} \_\_y\_\_", wildcards).sample() == "{a|b} ${x} __y__"
+
+def test_wildcard_files(wildcards):
+    counts = samples("__weather__", wildcards, 5000)
+    assert set(counts) == {'foggy', 'sunny', 'light rain', 'heavy rain'}
+    # sunny has weight 3 of 5
+    assert 2700 < counts['sunny'] < 3300
+    assert set(samples("__hair/color__ hair", wildcards)) == {'red hair', 'black hair'}
+    assert set(samples("__scene__", wildcards)) == {f"{w} over the sea" for w in ('foggy', 'sunny', 'light rain', 'heavy rain')}
+
+def test_catalog_wildcard(tmp_paths, wildcards):
+    (tmp_paths / 'res' / 'objects.csv').write_text(
+        "type,positive_prompt,serial_no\ntarget,a fox,1\nTarget,a hare,2\nother,a car,3\n", encoding='utf-8')
+    catalog._tables.clear()
+    try:
+        assert set(samples("__objects.positive_prompt[type=target]__", wildcards)) == {'a fox', 'a hare'}
+        with pytest.raises(TemplateError, match='no column'):
+            compile_template("__objects.nope__", wildcards)
+    finally:
+        catalog._tables.clear()
+
+def test_references(wildcards):
+    template = compile_template("${style.positive}, ${object.positive}, ${tags}", wildcards)
+    assert template.references == ('style.positive', 'object.positive', 'tags')
+    context = {'style': {'positive': 'ink'}, 'object': {'positive': None}, 'tags': ['a', '', 'b']}
+    assert template.sample(context) == "ink, a, b"
+    with pytest.raises(TemplateError, match='not in the prompt context'):
+        template.sample({'style': {}})
+
+def test_same_seed_same_prompts(wildcards):
+    template = compile_template("{a|b|c} __weather__ {1-2$$x|y|z}", wildcards)
+    assert list(template.expand(50, seed=3)) == list(template.expand(50, seed=3))
+    assert template.sample(rng=random.Random(9)) == template.sample(rng=random.Random(9))
+
+@pytest.mark.parametrize('text, message', [
+    ("{a|b", 'Unclosed'),
+    ("{0::a|0::b}", 'weight 0'),
+    ("{3-1$$a|b}", 'Empty pick range'),
+    ("${style.}", 'Malformed reference'),
+    ("__missing__", 'Unknown wildcard'),
+    ("__loop_a__", 'Wildcard cycle'),
+    ("__empty__", 'no alternatives'),
+])
+def test_syntax_errors(wildcards, text, message):
+    with pytest.raises(TemplateError, match=message):
+        compile_template(text, wildcards)
+
+def test_references_are_checked_against_the_prompt_context(wildcards):
+    for text in (DEFAULT_POSITIVE, DEFAULT_NEGATIVE, "${checkpoint.names} ${object_type}"):
+        compile_template(text, wildcards).check_references(CONTEXT_FIELDS)
+    with pytest.raises(TemplateError, match="'styl' is not in the prompt context"):
+        compile_template("${styl.positive}", wildcards).check_references(CONTEXT_FIELDS)
+    with pytest.raises(TemplateError, match='group of fields'):
+        compile_template("${style}", wildcards).check_references(CONTEXT_FIELDS)
+    # references inside wildcard files count too
+    (Path(wildcards) / 'ref.txt').write_text("${stlye.name}\n", encoding='utf-8')
+    with pytest.raises(TemplateError):
+        compile_template("__ref__", wildcards).check_references(CONTEXT_FIELDS)
+
+def test_clean_prompt():
+    assert clean_prompt("a, , b,, , c, ") == "a, b, c"
+    assert clean_prompt(", a") == "a"
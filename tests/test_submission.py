@@ -0,0 +1,101 @@
+import http.client
+import io
+import json
+import socket
+import urllib.error
+import pytest
+import load_models
+from submission import REJECTED, TRANSIENT, classify_failure, read_error_body
+
+def http_error(code, body=b''):
+    return urllib.error.HTTPError('http://host/prompt', code, 'error', {}, io.BytesIO(body))
+
+@pytest.mark.parametrize('error', [
+    http_error(429), http_error(500), http_error(503),
+    urllib.error.URLError(ConnectionRefusedError()),
+    ConnectionResetError(),
+    socket.timeout('timed out'),
+    TimeoutError(),
+    http.client.RemoteDisconnected('closed'),
+    http.client.BadStatusLine(''),
+    http.client.IncompleteRead(b''),
+])
+def test_transient_failures(error):
+    assert classify_failure(error) == TRANSIENT
+
+@pytest.mark.parametrize('error', [http_error(400), http_error(404), TypeError('not serializable')])
+def test_rejected_failures(error):
+    assert classify_failure(error) == REJECTED
+
+def test_read_error_body():
+    body = {'error': {'message': 'bad'}, 'node_errors': {'2': {}}}
+    assert read_error_body(http_error(400, json.dumps(body).encode())) == body
+    assert read_error_body(http_error(400, b'<html>')) == {'error': '<html>'}
+
+def raising(error):
+    def fail():
+        raise error
+    return fail
+
+class Response:
+    def __init__(self, read):
+        self._read = read
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def read(self):
+        return self._read()
+
+@pytest.fixture
+def post(monkeypatch, tmp_paths):
+    """Replaces urlopen with the given callables, one per attempt; returns the list of calls made."""
+    calls = []
+
+    def install(*attempts):
+        def urlopen(req, timeout=None):
+            result = attempts[len(calls)]
+            calls.append(req)
+            return result()
+        monkeypatch.setattr(load_models.request, 'urlopen', urlopen)
+        monkeypatch.setattr(load_models.time, 'sleep', lambda seconds: None)
+        return calls
+    return install
+
+def quarantined(tmp_paths):
+    path = tmp_paths / 'data' / 'quarantine.jsonl'
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+def test_accepted_job_returns_the_response(post, tmp_paths):
+    calls = post(lambda: Response(lambda: b'{"prompt_id": "abc", "number": 1}'))
+    assert load_models.queue_workflow({}, server='host:1', validate=False) == {'prompt_id': 'abc', 'number': 1}
+    assert len(calls) == 1
+
+@pytest.mark.parametrize('read', [
+    lambda: b'{"prompt_id": "ab',
+    lambda: b'\xff\xfe',
+    raising(http.client.IncompleteRead(b'{"pro')),
+    raising(socket.timeout('timed out')),
+])
+def test_unreadable_200_counts_as_accepted(post, tmp_paths, read):
+    calls = post(lambda: Response(read))
+    assert load_models.queue_workflow({}, server='host:1', validate=False) == {'prompt_id': None}
+    assert len(calls) == 1
+    assert quarantined(tmp_paths) == []
+
+def test_transient_failure_is_retried(post, tmp_paths):
+    calls = post(raising(urllib.error.URLError(ConnectionRefusedError())), lambda: Response(lambda: b'{"prompt_id": "abc"}'))
+    assert load_models.queue_workflow({}, server='host:1', validate=False) == {'prompt_id': 'abc'}
+    assert len(calls) == 2
+
+def test_rejected_job_is_quarantined(post, tmp_paths):
+    calls = post(raising(http_error(400, b'{"error": {"message": "invalid prompt"}, "node_errors": {}}')))
+    assert load_models.queue_workflow({'1': {}}, server='host:1', validate=False, job={'seed': 1}) is False
+    assert len(calls) == 1
+    (record,) = quarantined(tmp_paths)
+    assert record['reason'] == 'http 400'
+    assert record['job'] == {'seed': 1}
+    assert record['prompt'] == {'1': {}}
@@ -0,0 +1,90 @@
+import copy
+import json
+import os
+import pytest
+from workflow_store import WorkflowStore, apply_diff, canonical_json, diff_workflow
+
+def template_graph():
+    return {
+        '1': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': 'a.safetensors'}, '_meta': {'title': 'Load Checkpoint'}},
+        '2': {'class_type': 'CLIPTextEncode', 'inputs': {'text': 'a cat', 'clip': ['1', 1]}, '_meta': {'title': 'Positive'}},
+        '3': {'class_type': 'KSampler', 'inputs': {'seed': 1, 'steps': 20, 'model': ['1', 0], 'positive': ['2', 0]},
+              '_meta': {'title': 'KSampler'}},
+        '4': {'class_type': 'SaveImage', 'inputs': {'images': ['3', 0], 'filename_prefix': 'run'}, '_meta': {'title': 'Save Image'}},
+    }
+
+def edited(edit):
+    workflow = template_graph()
+    edit(workflow)
+    return workflow
+
+def move_to_end(workflow, node_id):
+    workflow[node_id] = workflow.pop(node_id)
+
+EDITS = {
+    'unchanged': lambda w: None,
+    'changed inputs': lambda w: w['3']['inputs'].update(seed=42, steps=30),
+    'added input': lambda w: w['3']['inputs'].update(denoise=0.5),
+    'removed input': lambda w: w['4']['inputs'].pop('filename_prefix'),
+    'reordered inputs': lambda w: w['3'].update(inputs=dict(reversed(list(w['3']['inputs'].items())))),
+    'added node': lambda w: w.update({'5': {'class_type': 'PreviewImage', 'inputs': {'images': ['3', 0]}}}),
+    'removed node': lambda w: w.pop('4'),
+    'changed class': lambda w: w['1'].update(class_type='CheckpointLoader'),
+    'changed meta': lambda w: w['2']['_meta'].update(title='Prompt'),
+    'reordered nodes': lambda w: move_to_end(w, '1'),
+    'unicode': lambda w: w['2']['inputs'].update(text='une île, 猫'),
+}
+
+@pytest.mark.parametrize('edit', EDITS.values(), ids=EDITS.keys())
+def test_diff_round_trip(edit):
+    template, workflow = template_graph(), edited(edit)
+    diff = diff_workflow(template, workflow)
+    rebuilt = apply_diff(template, diff)
+    assert rebuilt == workflow
+    assert list(rebuilt) == list(workflow)
+    assert canonical_json(rebuilt) == canonical_json(workflow)
+    assert template == template_graph()
+
+def test_diff_holds_only_the_changes():
+    diff = diff_workflow(template_graph(), edited(EDITS['changed inputs']))
+    assert diff == {'inputs': {'3': {'seed': 42, 'steps': 30}}}
+    assert diff_workflow(template_graph(), template_graph()) == {}
+
+@pytest.mark.parametrize('edit', EDITS.values(), ids=EDITS.keys())
+def test_store_round_trip(tmp_path, edit):
+    store = WorkflowStore(str(tmp_path))
+    template_hash = store.put_template(template_graph())
+    workflow = edited(edit)
+    record_id = store.append(workflow, template_hash, meta={'prompt_id': 'p1'})
+
+    # a fresh store reads the template back from disk
+    rebuilt, record = WorkflowStore(str(tmp_path)).get(record_id)
+    assert canonical_json(rebuilt) == canonical_json(workflow)
+    assert record['meta'] == {'prompt_id': 'p1'}
+    assert record['template'] == template_hash
+
+def test_templates_are_stored_once_and_snapshotted(tmp_path):
+    store = WorkflowStore(str(tmp_path))
+    template = template_graph()
+    template_hash = store.put_template(template)
+    assert store.put_template(copy.deepcopy(template)) == template_hash
+    assert os.listdir(tmp_path / 'templates') == [f"{template_hash}.json"]
+
+    template['3']['inputs']['seed'] = 99  # callers keep editing their graph
+    record_id = store.append(template, template_hash)
+    assert store.get(record_id)[0]['3']['inputs']['seed'] == 99
+    assert json.loads((tmp_path / 'templates' / f"{template_hash}.json").read_text())['3']['inputs']['seed'] == 1
+
+def test_records_span_segments(tmp_path):
+    store = WorkflowStore(str(tmp_path), segment_size=200)
+    template_hash = store.put_template(template_graph())
+    workflows = [edited(lambda w, seed=seed: w['3']['inputs'].update(seed=seed)) for seed in range(20)]
+    ids = [store.append(workflow, template_hash) for workflow in workflows]
+
+    assert ids == list(range(20))
+    assert len(store) == 20
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.seg')]) > 1
+    for record_id, workflow in zip(ids, workflows):
+        assert store.get(record_id)[0] == workflow
+    with pytest.raises(IndexError):
+        store.get(20)
@@ -0,0 +1,125 @@
+import pytest
+import workflow_validator
+from workflow_validator import check_workflow, validate_workflow
+
+OBJECT_INFO = {
+    'CheckpointLoaderSimple': {
+        'input': {'required': {'ckpt_name': [['a.safetensors', 'b.safetensors']]}},
+        'output': ['MODEL', 'CLIP', 'VAE'],
+    },
+    'KSampler': {
+        'input': {'required': {
+            'model': ['MODEL'],
+            'steps': ['INT', {'min': 1, 'max': 100}],
+            'cfg': ['FLOAT', {'min': 0.0, 'max': 30.0}],
+            'sampler_name': [['euler', 'dpmpp_2m']],
+        }, 'optional': {'note': ['STRING']}},
+        'output': ['LATENT'],
+    },
+    'LoadImage': {
+        'input': {'required': {'image': [['ref.png'], {'image_upload': True}]}},
+        'output': ['IMAGE', 'MASK'],
+    },
+    'PreviewImage': {
+        'input': {'required': {'images': ['IMAGE']}},
+        'output': [],
+        'output_node': True,
+    },
+}
+
+def graph(**sampler_inputs):
+    inputs = {'model': ['1', 0], 'steps': 20, 'cfg': 7.0, 'sampler_name': 'euler'}
+    inputs.update(sampler_inputs)
+    return {
+        '1': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': 'a.safetensors'}},
+        '2': {'class_type': 'KSampler', 'inputs': inputs, '_meta': {'title': 'Sampler'}},
+    }
+
+def test_valid_graph_has_no_errors():
+    assert validate_workflow(graph(), OBJECT_INFO) == []
+
+@pytest.mark.parametrize('inputs, message', [
+    ({'sampler_name': 'eular'}, "'eular' is not one of"),
+    ({'steps': 0}, 'below the minimum 1'),
+    ({'steps': 20.5}, 'expected an integer'),
+    ({'cfg': '7'}, 'expected a number'),
+    ({'note': 3}, 'expected a string'),
+    ({'denoise': 1.0}, "unknown input 'denoise'"),
+])
+def test_literal_value_errors(inputs, message):
+    errors = validate_workflow(graph(**inputs), OBJECT_INFO)
+    assert len(errors) == 1
+    assert errors[0].startswith('Node 2 (Sampler)')
+    assert message in errors[0]
+
+def test_missing_required_input():
+    workflow = graph()
+    del workflow['2']['inputs']['steps']
+    assert validate_workflow(workflow, OBJECT_INFO) == ["Node 2 (Sampler): missing required input 'steps'"]
+
+def test_unknown_node_type():
+    workflow = graph()
+    workflow['3'] = {'class_type': 'NoSuchNode', 'inputs': {}}
+    assert validate_workflow(workflow, OBJECT_INFO) == ["Node 3 (NoSuchNode): unknown node type 'NoSuchNode'"]
+
+@pytest.mark.parametrize('link, message', [
+    (['9', 0], 'linked to missing node 9'),
+    (['1', 3], 'linked to output 3 of CheckpointLoaderSimple, which has 3 outputs'),
+    (['1', 1], 'model expects MODEL, but output 1 of CheckpointLoaderSimple is CLIP'),
+])
+def test_link_errors(link, message):
+    errors = validate_workflow(graph(model=link), OBJECT_INFO)
+    assert len(errors) == 1 and message in errors[0]
+
+def test_file_combos_accept_names_missing_from_the_cached_list():
+    workflow = {
+        '1': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': 'new_model.safetensors'}},
+        '2': {'class_type': 'LoadImage', 'inputs': {'image': 'uploaded_later.png', 'upload': 'image'}},
+        '3': {'class_type': 'PreviewImage', 'inputs': {'images': ['2', 0]}},
+    }
+    assert validate_workflow(workflow, OBJECT_INFO) == []
+    workflow['2']['inputs']['image'] = 5
+    assert len(validate_workflow(workflow, OBJECT_INFO)) == 1
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Fake get_object_info: 'cached' until a refresh, then 'fresh'. Records the refresh calls."""
+    state = {'cached': OBJECT_INFO, 'fresh': OBJECT_INFO, 'refreshes': 0, 'now': 1000.0}
+
+    def get_object_info(server=None, refresh=False):
+        if refresh:
+            state['refreshes'] += 1
+            state['cached'] = state['fresh']
+        return state['cached']
+
+    monkeypatch.setattr(workflow_validator, 'get_object_info', get_object_info)
+    monkeypatch.setattr(workflow_validator.time, 'monotonic', lambda: state['now'])
+    monkeypatch.setattr(workflow_validator, '_last_refresh', {})
+    return state
+
+def test_failed_check_refetches_definitions(backend):
+    sampler = dict(OBJECT_INFO['KSampler'], input={'required': dict(OBJECT_INFO['KSampler']['input']['required'],
+                                                                    sampler_name=[['euler', 'dpmpp_2m', 'new_sampler']])})
+    backend['fresh'] = dict(OBJECT_INFO, KSampler=sampler)
+    assert check_workflow(graph(sampler_name='new_sampler'), 'host:1') == []
+    assert backend['refreshes'] == 1
+
+def test_refetch_is_rate_limited(backend):
+    bad = graph(sampler_name='eular')
+    assert check_workflow(bad, 'host:1')
+    assert check_workflow(bad, 'host:1')
+    assert backend['refreshes'] == 1
+
+    backend['now'] += workflow_validator.REFRESH_INTERVAL
+    assert check_workflow(bad, 'host:1')
+    assert backend['refreshes'] == 2
+
+def test_valid_graph_does_not_refetch(backend):
+    assert check_workflow(graph(), 'host:1') == []
+    assert backend['refreshes'] == 0
+
+def test_unavailable_definitions_skip_validation(monkeypatch):
+    def get_object_info(server=None, refresh=False):
+        raise OSError('connection refused')
+    monkeypatch.setattr(workflow_validator, 'get_object_info', get_object_info)
+    assert check_workflow(graph(sampler_name='eular'), 'host:1') == []